@@ -0,0 +1,88 @@
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from rdflib import OWL, RDF, RDFS, XSD, Namespace
+
+
+# the prefixes an endpoint such as DBpedia declares for every query
+PREFIXES = {
+    'dbo': Namespace("http://dbpedia.org/ontology/"),
+    'dbr': Namespace("http://dbpedia.org/resource/"),
+    'wd': Namespace("http://www.wikidata.org/entity/"),
+    'wdt': Namespace("http://www.wikidata.org/prop/direct/"),
+    'rdf': RDF,
+    'rdfs': RDFS,
+    'owl': OWL,
+    'xsd': XSD,
+}
+
+
+class SparqlHandler(BaseHTTPRequestHandler):
+    """
+    Answer SPARQL queries sent by GET or POST over an RDFLib graph, with the
+    results in SPARQL JSON.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, status, body, content_type="text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def answer(self, query):
+        if not query:
+            return self.respond(400, b"No query is given")
+
+        # RDFLib graphs are not safe for concurrent queries
+        try:
+            with self.server.lock:
+                body = self.server.graph.query(query, initNs=PREFIXES).serialize(format="json")
+        except Exception as error:
+            return self.respond(400, str(error).encode('utf-8'))
+        self.respond(200, body, "application/sparql-results+json")
+
+    def do_GET(self):
+        self.answer(parse_qs(urlsplit(self.path).query).get('query', [''])[0])
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        if self.headers.get('Content-Type', '').startswith('application/sparql-query'):
+            self.answer(body)
+        else:
+            self.answer(parse_qs(body).get('query', [''])[0])
+
+
+def serve(graph, host="127.0.0.1", port=0):
+    """
+    Serve a graph as a local SPARQL endpoint in a background thread.
+
+    Parameters
+    ----------
+    graph : Graph
+        The graph to be queried
+    host : str, optional
+        A host name of the endpoint (default is 127.0.0.1)
+    port : int, optional
+        A port of the endpoint, any free port if 0 (default is 0)
+
+    Returns
+    -------
+    (ThreadingHTTPServer, str)
+        the server, stopped with shutdown(), and the URL of the endpoint
+    """
+
+    server = ThreadingHTTPServer((host, port), SparqlHandler)
+    server.daemon_threads = True
+    server.graph = graph
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f"http://{host}:{server.server_address[1]}/sparql"
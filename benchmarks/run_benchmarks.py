@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import pandas as pd
+
+from datetime import datetime, timezone
+
+from rdflib import Graph
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sparql_client import configure_cache
+from prepare_data import construct_data_graph, get_data_prop, retrieve_data
+from generate_shapes import (construct_shapes_graph, get_property_by_ontology, get_property_by_statistics,
+                             write_spreadsheet_shapes)
+from validate_completeness import construct_graph, create_report_validation, validate_graph
+from graph_snapshot import snapshot_path
+
+from local_endpoint import serve
+from synthetic_kg import generate_kg, to_graph
+
+
+def time_stage(name, func, repeat=1):
+    """
+    Run a stage and measure its wall and CPU time.
+
+    Parameters
+    ----------
+    name : str
+        A name of the stage
+    func : callable
+        The stage, called without arguments
+    repeat : int, optional
+        A number of runs of the stage, the best one is reported (default is 1)
+
+    Returns
+    -------
+    (object, dict)
+        the result of the last run, and the timings of the stage
+    """
+
+    runs = []
+    cpu_runs = []
+    for _ in range(repeat):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        result = func()
+        runs.append(time.perf_counter() - start)
+        cpu_runs.append(time.process_time() - cpu_start)
+
+    print(f"  {name}: {min(runs):.3f}s")
+    return result, {'stage': name, 'seconds': min(runs), 'cpu_seconds': min(cpu_runs), 'runs': runs}
+
+
+def run_scale(num_of_entities, args):
+    """
+    Run all the stages on a synthetic knowledge graph of a scale.
+
+    The stages querying the endpoint only run up to args.endpoint_limit
+    entities, above it the collected data comes from the generator.
+
+    Parameters
+    ----------
+    num_of_entities : int
+        A number of entities of each class
+    args : Namespace
+        The arguments of the benchmark
+
+    Returns
+    -------
+    list
+        The timings of each stage
+    """
+
+    print(f"Scale of {num_of_entities} entities")
+    kg = generate_kg(num_of_entities, args.num_of_classes, seed=args.seed,
+                     num_of_props=args.num_of_props,
+                     sparsity=args.sparsity,
+                     max_values=args.max_values,
+                     literal_ratio=args.literal_ratio,
+                     lang_ratio=args.lang_ratio,
+                     languages=tuple(args.languages))
+    entity_class = next(iter(kg))
+    data, data_prop = kg[entity_class]
+    prop_list = sorted(f"<{prop}>" for prop in data_prop['p.value'].unique())
+
+    shapes = pd.DataFrame({'prop.value': [prop[1:-1] for prop in prop_list], 'cardinality': 1})
+    shapes_graph = Graph().parse(data=construct_shapes_graph("BenchShape", shapes, 'prop.value', 'cardinality',
+                                                             f"<{entity_class}>"), format='turtle')
+    repeat = args.repeat
+    results = []
+
+    def stage(name, func, num_of_items):
+        result, timing = time_stage(name, func, repeat)
+        timing['items'] = int(num_of_items)
+        timing['items_per_second'] = num_of_items / timing['seconds'] if timing['seconds'] else None
+        results.append(timing)
+        return result
+
+    if num_of_entities <= args.endpoint_limit:
+        server, sparql_endpoint = serve(to_graph(kg))
+        try:
+            with open("query.txt", 'w') as file:
+                file.write(f"SELECT DISTINCT ?entity WHERE {{ ?entity a <{entity_class}> . }}")
+            data = stage('retrieve_data', lambda: retrieve_data("query.txt", sparql_endpoint), num_of_entities)
+            data_prop = stage('get_data_prop', lambda: get_data_prop(data, prop_list, sparql_endpoint,
+                                                                    window_size=args.window_size,
+                                                                    workers=args.workers), len(data_prop))
+            stage('generate_shapes ontology',
+                  lambda: get_property_by_ontology(f"<{entity_class}>", sparql_endpoint), len(prop_list))
+            stage('generate_shapes statistics',
+                  lambda: get_property_by_statistics(f"<{entity_class}>", sparql_endpoint, top_k=None), num_of_entities)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    snapshot = snapshot_path("data_graph.ttl") if args.graph == 'snapshot' else None
+    num_of_triples = stage('construct_data_graph',
+                           lambda: construct_data_graph(data, data_prop, entity_class, "data_graph.ttl", snapshot),
+                           len(data_prop))
+    data_graph = stage('load_data_graph',
+                       lambda: construct_graph("data_graph.ttl", lazy=args.graph == 'snapshot'), num_of_triples)
+    conforms, report_graph, _ = stage('validate_graph', lambda: validate_graph(shapes_graph, data_graph), num_of_triples)
+    stage('create_report_validation',
+          lambda: create_report_validation(data, "entity.value", report_graph, prop_list), num_of_entities)
+
+    spreadsheet = pd.DataFrame({'name': [f"Bench{idx}" for idx in range(num_of_entities)],
+                                'target': data['entity'], 'card': 1})
+    spreadsheet.to_csv("spreadsheet.csv", index=False)
+    stage('generate_shapes spreadsheet',
+          lambda: write_spreadsheet_shapes("spreadsheet.csv", 'name', 'target', prop_list, ['card'],
+                                           destination="shacl-shapes.ttl"), num_of_entities)
+
+    for timing in results:
+        timing['scale'] = num_of_entities
+    return results
+
+
+def describe_environment(args):
+    # the context needed to compare the results of two runs
+    versions = {}
+    for package in ('numpy', 'pandas', 'rdflib', 'pyshacl'):
+        try:
+            versions[package] = __import__(package).__version__
+        except (ImportError, AttributeError):
+            versions[package] = None
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'versions': versions,
+        'config': vars(args),
+    }
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """
+    Compare the timings with the timings of a previous run.
+
+    Parameters
+    ----------
+    results : list
+        The timings of this run
+    baseline : list
+        The timings of the previous run
+    tolerance : float, optional
+        A relative slowdown still accepted (default is 0.2)
+
+    Returns
+    -------
+    list
+        The stages slower than the baseline by more than the tolerance
+    """
+
+    previous = {(timing['scale'], timing['stage']): timing['seconds'] for timing in baseline}
+    regressions = []
+    for timing in results:
+        key = (timing['scale'], timing['stage'])
+        if key not in previous or not previous[key]:
+            continue
+        ratio = timing['seconds'] / previous[key]
+        flag = " REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{timing['scale']:>9} {timing['stage']:<28} {previous[key]:>9.3f}s {timing['seconds']:>9.3f}s {ratio:>6.2f}x{flag}")
+        if flag:
+            regressions.append({**timing, 'baseline_seconds': previous[key], 'ratio': ratio})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(allow_abbrev=False,
+                                        description="Arguments for benchmarking the stages on a synthetic knowledge graph")
+    parser.add_argument("--scales", type=int, default=[1000, 10000], nargs="+",
+                            help="The numbers of entities of each class to be benchmarked, e.g. 1000 10000 100000 1000000 (default is 1000 10000)")
+    parser.add_argument("--endpoint_limit", type=int, default=10000,
+                            help="A maximum number of entities queried from the local endpoint, larger scales only run the offline stages (default is 10000)")
+    parser.add_argument("--num_of_classes", type=int, default=1,
+                            help="A number of classes of the synthetic knowledge graph (default is 1)")
+    parser.add_argument("--num_of_props", type=int, default=5,
+                            help="A number of properties of each class (default is 5)")
+    parser.add_argument("--sparsity", type=float, default=0.2,
+                            help="A probability that an entity has no value of a property (default is 0.2)")
+    parser.add_argument("--max_values", type=int, default=2,
+                            help="A maximum number of values of a property of an entity (default is 2)")
+    parser.add_argument("--literal_ratio", type=float, default=0.7,
+                            help="A ratio of literal values, the rest are IRIs (default is 0.7)")
+    parser.add_argument("--lang_ratio", type=float, default=0.5,
+                            help="A ratio of the literals with a language tag, the rest are integers (default is 0.5)")
+    parser.add_argument("--languages", type=str, default=["en", "de", "id"], nargs="+",
+                            help="The language tags of the literals (default is en de id)")
+    parser.add_argument("--seed", type=int, default=0,
+                            help="A seed of the synthetic knowledge graph (default is 0)")
+    parser.add_argument("--graph", type=str, default="snapshot", choices=["snapshot", "turtle"],
+                            help="Load the data graph from its snapshot or parse its turtle (default is snapshot)")
+    parser.add_argument("--window_size", type=int, default=50,
+                            help="A number of entities used in one query of get_data_prop (default is 50)")
+    parser.add_argument("--workers", type=int, default=1,
+                            help="A number of queries sent to the endpoint at the same time (default is 1)")
+    parser.add_argument("--repeat", type=int, default=1,
+                            help="A number of runs of each stage, the best one is reported (default is 1)")
+    parser.add_argument("--output", type=str, default="benchmark_results.json",
+                            help="A file path of the results in json format (default is benchmark_results.json)")
+    parser.add_argument("--baseline", type=str, default=None,
+                            help="A file path of the results of a previous run to compare with, exits with 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="A relative slowdown from the baseline still accepted (default is 0.2)")
+
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    # every query reaches the endpoint
+    configure_cache(None)
+
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            for num_of_entities in args.scales:
+                results.extend(run_scale(num_of_entities, args))
+        finally:
+            os.chdir(cwd)
+
+    report = {'environment': describe_environment(args), 'results': results}
+    if baseline is not None:
+        print("Comparing with the baseline ...")
+        report['regressions'] = compare_results(results, baseline['results'], args.tolerance)
+
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Successfully wrote the results to {output}")
+
+    if baseline is not None and report['regressions']:
+        sys.exit(1)
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from run_benchmarks import describe_environment
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOCK = os.path.join(ROOT, "sock.py")
+
+# the dependencies a command should only import when it needs them
+HEAVY_MODULES = ('numpy', 'pandas', 'rdflib', 'pyshacl', 'tqdm')
+
+# the commands run many times from cron, as arguments of sock
+CASES = {
+    'sock --help': ['--help'],
+    'sock prepare --help': ['prepare', '--help'],
+    'sock generate --help': ['generate', '--help'],
+    'sock validate --help': ['validate', '--help'],
+    'sock pipeline --help': ['pipeline', '--help'],
+    'sock serve --help': ['serve', '--help'],
+    'sock generate spreadsheet': ['generate', 'spreadsheet', '--file', "spreadsheet.csv",
+                                  '--shape_name_col', 'name', '--shape_target_col', 'target',
+                                  '--prop_uri', 'dbo:birthDate', 'dbo:birthPlace', '--card_col', 'card'],
+}
+
+
+def write_spreadsheet(filename, num_of_rows):
+    # a small spreadsheet of shapes, as the one of a cron job
+    with open(filename, 'w') as file:
+        file.write("name,target,card\n")
+        file.writelines(f"Person{idx},http://dbpedia.org/resource/Person{idx},1\n" for idx in range(num_of_rows))
+
+
+def imported_modules(args, cwd):
+    """
+    Find the heavy dependencies a command imports.
+
+    Parameters
+    ----------
+    args : list
+        The arguments of sock
+    cwd : str
+        A working directory of the command
+
+    Returns
+    -------
+    list
+        The heavy dependencies imported by the command
+    """
+
+    result = subprocess.run([sys.executable, "-X", "importtime", SOCK] + args, cwd=cwd,
+                            capture_output=True, text=True)
+    # each line of -X importtime ends with the name of the imported module
+    modules = {line.rsplit('|', 1)[-1].strip().split('.')[0] for line in result.stderr.splitlines()
+               if line.startswith("import time:")}
+    return [module for module in HEAVY_MODULES if module in modules]
+
+
+def time_command(command, cwd, repeat=5):
+    """
+    Measure the wall time of a command in a new interpreter.
+
+    Parameters
+    ----------
+    command : list
+        The command and its arguments
+    cwd : str
+        A working directory of the command
+    repeat : int, optional
+        A number of runs of the command (default is 5)
+
+    Returns
+    -------
+    list
+        The wall time of each run in seconds
+    """
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        runs.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(command)} failed: {result.stderr.strip()}")
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(allow_abbrev=False,
+                                        description="Arguments for benchmarking the startup of the sock commands")
+    parser.add_argument("--repeat", type=int, default=5,
+                            help="A number of runs of each command, the median is reported (default is 5)")
+    parser.add_argument("--num_of_rows", type=int, default=100,
+                            help="A number of rows of the spreadsheet of the spreadsheet command (default is 100)")
+    parser.add_argument("--budget", type=float, default=1.0,
+                            help="A number of seconds a command may take, exits with 1 if a median is above it (default is 1.0)")
+    parser.add_argument("--output", type=str, default="startup_results.json",
+                            help="A file path of the results in json format (default is startup_results.json)")
+
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        write_spreadsheet(os.path.join(work_dir, "spreadsheet.csv"), args.num_of_rows)
+
+        # an interpreter doing nothing, the floor of every command
+        interpreter = statistics.median(time_command([sys.executable, "-c", "pass"], work_dir, args.repeat))
+        print(f"{'python -c pass':<28} {interpreter:>7.3f}s")
+
+        for name, command in CASES.items():
+            runs = time_command([sys.executable, SOCK] + command, work_dir, args.repeat)
+            modules = imported_modules(command, work_dir)
+            median = statistics.median(runs)
+            flag = " OVER BUDGET" if median > args.budget else ""
+            print(f"{name:<28} {median:>7.3f}s  imports {', '.join(modules) or 'none'}{flag}")
+            results.append({'command': name, 'seconds': median, 'runs': runs, 'imports': modules})
+
+    report = {'environment': describe_environment(args), 'interpreter_seconds': interpreter, 'results': results}
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Successfully wrote the results to {output}")
+
+    if any(result['seconds'] > args.budget for result in results):
+        sys.exit(1)
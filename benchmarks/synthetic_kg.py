@@ -0,0 +1,146 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from rdflib import RDF, RDFS, URIRef
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prepare_data import DATA_PROP_COLUMNS, build_data_graph
+
+
+DBO = "http://dbpedia.org/ontology/"
+BENCH = "http://example.org/bench/"
+XSD_INTEGER = "http://www.w3.org/2001/XMLSchema#integer"
+
+
+def class_uri(index):
+    # the classes and the properties are in the dbo namespace, as the statistical
+    # approach of generate_shapes only counts dbo properties
+    return f"{DBO}BenchClass{index}"
+
+
+def prop_uri(index):
+    return f"{DBO}benchProp{index}"
+
+
+def generate_class(index, num_of_entities, num_of_props=5, sparsity=0.2, max_values=2,
+                   literal_ratio=0.7, lang_ratio=0.5, languages=("en", "de", "id"), seed=0):
+    """
+    Generate the entities of a synthetic class and the values of their properties.
+
+    Parameters
+    ----------
+    index : int
+        A number of the class
+    num_of_entities : int
+        A number of entities of the class
+    num_of_props : int, optional
+        A number of properties of the class (default is 5)
+    sparsity : float, optional
+        A probability that an entity has no value of a property (default is 0.2)
+    max_values : int, optional
+        A maximum number of values of a property of an entity (default is 2)
+    literal_ratio : float, optional
+        A ratio of literal values, the rest are IRIs (default is 0.7)
+    lang_ratio : float, optional
+        A ratio of the literals with a language tag, the rest are integers (default is 0.5)
+    languages : tuple, optional
+        The language tags of the literals (default is ("en", "de", "id"))
+    seed : int, optional
+        A seed of the generator (default is 0)
+
+    Returns
+    -------
+    (DataFrame, DataFrame)
+        the entities as retrieved by prepare_data, and the values of their
+        properties as collected by get_data_prop
+    """
+
+    rng = np.random.default_rng([seed, index])
+    entities = pd.Series([f"{BENCH}{index}/{idx}" for idx in range(num_of_entities)], dtype=object)
+    data = pd.DataFrame({'entity.type': 'uri', 'entity.value': entities})
+    data['entity'] = '<' + entities + '>'
+
+    # the number of values of each property of each entity, zero for a missing property
+    counts = rng.integers(1, max_values + 1, size=(num_of_props, num_of_entities))
+    counts[rng.random((num_of_props, num_of_entities)) < sparsity] = 0
+    props = np.repeat(np.arange(num_of_props), counts.sum(axis=1))
+    subjects = np.concatenate([np.repeat(np.arange(num_of_entities), row) for row in counts]) \
+        if num_of_props else np.zeros(0, dtype=int)
+    num_of_rows = len(subjects)
+
+    # a mix of language-tagged literals, integers and IRIs
+    kinds = rng.random(num_of_rows)
+    is_literal = kinds < literal_ratio
+    has_lang = is_literal & (rng.random(num_of_rows) < lang_ratio) & bool(languages)
+    is_integer = is_literal & ~has_lang
+    numbers = rng.integers(0, max(num_of_entities, 1), size=num_of_rows).astype(str)
+    tags = np.asarray(languages or ("",), dtype=object)[rng.integers(0, max(len(languages), 1), size=num_of_rows)]
+
+    values = np.where(has_lang, "value " + numbers.astype(object), numbers.astype(object))
+    values = np.where(is_literal, values, BENCH + "resource/" + numbers.astype(object))
+    data_prop = pd.DataFrame({
+        's.type': 'uri',
+        's.value': entities.to_numpy()[subjects],
+        'p.type': 'uri',
+        'p.value': np.array([prop_uri(prop) for prop in range(num_of_props)], dtype=object)[props],
+        'o.type': np.where(is_integer, 'typed-literal', np.where(is_literal, 'literal', 'uri')).astype(object),
+        'o.value': values,
+        'o.xml:lang': np.where(has_lang, tags, None),
+        'o.datatype': np.where(is_integer, XSD_INTEGER, None),
+    }, columns=DATA_PROP_COLUMNS)
+
+    return data, data_prop
+
+
+def generate_kg(num_of_entities, num_of_classes=1, seed=0, **kwargs):
+    """
+    Generate a synthetic knowledge graph of several classes.
+
+    Parameters
+    ----------
+    num_of_entities : int
+        A number of entities of each class
+    num_of_classes : int, optional
+        A number of classes (default is 1)
+    seed : int, optional
+        A seed of the generator (default is 0)
+    **kwargs
+        Keyword arguments passed to generate_class, such as sparsity and literal_ratio
+
+    Returns
+    -------
+    dict
+        The entities and the values of their properties of each class URI
+    """
+
+    return {class_uri(index): generate_class(index, num_of_entities, seed=seed, **kwargs)
+            for index in range(num_of_classes)}
+
+
+def to_graph(kg):
+    """
+    Build the graph served by the local endpoint, with the domain of each property.
+
+    Parameters
+    ----------
+    kg : dict
+        The entities and the values of their properties of each class URI
+
+    Returns
+    -------
+    Graph
+        The graph of all the classes
+    """
+
+    graph = None
+    for entity_class, (data, data_prop) in kg.items():
+        class_graph = build_data_graph(data, data_prop, entity_class)
+        graph = class_graph if graph is None else graph + class_graph
+        for prop in data_prop['p.value'].unique():
+            graph.add((URIRef(prop), RDFS.domain, URIRef(entity_class)))
+        graph.add((URIRef(entity_class), RDF.type, URIRef("http://www.w3.org/2002/07/owl#Class")))
+
+    return graph
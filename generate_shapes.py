@@ -1,10 +1,20 @@
-import sys
+import re
+import math
+import random
+import hashlib
 import argparse
 
-import pandas as pd
+from statistics import NormalDist
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-from tqdm import tqdm
-from SPARQLWrapper import SPARQLWrapper, JSON
+from lazy_import import lazy_import
+from sparql_client import QueryTimeout, configure_cache, get_client
+from metrics import add_metrics_arguments, stage, start_metrics, timer
+from graph_snapshot import snapshot_graph, snapshot_path
+
+# the heavy dependencies are imported when they are first used
+pd = lazy_import('pandas')
 
 
 prefixes = """
@@ -83,15 +93,8 @@ def construct_property_shape(df, prop_col, card_col):
         A property shape in a type of string
     """
 
-    property_shape = ""
-
-    for _, row in df.iterrows():
-        shape = f"""
-    sh:property [ a sh:PropertyShape;
-        sh:path <{row[prop_col]}>;
-        sh:minCount {row[card_col]} ];
-"""
-        property_shape += shape[1:]
+    property_shape = ''.join("    sh:property [ a sh:PropertyShape;\n        sh:path <" + df[prop_col].astype(str) +
+                             ">;\n        sh:minCount " + df[card_col].astype(str) + " ];\n")
 
     # correct the last symbol
     property_shape = property_shape[:-2] + '.'
@@ -136,7 +139,57 @@ def construct_shapes_graph(node_shape_name, df, prop_col, card_col, target, is_c
     return shapes_graph
 
 
-def query_sparql(query, sparql_endpoint):
+def combine_shapes_graphs(list_shapes_graph):
+    # the shapes graphs of many classes in one file, the prefixes are written once
+    return prefixes[1:] + ''.join(shapes_graph[len(prefixes) - 1:] for shapes_graph in list_shapes_graph)
+
+
+def expand_class_uri(class_uri):
+    # a class is given as <IRI> or as a prefixed name of the shapes graph
+    if class_uri.startswith('<') and class_uri.endswith('>'):
+        return class_uri[1:-1]
+    prefix, _, local_name = class_uri.partition(':')
+    namespaces = dict(re.findall(r'@prefix (\w*): <([^>]*)> \.', prefixes))
+    return namespaces[prefix] + local_name if prefix in namespaces else class_uri
+
+
+def shape_names(class_uris):
+    """
+    Name the shapes of the classes, the names are used in the shapes graph and in the file names.
+
+    A shape is named after the local name of its class, and the classes with
+    the same local name in different namespaces, i.e. dbo:Person and
+    schema:Person, get a short hash of their IRI added to it.
+
+    Parameters
+    ----------
+    class_uris : list
+        A list of the URIs of the classes, as <IRI> or prefixed names
+
+    Returns
+    -------
+    dict
+        The name of the shapes of each class
+    """
+
+    iris = {class_uri: expand_class_uri(class_uri) for class_uri in class_uris}
+    local_names = {class_uri: re.sub(r'\W', '_', re.split(r'[/#:]', iri.rstrip('/#'))[-1])
+                   for class_uri, iri in iris.items()}
+    counts = Counter(local_names.values())
+
+    names = {}
+    for class_uri, local_name in local_names.items():
+        if counts[local_name] > 1 or not local_name:
+            local_name = f"{local_name}_{hashlib.sha1(iris[class_uri].encode('utf-8')).hexdigest()[:8]}"
+        names[class_uri] = local_name
+
+    if len(set(names.values())) != len(names):
+        duplicates = [class_uri for class_uri, name in names.items() if list(names.values()).count(name) > 1]
+        raise ValueError(f"The classes {', '.join(duplicates)} get the same shape name, give each class once")
+    return names
+
+
+def query_sparql(query, sparql_endpoint, timeout=None, use_cache=True):
     """
     Query to certain SPARQL endpoint, such as Wikidata SPARQL.
 
@@ -146,6 +199,11 @@ def query_sparql(query, sparql_endpoint):
         A SPARQL query to be run
     sparql_endpoint : str
         A SPARQL API endpoint 
+    timeout : int, optional
+        A number of seconds to wait for the result, if given a timeout raises
+        QueryTimeout instead of retrying the query (default is None)
+    use_cache : bool, optional
+        A boolean value to use the result cache, if configured (default is True)
 
     Returns
     -------
@@ -153,21 +211,12 @@ def query_sparql(query, sparql_endpoint):
         A table consisting of instances to be validated
     """
 
-    # set up the query
-    sparqlwd = SPARQLWrapper(sparql_endpoint)
-    sparqlwd.setQuery(query)
-    sparqlwd.setReturnFormat(JSON)
+    # get the data through the shared client of the endpoint
+    results = get_client(sparql_endpoint).query(query, timeout, use_cache)
 
-    # get the data and transform the result into pandas dataframe
-    while True:
-        try:
-            results = sparqlwd.query().convert()
-            results_df = pd.json_normalize(results['results']['bindings'])
-            break
-        except:
-            continue
-  
-    # return the result in dataframe
+    # transform the result into pandas dataframe
+    with timer('json_normalize'):
+        results_df = pd.json_normalize(results['results']['bindings'])
     return results_df
 
 
@@ -200,33 +249,297 @@ WHERE {{
     return prop_df
 
 
-def get_property_by_statistics(class_uri, sparql_endpoint):
+def get_property_frequency(class_uri, sparql_endpoint, props=None, timeout=None, entities=None):
     """
-    Get all the desired properties of a class by an statistical approach.
+    Count the entities of a class using each property in one aggregate query.
 
     Parameters
     ----------
-    class_name : str
-        A name of a class 
+    class_uri : str
+        An URI of a class
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    props : list, optional
+        A list of property URIs to be counted, all the dbo properties of the
+        class are counted if None (default is None)
+    timeout : int, optional
+        A number of seconds to wait for the result (default is None)
+    entities : list, optional
+        A list of entity URIs the count is restricted to, all the entities of
+        the class if None (default is None)
 
     Returns
     -------
     DataFrame
-        A table consisting of the desired properties
+        A table consisting of the properties and their number of entities
     """
 
-    # get candidate properties
-    print("Get all the candidate properties...")
+    if props is None:
+        prop_filter = "FILTER(isUri(?prop) && STRSTARTS(STR(?prop), STR(dbo:)))"
+    else:
+        prop_filter = f"VALUES ?prop {{{' '.join(f'<{prop}>' for prop in props)}}}"
+
+    if entities is None:
+        entity_filter = ""
+    else:
+        entity_filter = f"VALUES ?entity {{{' '.join(f'<{entity}>' for entity in entities)}}}"
+
     query = f"""
-SELECT DISTINCT ?prop
+SELECT ?prop (COUNT(DISTINCT ?entity) AS ?numOfEntities)
 WHERE {{
-   ?s a {class_uri} ;
-        ?prop [] .
-    FILTER(isUri(?prop) && STRSTARTS(STR(?prop), STR(dbo:)))
+    {entity_filter}
+    {prop_filter}
+    ?entity a {class_uri} ;
+            ?prop [] .
+}}
+GROUP BY ?prop
+"""
+    freq = query_sparql(query, sparql_endpoint, timeout)
+    if freq.empty:
+        return pd.DataFrame(columns=['prop.value', 'numOfEntities'])
+
+    freq['numOfEntities'] = freq['numOfEntities.value'].astype(int)
+    return freq[['prop.value', 'numOfEntities']]
+
+
+def sample_entities(class_uri, sparql_endpoint, num_of_entities, size, method, rng, page_size=50):
+    """
+    Draw a sample of entities of a class.
+
+    Parameters
+    ----------
+    class_uri : str
+        An URI of a class
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    num_of_entities : int
+        A number of entities of the class
+    size : int
+        A number of entities to be drawn
+    method : str
+        'random' to let the endpoint shuffle the entities, or 'stratified' to
+        draw one page of entities at a random offset in each of size / page_size
+        equal ranges of the entities
+    rng : Random
+        A random generator for the offsets
+    page_size : int, optional
+        A number of consecutive entities drawn from each range (default is 50)
+
+    Returns
+    -------
+    list
+        A list of entity URIs, possibly with duplicates
+    """
+
+    if method == 'random':
+        query = f"""
+SELECT ?entity
+WHERE {{
+  ?entity a {class_uri} .
+}}
+ORDER BY RAND()
+LIMIT {size}
+"""
+        sample = query_sparql(query, sparql_endpoint, use_cache=False)
+        return sample['entity.value'].tolist() if not sample.empty else []
+
+    entities = []
+    strata = max(1, size // page_size)
+    stratum_size = num_of_entities / strata
+    for idx in range(strata):
+        offset = int(idx * stratum_size + rng.random() * max(0, stratum_size - page_size))
+        query = f"""
+SELECT ?entity
+WHERE {{
+  ?entity a {class_uri} .
 }}
+LIMIT {page_size}
+OFFSET {offset}
 """
-    candidate_prop = query_sparql(query, sparql_endpoint)
+        sample = query_sparql(query, sparql_endpoint)
+        if not sample.empty:
+            entities += sample['entity.value'].tolist()
 
+    return entities
+
+
+def wilson_interval(count, n, num_of_entities, confidence):
+    """
+    Compute the Wilson score interval of a relative frequency estimated from a sample.
+
+    Parameters
+    ----------
+    count : Series
+        A number of sampled entities having each property
+    n : int
+        A number of sampled entities
+    num_of_entities : int
+        A number of entities of the class, used for the finite population correction
+    confidence : float
+        A confidence level of the interval
+
+    Returns
+    -------
+    (Series, Series)
+        lower and upper bounds of the interval
+    """
+
+    fpc = (num_of_entities - n) / (num_of_entities - 1) if num_of_entities > 1 else 0
+    z = NormalDist().inv_cdf((1 + confidence) / 2) * math.sqrt(max(fpc, 0))
+    p = count / n
+    center = (p + z**2 / (2 * n)) / (1 + z**2 / n)
+    margin = z / (1 + z**2 / n) * ((p * (1 - p) / n + z**2 / (4 * n**2)) ** 0.5)
+
+    return (center - margin).clip(lower=0), (center + margin).clip(upper=1)
+
+
+def is_ranking_stable(freq, top_k, min_freq):
+    """
+    Check whether the top properties and the frequency threshold are separated
+    by the confidence intervals, so more samples would not change the result.
+
+    Parameters
+    ----------
+    freq : DataFrame
+        A table of estimated frequencies sorted descending by rel_freq
+    top_k : int
+        A number of top properties, all if None
+    min_freq : float
+        A minimum relative frequency of the properties
+
+    Returns
+    -------
+    bool
+        True if the selection of properties is statistically stable
+    """
+
+    # no property may straddle the threshold
+    if min_freq > 0 and ((freq['ci_low'] < min_freq) & (freq['ci_high'] >= min_freq)).any():
+        return False
+
+    # the k-th property must be separated from the next one
+    if top_k is None or freq.shape[0] <= top_k:
+        return True
+    return freq['ci_low'].iloc[:top_k].min() > freq['ci_high'].iloc[top_k:].max()
+
+
+def estimate_property_frequency(class_uri, sparql_endpoint, num_of_entities, top_k=10, min_freq=0.0,
+                                sample_size=10000, batch_size=500, confidence=0.95, method='stratified',
+                                seed=None):
+    """
+    Estimate the relative frequency of each property from samples of entities.
+
+    Samples are drawn in batches until the selection of properties is stable,
+    the sample reaches sample_size, or the class runs out of new entities.
+
+    Parameters
+    ----------
+    class_uri : str
+        An URI of a class
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    num_of_entities : int
+        A number of entities of the class
+    top_k : int, optional
+        A number of top properties to be separated, all if None (default is 10)
+    min_freq : float, optional
+        A minimum relative frequency of the properties (default is 0.0)
+    sample_size : int, optional
+        A maximum number of sampled entities (default is 10000)
+    batch_size : int, optional
+        A number of entities drawn before checking the stability (default is 500)
+    confidence : float, optional
+        A confidence level of the intervals (default is 0.95)
+    method : str, optional
+        A sampling method, 'stratified' or 'random' (default is 'stratified')
+    seed : int, optional
+        A seed of the random generator (default is None)
+
+    Returns
+    -------
+    DataFrame
+        A table consisting of the properties, their estimated relative frequency
+        and its confidence interval
+    """
+
+    from tqdm import tqdm
+
+    rng = random.Random(seed)
+    sample_size = min(sample_size, num_of_entities)
+    sample = set()
+    counts = Counter()
+    freq = pd.DataFrame(columns=['prop.value', 'rel_freq', 'ci_low', 'ci_high'])
+    num_of_batches = 0
+    misses = 0
+
+    with tqdm(total=sample_size, unit="entity", desc="Sampling the entities of the class: ") as pbar:
+        while len(sample) < sample_size and misses < 3:
+            size = min(batch_size, sample_size - len(sample))
+            batch = list(dict.fromkeys(entity for entity in
+                                       sample_entities(class_uri, sparql_endpoint, num_of_entities, size, method, rng)
+                                       if entity not in sample))[:size]
+
+            # the endpoint may keep returning known entities on small classes
+            if not batch:
+                misses += 1
+                continue
+            sample.update(batch)
+            num_of_batches += 1
+            pbar.update(len(batch))
+
+            for idx in range(0, len(batch), 100):
+                batch_freq = get_property_frequency(class_uri, sparql_endpoint, entities=batch[idx:idx+100])
+                counts.update(dict(zip(batch_freq['prop.value'], batch_freq['numOfEntities'])))
+
+            # estimate the frequencies and their confidence intervals
+            freq = pd.DataFrame({'prop.value': list(counts.keys()), 'count': list(counts.values())})
+            freq['rel_freq'] = freq['count'] / len(sample)
+            freq['ci_low'], freq['ci_high'] = wilson_interval(freq['count'], len(sample), num_of_entities, confidence)
+            freq.sort_values(['rel_freq', 'prop.value'], ascending=[False, True], inplace=True)
+            pbar.set_postfix(props=freq.shape[0])
+
+            if num_of_batches > 1 and is_ranking_stable(freq, top_k, min_freq):
+                print(f"The ranking of the properties is stable after {len(sample)} entities")
+                break
+
+    return freq[['prop.value', 'rel_freq', 'ci_low', 'ci_high']]
+
+
+def get_property_by_statistics(class_uri, sparql_endpoint, top_k=10, min_freq=0.0, chunk_size=50, timeout=60,
+                               approximate=False, **sampling):
+    """
+    Get all the desired properties of a class by an statistical approach.
+
+    The frequencies of all the properties are counted in one aggregate query.
+    When the endpoint times out, the candidate properties are counted in
+    chunks, and a chunk that still times out is counted property by property.
+    In the approximate mode the frequencies are estimated from a sample of
+    entities instead, see estimate_property_frequency.
+
+    Parameters
+    ----------
+    class_uri : str
+        An URI of a class
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    top_k : int, optional
+        A maximum number of properties to be returned, all if None (default is 10)
+    min_freq : float, optional
+        A minimum relative frequency of the returned properties (default is 0.0)
+    chunk_size : int, optional
+        A number of candidate properties counted in one query after a timeout (default is 50)
+    timeout : int, optional
+        A number of seconds to wait for an aggregate query (default is 60)
+    approximate : bool, optional
+        A boolean value to estimate the frequencies from a sample (default is False)
+    **sampling
+        Keyword arguments passed to estimate_property_frequency
+
+    Returns
+    -------
+    DataFrame
+        A table consisting of the desired properties
+    """
 
     # get number of entities of a class
     query = f"""
@@ -235,65 +548,356 @@ WHERE {{
   ?entity a {class_uri} .
 }}
 """
-    num_of_entities = int(query_sparql(query, sparql_endpoint).iloc[0,2])
+    num_of_entities = int(query_sparql(query, sparql_endpoint).at[0, 'numOfEntities.value'])
 
 
+    # estimate the frequency of all the properties from a sample
+    if approximate:
+        print("Estimate the relative frequency of each property...")
+        prop = estimate_property_frequency(class_uri, sparql_endpoint, num_of_entities,
+                                           top_k, min_freq, **sampling)
+        prop['cardinality'] = 1
+        prop = prop[prop['rel_freq'] >= min_freq].reset_index(drop=True)
+        return prop if top_k is None else prop.head(top_k)
+
     # query the frequency of all the properties
     print("Calculate the relative frequency of each property...")
-    list_rel_freq = []
-
-    for idx in tqdm(range(candidate_prop.shape[0]), desc="Calculate the relative frequency of all properties: "):
-        prop = candidate_prop.at[idx, 'prop.value']
+    try:
+        freq = get_property_frequency(class_uri, sparql_endpoint, timeout=timeout)
 
+    except QueryTimeout:
+        # get candidate properties
+        print("The aggregate query timed out, get all the candidate properties...")
         query = f"""
-SELECT (COUNT(DISTINCT ?entity) AS ?numOfEntities)
+SELECT DISTINCT ?prop
 WHERE {{
-  ?entity a {class_uri} ;
-          <{ prop }> [] .
+   ?s a {class_uri} ;
+        ?prop [] .
+    FILTER(isUri(?prop) && STRSTARTS(STR(?prop), STR(dbo:)))
 }}
 """
+        candidate_prop = query_sparql(query, sparql_endpoint)['prop.value'].tolist()
 
-        # count the relative frequency
-        num_of_union = int(query_sparql(query, sparql_endpoint).iloc[0,2])
-        list_rel_freq.append(num_of_union / num_of_entities)    
+        from tqdm import tqdm
 
+        list_freq = [pd.DataFrame(columns=['prop.value', 'numOfEntities'])]
+        for idx in tqdm(range(0, len(candidate_prop), chunk_size), desc="Calculate the relative frequency of all properties: "):
+            chunk = candidate_prop[idx:idx+chunk_size]
+            try:
+                list_freq.append(get_property_frequency(class_uri, sparql_endpoint, chunk, timeout))
+            except QueryTimeout:
+                for prop in chunk:
+                    list_freq.append(get_property_frequency(class_uri, sparql_endpoint, [prop]))
+        freq = pd.concat(list_freq, ignore_index=True)
+
+    return rank_properties(freq, num_of_entities, top_k, min_freq)
+
+
+def rank_properties(freq, num_of_entities, top_k=10, min_freq=0.0):
     # arrange the result
-    prop = candidate_prop.copy()
-    prop['rel_freq'] = list_rel_freq
+    prop = freq[['prop.value']].copy()
+    prop['rel_freq'] = freq['numOfEntities'] / num_of_entities
     prop['cardinality'] = 1
-    prop.sort_values('rel_freq', ascending=False, inplace=True)
+    prop = prop[prop['rel_freq'] >= min_freq]
+    prop.sort_values(['rel_freq', 'prop.value'], ascending=[False, True], inplace=True)
     prop.reset_index(drop=True, inplace=True)
 
-    return prop.head(10)
+    if top_k is None:
+        return prop
+    return prop.head(top_k)
 
 
-def generate_by_spreadsheet(data, shape_name_col, shape_target_col, prop, card_col):
-    shapes_graph = ""
-    for idx in tqdm(range(data.shape[0]), desc="Creating shapes graph: "):
-        shape_name = data.at[idx, shape_name_col]
-        shape_target = data.at[idx, shape_target_col]
-        cardinality = data.at[idx, card_col]
-
-        shapes_graph += \
-f"""
-ex:{shape_name}Shape a sh:NodeShape ;
-    sh:targetNode {shape_target} ;
-    sh:property ex:{shape_name}PropertyShape .
-
-ex:{shape_name}PropertyShape a sh:PropertyShape ;
-    sh:path {prop} ;
-    sh:minCount {cardinality} .
+def class_values(class_uris):
+    # each class along with its name as given, the endpoint returns the full IRI
+    return ' '.join(f'({class_uri} "{class_uri}")' for class_uri in class_uris)
+
+
+def get_property_by_ontology_batch(class_uris, sparql_endpoint):
+    """
+    Get all the desired properties of many classes by an ontological approach in one query.
+
+    Parameters
+    ----------
+    class_uris : list
+        A list of URIs of classes
+    sparql_endpoint : str
+        A SPARQL API endpoint
+
+    Returns
+    -------
+    dict
+        A table consisting of the desired properties of each class
+    """
+
+    query = f"""
+SELECT DISTINCT ?class_uri ?prop
+WHERE {{
+    VALUES (?class ?class_uri) {{{class_values(class_uris)}}}
+    ?prop rdfs:domain ?class .
+}}
+    """
+    prop_df = query_sparql(query, sparql_endpoint).reindex(columns=['class_uri.value', 'prop.type', 'prop.value'])
+    prop_df['cardinality'] = 1
+
+    groups = dict(tuple(prop_df.groupby('class_uri.value')))
+    empty = prop_df.iloc[0:0]
+    return {class_uri: groups.get(class_uri, empty).drop(columns='class_uri.value').reset_index(drop=True)
+            for class_uri in class_uris}
+
+
+def get_class_frequency(class_uris, sparql_endpoint, timeout=None):
+    """
+    Count the entities of many classes, and the entities using each property, in two aggregate queries.
+
+    Parameters
+    ----------
+    class_uris : list
+        A list of URIs of classes
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    timeout : int, optional
+        A number of seconds to wait for each result (default is None)
+
+    Returns
+    -------
+    (dict, dict)
+        the number of entities of each class, and a table of the properties and
+        their number of entities of each class
+    """
+
+    query = f"""
+SELECT ?class_uri (COUNT(DISTINCT ?entity) AS ?numOfEntities)
+WHERE {{
+    VALUES (?class ?class_uri) {{{class_values(class_uris)}}}
+    ?entity a ?class .
+}}
+GROUP BY ?class_uri
 """
+    # an endpoint may return an empty group when no class has entities
+    counts = query_sparql(query, sparql_endpoint, timeout).reindex(columns=['class_uri.value', 'numOfEntities.value'])
+    counts = counts.dropna(subset=['class_uri.value'])
+    num_of_entities = dict.fromkeys(class_uris, 0)
+    num_of_entities.update(zip(counts['class_uri.value'], counts['numOfEntities.value'].astype(int)))
 
-    return prefixes[1:] + shapes_graph
+    query = f"""
+SELECT ?class_uri ?prop (COUNT(DISTINCT ?entity) AS ?numOfEntities)
+WHERE {{
+    VALUES (?class ?class_uri) {{{class_values(class_uris)}}}
+    ?entity a ?class ;
+            ?prop [] .
+    FILTER(isUri(?prop) && STRSTARTS(STR(?prop), STR(dbo:)))
+}}
+GROUP BY ?class_uri ?prop
+"""
+    freq = query_sparql(query, sparql_endpoint, timeout).reindex(columns=['class_uri.value', 'prop.value', 'numOfEntities.value'])
+    freq = freq.dropna(subset=['class_uri.value', 'prop.value'])
+    freq['numOfEntities'] = freq['numOfEntities.value'].astype(int)
 
+    groups = dict(tuple(freq.groupby('class_uri.value')))
+    empty = freq.iloc[0:0]
+    return num_of_entities, {class_uri: groups.get(class_uri, empty)[['prop.value', 'numOfEntities']].reset_index(drop=True)
+                             for class_uri in class_uris}
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    subparsers = parser.add_subparsers(help='commands')
+
+def get_property_by_statistics_batch(class_uris, sparql_endpoint, top_k=10, min_freq=0.0, batch_size=10,
+                                     workers=1, timeout=60, approximate=False, **kwargs):
+    """
+    Get all the desired properties of many classes by an statistical approach.
+
+    The classes are counted together in batches sent concurrently. A batch
+    that times out, and every class in the approximate mode, is handled
+    class by class by get_property_by_statistics.
+
+    Parameters
+    ----------
+    class_uris : list
+        A list of URIs of classes
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    top_k : int, optional
+        A maximum number of properties of each class, all if None (default is 10)
+    min_freq : float, optional
+        A minimum relative frequency of the returned properties (default is 0.0)
+    batch_size : int, optional
+        A number of classes counted in one query (default is 10)
+    workers : int, optional
+        A number of batches sent to the endpoint at the same time (default is 1)
+    timeout : int, optional
+        A number of seconds to wait for an aggregate query (default is 60)
+    approximate : bool, optional
+        A boolean value to estimate the frequencies from a sample (default is False)
+    **kwargs
+        Keyword arguments passed to get_property_by_statistics
+
+    Returns
+    -------
+    dict
+        A table consisting of the desired properties of each class
+    """
+
+    def by_class(class_uri):
+        return get_property_by_statistics(class_uri, sparql_endpoint, top_k, min_freq, timeout=timeout,
+                                          approximate=approximate, **kwargs)
+
+    def by_batch(batch):
+        if approximate:
+            return {class_uri: by_class(class_uri) for class_uri in batch}
+        try:
+            num_of_entities, freq = get_class_frequency(batch, sparql_endpoint, timeout)
+        except QueryTimeout:
+            return {class_uri: by_class(class_uri) for class_uri in batch}
+        return {class_uri: rank_properties(freq[class_uri], num_of_entities[class_uri], top_k, min_freq)
+                for class_uri in batch}
+
+    from tqdm import tqdm
+
+    # the approximate mode samples each class on its own
+    batch_size = 1 if approximate else batch_size
+    batches = [class_uris[idx:idx+batch_size] for idx in range(0, len(class_uris), batch_size)]
+    props = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in tqdm(executor.map(by_batch, batches), total=len(batches), desc="Get the properties of the classes"):
+            props.update(result)
+
+    return props
+
+
+def format_spreadsheet_shapes(data, shape_name_col, shape_target_col, props, card_cols):
+    """
+    Format the node shape and the property shapes of each row of a spreadsheet.
+
+    Parameters
+    ----------
+    data : DataFrame
+        A table of the shapes, one row per target node
+    shape_name_col : str
+        A column for the name of the shapes
+    shape_target_col : str
+        A column for the shapes' target
+    props : list
+        A list of the properties to be checked
+    card_cols : list
+        A list of the columns of the minimum number of values of each property,
+        or a single column for all of them
+
+    Returns
+    -------
+    Series
+        The shapes of each row in a type of string
+    """
+
+    if len(card_cols) == 1:
+        card_cols = card_cols * len(props)
+    names = "ex:" + data[shape_name_col].astype(str)
+    targets = data[shape_target_col].astype(str)
+
+    # a single property keeps the name of the property shape without a number
+    suffixes = ["PropertyShape"] if len(props) == 1 else [f"PropertyShape{k}" for k in range(1, len(props) + 1)]
+
+    node_shapes = "\n" + names + "Shape a sh:NodeShape ;\n    sh:targetNode " + targets
+    property_shapes = pd.Series("", index=data.index, dtype=object)
+    for prop, card_col, suffix in zip(props, card_cols, suffixes):
+        # a row without a cardinality has no property shape for the property
+        has_card = data[card_col].notna()
+        cardinality = data[card_col].astype('Int64').astype(str)
+        node_shapes = node_shapes.where(~has_card, node_shapes + " ;\n    sh:property " + names + suffix)
+        property_shapes = property_shapes.where(~has_card, property_shapes + "\n" + names + suffix +
+                                                " a sh:PropertyShape ;\n    sh:path " + prop +
+                                                " ;\n    sh:minCount " + cardinality + " .\n")
+
+    return node_shapes + " .\n" + property_shapes
+
+
+def generate_by_spreadsheet(data, shape_name_col, shape_target_col, prop, card_col):
+    props = [prop] if isinstance(prop, str) else list(prop)
+    card_cols = [card_col] if isinstance(card_col, str) else list(card_col)
+    return prefixes[1:] + ''.join(format_spreadsheet_shapes(data, shape_name_col, shape_target_col, props, card_cols))
+
+
+def write_spreadsheet_shapes(filename, shape_name_col, shape_target_col, props, card_cols,
+                             destination="shacl-shapes.ttl", chunk_size=100000):
+    """
+    Write the shapes of a spreadsheet chunk by chunk, without holding the
+    spreadsheet or the shapes graph in memory.
+
+    Parameters
+    ----------
+    filename : str
+        A file path for a shapes data file in csv format
+    shape_name_col : str
+        A column for the name of the shapes
+    shape_target_col : str
+        A column for the shapes' target
+    props : list
+        A list of the properties to be checked
+    card_cols : list
+        A list of the columns of the minimum number of values of each property,
+        or a single column for all of them
+    destination : str, optional
+        A file path of the shapes graph (default is "shacl-shapes.ttl")
+    chunk_size : int, optional
+        A number of rows formatted at once (default is 100000)
+
+    Returns
+    -------
+    int
+        A number of written node shapes
+    """
+
+    if len(card_cols) not in (1, len(props)):
+        raise ValueError("Give one cardinality column, or one for each property")
+
+    from tqdm import tqdm
+
+    num_of_shapes = 0
+    with open(destination, "w") as file:
+        file.write(prefixes[1:])
+        chunks = pd.read_csv(filename, chunksize=chunk_size, usecols=list({shape_name_col, shape_target_col, *card_cols}))
+        for chunk in tqdm(chunks, desc="Creating shapes graph", unit="chunk"):
+            file.write(''.join(format_spreadsheet_shapes(chunk, shape_name_col, shape_target_col, props, card_cols)))
+            num_of_shapes += chunk.shape[0]
+
+    return num_of_shapes
+
+
+def write_shapes_graph(shapes_graph, destination="shacl-shapes.ttl", snapshot=False):
+    with open(destination, "w") as file:
+        file.write(shapes_graph)
+
+    if snapshot:
+        snapshot_shapes_graph(destination)
+
+
+def snapshot_shapes_graph(destination="shacl-shapes.ttl"):
+    from rdflib import Graph
+
+    # the snapshot is loaded by the validation without parsing the turtle
+    graph = Graph()
+    graph.parse(destination, format="turtle")
+    snapshot_graph(graph, snapshot_path(destination))
+
+
+def build_parser(prog=None):
+    parser = argparse.ArgumentParser(prog=prog)
+    subparsers = parser.add_subparsers(dest='command', required=True, help='commands')
+
+    # arguments of the commands querying an endpoint
+    cache_parser = argparse.ArgumentParser(add_help=False)
+    cache_parser.add_argument("--cache_dir", "--cache-dir", type=str, default=".sparql-cache",
+                            help="A directory of the cache of query results (default is .sparql-cache)")
+    cache_parser.add_argument("--cache_ttl", type=float, default=24,
+                            help="A number of hours a cached query result stays valid (default is 24)")
+    cache_parser.add_argument("--no_cache", "--no-cache", action="store_true",
+                            help="Always query the endpoint instead of the cache")
+
+    # arguments of the output of all the commands
+    output_parser = argparse.ArgumentParser(add_help=False)
+    output_parser.add_argument("--snapshot", action="store_true",
+                            help="Also write the shapes graph as a binary snapshot in shacl-shapes.snap")
+    add_metrics_arguments(output_parser)
 
     # A spreadsheet command
-    spreadsheet_parser = subparsers.add_parser('spreadsheet', help='Spreadsheet arguments')
+    spreadsheet_parser = subparsers.add_parser('spreadsheet', help='Spreadsheet arguments', parents=[output_parser])
     spreadsheet_parser = spreadsheet_parser.add_argument_group('required arguments')
     spreadsheet_parser.add_argument("--file", type=str, required=True,
                             help="A file path for a shapes data file in csv format")
@@ -301,85 +905,161 @@ if __name__ == "__main__":
                             help="A column for the name of the shapes, i.e. the title of each entity and contains no whitespaces")
     spreadsheet_parser.add_argument("--shape_target_col", type=str, required=True,
                             help="A column for the shapes' target, i.e. URI of each entity and contains no whitespaces")
-    spreadsheet_parser.add_argument("--prop_uri", type=str, required=True,
-                            help="An URI coressponding to the path to be checked")
-    spreadsheet_parser.add_argument("--card_col", type=str, required=True,
-                            help="A column name that contains information regarding the minimum number of paths if considered complete and contains no whitespaces")
+    spreadsheet_parser.add_argument("--prop_uri", type=str, required=True, nargs="+",
+                            help="One or more URIs coressponding to the paths to be checked")
+    spreadsheet_parser.add_argument("--card_col", type=str, required=True, nargs="+",
+                            help="A column name that contains information regarding the minimum number of paths if considered complete and contains no whitespaces, one for all the paths or one for each path")
+
+    # arguments of the commands generating shapes of classes
+    class_parser = argparse.ArgumentParser(add_help=False)
+    class_parser.add_argument("--class_file", type=str, default=None,
+                            help="A file with one URI of a target class on each line, in addition to --class_uri")
+    class_parser.add_argument("--output", type=str, default="per_class", choices=["per_class", "combined"],
+                            help="Write the shapes of many classes in a file for each class or in one file (default is per_class)")
+    class_parser.add_argument("--batch_size", type=int, default=10,
+                            help="A number of classes sent to the endpoint in one query (default is 10)")
+    class_parser.add_argument("--workers", type=int, default=1,
+                            help="A number of queries sent to the endpoint at the same time (default is 1)")
 
     # A ontology command
-    ontology_parser = subparsers.add_parser('ontology', help='Spreadsheet arguments')
+    ontology_parser = subparsers.add_parser('ontology', help='Spreadsheet arguments', parents=[cache_parser, output_parser, class_parser])
     ontology_parser = ontology_parser.add_argument_group('required arguments')
-    ontology_parser.add_argument("--class_uri", type=str, required=True,
-                            help="An URI of a target class for shapes graph")
+    ontology_parser.add_argument("--class_uri", type=str, nargs="+", default=[],
+                            help="One or more URIs of target classes for shapes graph")
     ontology_parser.add_argument("--sparql_endpoint", type=str, required=True,
                             help="A string of SPARQL endpoint URL")
 
     # A statistics command
-    statistics_parser = subparsers.add_parser('statistics', help='Spreadsheet arguments')
-    statistics_parser = statistics_parser.add_argument_group('required arguments')
-    statistics_parser.add_argument("--class_uri", type=str, required=True,
-                            help="An URI of a target class for shapes graph")
-    statistics_parser.add_argument("--sparql_endpoint", type=str, required=True,
+    statistics_parser = subparsers.add_parser('statistics', help='Spreadsheet arguments', parents=[cache_parser, output_parser, class_parser])
+    statistics_required = statistics_parser.add_argument_group('required arguments')
+    statistics_required.add_argument("--class_uri", type=str, nargs="+", default=[],
+                            help="One or more URIs of target classes for shapes graph")
+    statistics_required.add_argument("--sparql_endpoint", type=str, required=True,
                             help="A string of SPARQL endpoint URL")
-
-    args = parser.parse_args()
-
-    if sys.argv[1] == "spreadsheet":
+    statistics_parser.add_argument("--top_k", type=int, default=10,
+                            help="A maximum number of properties in the shapes graph, 0 for all (default is 10)")
+    statistics_parser.add_argument("--min_freq", type=float, default=0.0,
+                            help="A minimum relative frequency of a property in the shapes graph (default is 0.0)")
+    statistics_parser.add_argument("--timeout", type=int, default=60,
+                            help="A number of seconds before an aggregate query falls back to smaller queries (default is 60)")
+    statistics_parser.add_argument("--approximate", action="store_true",
+                            help="Estimate the relative frequencies from a sample of entities")
+    statistics_parser.add_argument("--sample_size", type=int, default=10000,
+                            help="A maximum number of sampled entities in the approximate mode (default is 10000)")
+    statistics_parser.add_argument("--sampling", type=str, default="stratified", choices=["stratified", "random"],
+                            help="A sampling method in the approximate mode (default is stratified)")
+    statistics_parser.add_argument("--confidence", type=float, default=0.95,
+                            help="A confidence level of the estimated frequencies (default is 0.95)")
+    statistics_parser.add_argument("--seed", type=int, default=None,
+                            help="A seed for the sampling in the approximate mode")
+
+    return parser
+
+
+def main(argv=None, prog=None):
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+    start_metrics(args)
+    if args.command in ('ontology', 'statistics'):
+        configure_cache(None if args.no_cache else args.cache_dir, ttl=args.cache_ttl * 3600)
+
+    if args.command == "spreadsheet":
         filename = args.file
-        shape_name = args.shape_name
-        shape_target = args.shape_target
-        prop = args.prop_uri
-        card_col = args.card_col
-        
-        df = pd.read_csv(filename)
-        shapes_graph = generate_by_spreadsheet(df, shape_name, shape_target, prop, card_col)
-
-        with open("shacl-shapes.ttl", "w") as file:
-            file.write(shapes_graph)
+        shape_name = args.shape_name_col
+        shape_target = args.shape_target_col
+        props = args.prop_uri
+        card_cols = args.card_col
+        if len(card_cols) not in (1, len(props)):
+            parser.error("--card_col takes one column, or one column for each --prop_uri")
+
+        # write the shapes while the spreadsheet is read in chunks
+        with stage('write_spreadsheet_shapes') as record:
+            record['items'] = write_spreadsheet_shapes(filename, shape_name, shape_target, props, card_cols)
+        if args.snapshot:
+            with stage('snapshot_shapes_graph'):
+                snapshot_shapes_graph()
 
         print("Successfully created a shapes graph")
 
-    elif sys.argv[1] == 'ontology':
-        class_uri = args.class_uri
-        shape_name = "".join(class_uri.split(":")[1:])
+    elif args.command in ('ontology', 'statistics'):
+        class_uris = list(args.class_uri)
+        if args.class_file:
+            with open(args.class_file) as file:
+                class_uris += [line.strip() for line in file if line.strip()]
+        # a class given both as <IRI> and as a prefixed name is kept once
+        iris = {}
+        for class_uri in class_uris:
+            iris.setdefault(expand_class_uri(class_uri), class_uri)
+        class_uris = list(iris.values())
+        if not class_uris:
+            parser.error("give at least one class with --class_uri or --class_file")
         sparql_endpoint = args.sparql_endpoint
 
         # get all the required properties
         print("Get all the required properties...")
-        prop = get_property_by_ontology(class_uri, sparql_endpoint)
+        with stage('get_properties') as record:
+            if args.command == 'ontology':
+                props = get_property_by_ontology_batch(class_uris, sparql_endpoint) if len(class_uris) > 1 \
+                    else {class_uris[0]: get_property_by_ontology(class_uris[0], sparql_endpoint)}
+            elif len(class_uris) > 1:
+                props = get_property_by_statistics_batch(class_uris, sparql_endpoint,
+                                                         top_k=args.top_k or None,
+                                                         min_freq=args.min_freq,
+                                                         batch_size=args.batch_size,
+                                                         workers=args.workers,
+                                                         timeout=args.timeout,
+                                                         approximate=args.approximate,
+                                                         sample_size=args.sample_size,
+                                                         method=args.sampling,
+                                                         confidence=args.confidence,
+                                                         seed=args.seed)
+            else:
+                props = {class_uris[0]: get_property_by_statistics(class_uris[0], sparql_endpoint,
+                                                                   top_k=args.top_k or None,
+                                                                   min_freq=args.min_freq,
+                                                                   timeout=args.timeout,
+                                                                   approximate=args.approximate,
+                                                                   sample_size=args.sample_size,
+                                                                   method=args.sampling,
+                                                                   confidence=args.confidence,
+                                                                   seed=args.seed)}
+            record['items'] = len(class_uris)
         print("Succesfully get all the properties")
 
         # create property shape
         print("Construct a shape graph...")
-        shapes_graph = construct_shapes_graph(f"{shape_name}SchemaShapes", 
-                                                prop, 
-                                                'prop.value', 
-                                                'cardinality', 
-                                                class_uri)
-        with open("shacl-shapes.ttl", "w") as file:
-            file.write(shapes_graph)
+        with stage('construct_shapes_graph') as record:
+            names = shape_names(class_uris)
+            list_shapes_graph = {}
+            for class_uri, prop in props.items():
+                if prop.empty:
+                    print(f"Skip {class_uri}, no properties are found")
+                    continue
+                if args.command == 'statistics' and args.approximate:
+                    print(class_uri)
+                    print(prop[['prop.value', 'rel_freq', 'ci_low', 'ci_high']].to_string(index=False))
+
+                shape_name = names[class_uri]
+                list_shapes_graph[shape_name] = construct_shapes_graph(f"{shape_name}SchemaShapes",
+                                                                       prop,
+                                                                       'prop.value',
+                                                                       'cardinality',
+                                                                       class_uri)
+            record['items'] = sum(prop.shape[0] for prop in props.values())
+
+        # a single class is written to shacl-shapes.ttl as before
+        with stage('write_shapes_graph'):
+            if len(class_uris) == 1 or args.output == 'combined':
+                write_shapes_graph(combine_shapes_graphs(list_shapes_graph.values()), snapshot=args.snapshot)
+            else:
+                for shape_name, shapes_graph in list_shapes_graph.items():
+                    write_shapes_graph(shapes_graph, f"shacl-shapes-{shape_name}.ttl", snapshot=args.snapshot)
 
         print("Successfully created a shapes graph")
 
-    elif sys.argv[1] == 'statistics':
-        class_uri = args.class_uri
-        shape_name = "".join(class_uri.split(":")[1:])
-        sparql_endpoint = args.sparql_endpoint
-
-        # get all the required properties
-        print("Get all the required properties...")
-        prop = get_property_by_statistics(class_uri, sparql_endpoint)
-        print("Succesfully get all the properties")
-
-        # create property shape
-        print("Construct a shape graph...")
-        shapes_graph = construct_shapes_graph(f"{shape_name}SchemaShapes", 
-                                                prop, 
-                                                'prop.value', 
-                                                'cardinality', 
-                                                class_uri)
-        with open("shacl-shapes.ttl", "w") as file:
-            file.write(shapes_graph)
-
     else:
         print("A type of argument not acceptible. Try again!")
+
+
+if __name__ == "__main__":
+    main()
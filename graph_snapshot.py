@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import mmap
+
+from lazy_import import lazy_import
+
+# the heavy dependencies are imported when they are first used
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+rdflib = lazy_import('rdflib')
+
+
+SNAPSHOT_VERSION = 1
+
+# characters not allowed in an N-Triples IRI and in a quoted literal
+IRI_ESCAPE = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+LITERAL_ESCAPE = [('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n'), ('\r', '\\r')]
+
+
+def snapshot_path(graph_file):
+    # the snapshot of data_graph.ttl is the directory data_graph.snap
+    return os.path.splitext(graph_file)[0] + ".snap"
+
+
+def encode_term(term):
+    """
+    Encode an RDFLib term as an N-Triples term, the same way as prepare_data does.
+
+    Parameters
+    ----------
+    term : Identifier
+        A URIRef, Literal or BNode
+
+    Returns
+    -------
+    str
+        The N-Triples term
+    """
+
+    if isinstance(term, rdflib.URIRef):
+        return '<' + IRI_ESCAPE.sub(lambda match: f"\\u{ord(match.group(0)):04X}", str(term)) + '>'
+    if isinstance(term, rdflib.BNode):
+        return '_:' + re.sub(r'[^A-Za-z0-9_]', '_', str(term))
+
+    value = str(term)
+    for char, escaped in LITERAL_ESCAPE:
+        value = value.replace(char, escaped)
+    if term.language:
+        return f'"{value}"@{term.language}'
+    if term.datatype:
+        return f'"{value}"^^{encode_term(term.datatype)}'
+    return f'"{value}"'
+
+
+def write_snapshot(subjects, predicates, objects, directory, namespaces=None):
+    """
+    Write a snapshot of a graph: a sorted dictionary of the terms and an
+    array of the triples as term numbers, sorted by predicate and subject.
+
+    Parameters
+    ----------
+    subjects : Series
+        A column of the subjects as N-Triples terms
+    predicates : Series
+        A column of the predicates as N-Triples terms
+    objects : Series
+        A column of the objects as N-Triples terms
+    directory : str
+        A directory of the snapshot
+    namespaces : dict, optional
+        The prefixes of the graph (default is None)
+
+    Returns
+    -------
+    int
+        A number of triples in the snapshot
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    num_of_rows = len(subjects)
+
+    # the terms are numbered in sorted order, so a term is found by binary search
+    codes, terms = pd.factorize(pd.concat([subjects, predicates, objects], ignore_index=True), sort=True)
+    dtype = np.uint32 if len(terms) < 2**32 else np.uint64
+    triples = np.column_stack([codes[num_of_rows:2*num_of_rows], codes[:num_of_rows], codes[2*num_of_rows:]]).astype(dtype)
+    triples = np.unique(triples, axis=0) if num_of_rows else triples.reshape(0, 3)
+
+    encoded = [term.encode('utf-8') for term in terms]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term in encoded], out=offsets[1:])
+
+    with open(os.path.join(directory, "terms.bin"), 'wb') as file:
+        file.write(b''.join(encoded))
+    np.save(os.path.join(directory, "offsets.npy"), offsets)
+    np.save(os.path.join(directory, "triples.npy"), triples)
+    with open(os.path.join(directory, "meta.json"), 'w', encoding='utf-8') as file:
+        json.dump({'version': SNAPSHOT_VERSION,
+                   'num_of_terms': len(terms),
+                   'num_of_triples': len(triples),
+                   'namespaces': namespaces or {}}, file)
+
+    return len(triples)
+
+
+def snapshot_graph(graph, directory):
+    # snapshot of a graph in memory, i.e. a shapes graph
+    triples = list(graph)
+    return write_snapshot(pd.Series([encode_term(s) for s, _, _ in triples], dtype=object),
+                          pd.Series([encode_term(p) for _, p, _ in triples], dtype=object),
+                          pd.Series([encode_term(o) for _, _, o in triples], dtype=object),
+                          directory,
+                          {prefix: str(namespace) for prefix, namespace in graph.namespaces()})
+
+
+class GraphSnapshot:
+    """
+    A read-only graph over a memory-mapped snapshot.
+
+    Only the terms that are used are decoded, and the triples are matched on
+    the arrays of term numbers. It provides the part of the RDFLib Graph
+    interface used by the native validation engine.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json"), encoding='utf-8') as file:
+            self.meta = json.load(file)
+        if self.meta.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"{directory} is a snapshot of an unknown version")
+
+        self.directory = directory
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode='r')
+        self.spo = np.load(os.path.join(directory, "triples.npy"), mmap_mode='r')
+        self.terms = {}
+
+        with open(os.path.join(directory, "terms.bin"), 'rb') as file:
+            self.blob = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b''
+
+    def __len__(self):
+        return len(self.spo)
+
+    def __iter__(self):
+        return self.triples((None, None, None))
+
+    def encoded(self, number):
+        return self.blob[self.offsets[number]:self.offsets[number + 1]]
+
+    def term(self, number):
+        # the terms are decoded when they are first needed
+        term = self.terms.get(number)
+        if term is None:
+            term = self.terms[number] = rdflib.util.from_n3(self.encoded(number).decode('utf-8'))
+        return term
+
+    def number(self, term):
+        """Find the number of a term, or None if the term is not in the graph."""
+
+        key = encode_term(term).encode('utf-8')
+        low, high = 0, len(self.offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self.encoded(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.offsets) - 1 and self.encoded(low) == key:
+            return low
+        return None
+
+    def match(self, pattern):
+        # the rows of the triples matching a pattern, the triples are sorted by predicate
+        s, p, o = pattern
+        rows = self.spo
+        if p is not None:
+            number = self.number(p)
+            if number is None:
+                return rows[:0]
+            predicates = rows[:, 0]
+            rows = rows[np.searchsorted(predicates, number, 'left'):np.searchsorted(predicates, number, 'right')]
+        for column, term in ((1, s), (2, o)):
+            if term is not None:
+                number = self.number(term)
+                if number is None:
+                    return rows[:0]
+                rows = rows[rows[:, column] == number]
+        return rows
+
+    def triples(self, pattern):
+        term = self.term
+        for p, s, o in self.match(pattern):
+            yield term(s), term(p), term(o)
+
+    def subjects(self, predicate=None, object=None, unique=False):
+        numbers = self.match((None, predicate, object))[:, 1]
+        for number in (np.unique(numbers) if unique else numbers):
+            yield self.term(number)
+
+    def objects(self, subject=None, predicate=None, unique=False):
+        numbers = self.match((subject, predicate, None))[:, 2]
+        for number in (np.unique(numbers) if unique else numbers):
+            yield self.term(number)
+
+    def transitive_subjects(self, predicate, object, remember=None):
+        # the object itself and all the subjects linked to it through the predicate
+        remember = set() if remember is None else remember
+        if object in remember:
+            return
+        remember.add(object)
+        yield object
+        for subject in self.subjects(predicate, object):
+            yield from self.transitive_subjects(predicate, subject, remember)
+
+    def namespaces(self):
+        return iter(self.meta['namespaces'].items())
+
+    def to_graph(self):
+        """Decode the whole snapshot into an RDFLib Graph."""
+
+        graph = rdflib.Graph()
+        for prefix, namespace in self.namespaces():
+            graph.bind(prefix, namespace)
+        terms = {number: self.term(number) for number in np.unique(self.spo)}
+        graph.addN((terms[s], terms[p], terms[o], graph) for p, s, o in self.spo)
+        return graph
@@ -0,0 +1,33 @@
+import threading
+import importlib
+
+
+class LazyModule:
+    """
+    A module imported when one of its attributes is first used, so the
+    commands that do not need it start without importing it.
+
+    Parameters
+    ----------
+    name : str
+        A name of the module, i.e. pandas
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_lock'] = threading.Lock()
+
+    def __getattr__(self, attr):
+        # the import lock of the module keeps concurrent first uses safe,
+        # and the loaded attributes are then found without calling __getattr__
+        with self._lock:
+            module = importlib.import_module(self._name)
+            self.__dict__.update(vars(module))
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import threading
+import tracemalloc
+
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from sparql_client import LATENCY_BUCKETS, clients
+
+
+class Metrics:
+    """
+    Record the wall time, CPU time and memory of the stages of a run, the total
+    time of frequent steps inside them, and the queries sent to the endpoints.
+
+    The stages are recorded by the main thread, the timers may be updated by
+    any thread.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.stages = []
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Record a stage of the run.
+
+        Parameters
+        ----------
+        name : str
+            A name of the stage
+
+        Yields
+        ------
+        dict
+            The record of the stage, a number of processed items, i.e. triples,
+            can be set as record['items']
+        """
+
+        record = {'name': name, 'items': None}
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start, cpu_start = time.perf_counter(), time.process_time()
+        peak_start = peak_rss()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - start
+            record['cpu_seconds'] = time.process_time() - cpu_start
+            record['rss_mb'] = current_rss()
+            # the peak of the process cannot be reset, so a stage only tells how much it raised it
+            record['process_peak_rss_mb'] = peak_rss()
+            if record['process_peak_rss_mb'] is not None:
+                record['peak_rss_growth_mb'] = record['process_peak_rss_mb'] - peak_start
+            if tracemalloc.is_tracing():
+                record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            if record['items'] is not None and record['wall_seconds']:
+                record['items_per_second'] = record['items'] / record['wall_seconds']
+            self.stages.append(record)
+
+    @contextmanager
+    def timer(self, name):
+        # the total time and number of calls of a step, i.e. the normalization of a query result
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                timer = self.timers.setdefault(name, {'calls': 0, 'seconds': 0.0})
+                timer['calls'] += 1
+                timer['seconds'] += elapsed
+
+    def report(self):
+        """
+        Summarize the run.
+
+        Returns
+        -------
+        dict
+            The stages, timers and endpoints of the run
+        """
+
+        return {
+            'command': sys.argv,
+            'wall_seconds': time.perf_counter() - self.start,
+            'cpu_seconds': time.process_time() - self.cpu_start,
+            'peak_rss_mb': peak_rss(),
+            'stages': self.stages,
+            'timers': self.timers,
+            'endpoints': {endpoint: summarize_client(client) for endpoint, client in clients.items()},
+        }
+
+
+def summarize_client(client):
+    # the queries, retries, bytes and the latency histogram of an endpoint
+    with client.lock:
+        stats = dict(client.stats)
+        counts = list(client.latency_counts)
+        latencies = sorted(query.latency for query in client.history)
+
+    bounds = [str(bound) for bound in LATENCY_BUCKETS] + ['inf']
+    stats['latency_histogram'] = dict(zip(bounds, counts))
+    stats['mean_latency'] = stats['latency'] / stats['queries'] if stats['queries'] else None
+    for percentile in (50, 90, 99):
+        stats[f'p{percentile}_latency'] = latencies[min(len(latencies) - 1, len(latencies) * percentile // 100)] \
+            if latencies else None
+    return stats
+
+
+def current_rss():
+    # the resident memory of the process in MiB, if the platform tells it
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+metrics = Metrics()
+
+
+def stage(name):
+    return metrics.stage(name)
+
+
+def timer(name):
+    return metrics.timer(name)
+
+
+def add_metrics_arguments(parser):
+    """
+    Add the arguments of the instrumentation to the parser of a command.
+
+    Parameters
+    ----------
+    parser : ArgumentParser
+        The parser of the command
+    """
+
+    parser.add_argument("--metrics_out", "--metrics-out", type=str, default=None,
+                            help="A file path the timings, memory and endpoint statistics of each stage are written to in json format")
+    parser.add_argument("--profile", type=str, default=None,
+                            help="A file path the cProfile statistics of the run are written to, read with pstats or snakeviz")
+    parser.add_argument("--trace_memory", "--trace-memory", action="store_true",
+                            help="Trace the allocations with tracemalloc and add the peak of each stage and the top allocations to the metrics")
+
+
+def start_metrics(args):
+    """
+    Start the profiling and the tracing asked for by the arguments, the results
+    are written when the process exits.
+
+    Parameters
+    ----------
+    args : Namespace
+        The parsed arguments of a command with the metrics arguments
+    """
+
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if args.trace_memory:
+        tracemalloc.start()
+
+    def finish():
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+
+        if args.metrics_out:
+            report = metrics.report()
+            if tracemalloc.is_tracing():
+                report['top_allocations'] = [
+                    {'location': str(stat.traceback), 'size_mb': stat.size / 2**20, 'count': stat.count}
+                    for stat in tracemalloc.take_snapshot().statistics('lineno')[:10]]
+            with open(args.metrics_out, 'w') as file:
+                json.dump(report, file, indent=2, default=str)
+
+    if profiler is not None or args.trace_memory or args.metrics_out:
+        atexit.register(finish)
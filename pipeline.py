@@ -0,0 +1,319 @@
+import argparse
+import threading
+
+from queue import Queue, Full
+
+from rdflib import URIRef
+
+from lazy_import import lazy_import
+from sparql_client import configure_cache
+from prepare_data import (DATA_PROP_COLUMNS, add_entity_column, build_data_graph, compact_data_prop,
+                          concat_data_prop, construct_data_graph, iter_data_prop, iter_pages, query_sparql)
+from validate_completeness import SH, construct_graph, create_report_validation, validate_graph
+from generate_shapes import expand_class_uri
+
+# the heavy dependencies are imported when they are first used
+pd = lazy_import('pandas')
+
+
+# the artifacts the pipeline can also write, as written by prepare_data
+ARTIFACTS = {'data': "data.csv", 'data_prop': "data_prop.csv", 'data_graph': "data_graph.ttl"}
+
+
+class StageError:
+    # an exception raised in a stage, raised again in the next stage
+    def __init__(self, error):
+        self.error = error
+
+
+def threaded(items, queue_size=2):
+    """
+    Run a stage of the pipeline in a thread, so it works ahead of the next stage
+    by at most queue_size items.
+
+    Parameters
+    ----------
+    items : iterable
+        The items of the stage, i.e. a generator
+    queue_size : int, optional
+        A maximum number of items waiting for the next stage (default is 2)
+
+    Yields
+    ------
+    object
+        The items of the stage in their order
+    """
+
+    queue = Queue(maxsize=queue_size)
+    finished = object()
+    stopped = threading.Event()
+
+    def put(item):
+        # wait for room in the queue until the next stage stops
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+            put(finished)
+        except BaseException as error:
+            put(StageError(error))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is finished:
+                break
+            if isinstance(item, StageError):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+
+
+def iter_entities(query, sparql_endpoint, chunk_size=10000, page_size=None, workers=1, pagination='offset'):
+    """
+    Query the entities to be validated and split them into chunks.
+
+    Parameters
+    ----------
+    query : str
+        A SPARQL query binding ?entity
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    chunk_size : int, optional
+        A number of entities per chunk (default is 10000)
+    page_size : int, optional
+        A number of entities retrieved in one page, no pagination if None (default is None)
+    workers : int, optional
+        A number of pages fetched at the same time with offset pagination (default is 1)
+    pagination : str, optional
+        'offset' or 'keyset' (default is 'offset')
+
+    Yields
+    ------
+    DataFrame
+        A chunk of the entities with the entity column, the chunks are
+        yielded as the pages are received
+    """
+
+    if page_size:
+        pages = iter_pages(query, sparql_endpoint, page_size, workers, pagination)
+    else:
+        pages = [query_sparql(query, sparql_endpoint)]
+
+    seen = set()
+    buffer = []
+    num_of_rows = 0
+    for page in pages:
+        if page.empty:
+            continue
+        page = page[~page['entity.value'].isin(seen)].drop_duplicates('entity.value')
+        seen.update(page['entity.value'])
+        buffer.append(page)
+        num_of_rows += page.shape[0]
+        while num_of_rows >= chunk_size:
+            rows = pd.concat(buffer, ignore_index=True)
+            yield add_entity_column(rows.iloc[:chunk_size].reset_index(drop=True))
+            buffer = [rows.iloc[chunk_size:]]
+            num_of_rows -= chunk_size
+
+    if num_of_rows:
+        yield add_entity_column(pd.concat(buffer, ignore_index=True))
+
+
+def collect_chunks(chunks, prop_list, sparql_endpoint, **kwargs):
+    # the values of the properties of each chunk of entities
+    for chunk in chunks:
+        windows = [compact_data_prop(window) for window in iter_data_prop(chunk, prop_list, sparql_endpoint, **kwargs)]
+        yield chunk, concat_data_prop(windows).reindex(columns=DATA_PROP_COLUMNS)
+
+
+def build_chunks(collected, entity_class):
+    # the data graph of each chunk of entities
+    for chunk, chunk_prop in collected:
+        yield chunk, chunk_prop, build_data_graph(chunk, chunk_prop, entity_class)
+
+
+def run_pipeline(query, sparql_endpoint, shapes_graph, entity_class, prop_list=None, chunk_size=10000,
+                 queue_size=2, engine='auto', keep=(), destination="validation_report.csv",
+                 page_size=None, pagination='offset', **kwargs):
+    """
+    Collect, build and validate the data chunk by chunk of entities in memory,
+    without writing and reading the intermediate files.
+
+    The entities, the values of the properties, the data graphs and the
+    validation run as stages in threads connected by bounded queues, so the
+    collection of a chunk overlaps the validation of the previous one and at
+    most queue_size chunks wait between two stages.
+
+    Parameters
+    ----------
+    query : str
+        A SPARQL query binding ?entity
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    shapes_graph : Graph
+        The shapes graph containing all the constraints
+    entity_class : str
+        An URI of the class of the instances
+    prop_list : list, optional
+        A list of the properties to be checked, the paths of the shapes if None (default is None)
+    chunk_size : int, optional
+        A number of entities per chunk (default is 10000)
+    queue_size : int, optional
+        A maximum number of chunks waiting between two stages (default is 2)
+    engine : str, optional
+        'auto' for the native engine with a fallback to PySHACL, or 'pyshacl' (default is 'auto')
+    keep : iterable, optional
+        The intermediate files also written, any of data, data_prop and data_graph (default is none)
+    destination : str, optional
+        A file path of the validation report (default is "validation_report.csv")
+    page_size : int, optional
+        A number of entities retrieved in one page, no pagination if None (default is None)
+    pagination : str, optional
+        'offset' or 'keyset' (default is 'offset')
+    **kwargs
+        Keyword arguments passed to iter_data_prop, such as window_size and workers
+
+    Returns
+    -------
+    (bool, int)
+        value of conformation, and number of validated instances
+    """
+
+    if prop_list is None:
+        prop_list = sorted({o.n3() for o in shapes_graph.objects(None, SH.path) if isinstance(o, URIRef)})
+
+    entities = threaded(iter_entities(query, sparql_endpoint, chunk_size, page_size,
+                                      kwargs.get('workers', 1), pagination), queue_size)
+    collected = threaded(collect_chunks(entities, prop_list, sparql_endpoint, **kwargs), queue_size)
+    built = threaded(build_chunks(collected, entity_class), queue_size)
+
+    from tqdm import tqdm
+
+    conforms = True
+    num_of_rows = 0
+    num_of_prop_rows = 0
+    for index, (chunk, chunk_prop, data_graph) in enumerate(tqdm(built, unit="chunk", desc="Validating chunks")):
+        chunk_conforms, report_graph, _ = validate_graph(shapes_graph, data_graph, engine=engine)
+        conforms = conforms and chunk_conforms
+
+        validation = create_report_validation(chunk, "entity.value", report_graph, prop_list)
+        validation.to_csv(destination, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+
+        # the intermediate files are written only when asked for
+        if 'data' in keep:
+            chunk.index = range(num_of_rows, num_of_rows + chunk.shape[0])
+            chunk.to_csv(ARTIFACTS['data'], mode='w' if index == 0 else 'a', header=index == 0)
+        if 'data_prop' in keep:
+            chunk_prop.index = range(num_of_prop_rows, num_of_prop_rows + chunk_prop.shape[0])
+            chunk_prop.to_csv(ARTIFACTS['data_prop'], mode='w' if index == 0 else 'a', header=index == 0)
+        if 'data_graph' in keep:
+            construct_data_graph(chunk, chunk_prop, entity_class, ARTIFACTS['data_graph'], append=index > 0)
+
+        num_of_rows += chunk.shape[0]
+        num_of_prop_rows += chunk_prop.shape[0]
+
+    return conforms, num_of_rows
+
+
+def build_parser(prog=None):
+    parser = argparse.ArgumentParser(prog=prog, allow_abbrev=False,
+                                        description="Arguments for collecting and validating data in one pipeline")
+    required = parser.add_argument_group('required arguments')
+
+    required.add_argument("--query_file", type=str, required=True,
+                            help="A file path for a SPARQL query file in txt format")
+    required.add_argument("--sparql_endpoint", type=str, required=True,
+                            help="A string of SPARQL endpoint URL")
+    required.add_argument("--shapes_graph", type=str, required=True,
+                            help="A file path of shapes graph in ttl format, its snapshot in a .snap directory is used if there is one")
+    parser.add_argument("--class_uri", type=str, default=None,
+                            help="An URI of target class, as an IRI or a prefixed name such as dbo:Country (default is the target class of the shapes)")
+    parser.add_argument("--prop_list", type=str, default=None, nargs="+",
+                            help="A list of properties to be checked for each entity (default is the paths of the shapes)")
+    parser.add_argument("--chunk_size", type=int, default=10000,
+                            help="A number of entities collected and validated together (default is 10000)")
+    parser.add_argument("--queue_size", type=int, default=2,
+                            help="A maximum number of chunks waiting between two stages of the pipeline (default is 2)")
+    parser.add_argument("--keep", type=str, default=[], nargs="+", choices=list(ARTIFACTS),
+                            help="The intermediate files also written as by prepare_data: data.csv, data_prop.csv and data_graph.ttl")
+    parser.add_argument("--engine", type=str, default="auto", choices=["auto", "pyshacl"],
+                            help="A validation engine, auto checks minCount shapes natively and the rest with PySHACL (default is auto)")
+    parser.add_argument("--window_size", type=int, default=50,
+                            help="A number of entities used in one query (default is 50)")
+    parser.add_argument("--workers", type=int, default=1,
+                            help="A number of queries sent to the endpoint at the same time (default is 1)")
+    parser.add_argument("--rate_limit", type=float, default=None,
+                            help="A maximum number of queries per second sent to the endpoint (default is no limit)")
+    parser.add_argument("--merge_props", action="store_true",
+                            help="Query all the properties of a window of entities in one query")
+    parser.add_argument("--adaptive_window", action="store_true",
+                            help="Adapt the window size to the response time and size of the endpoint")
+    parser.add_argument("--page_size", type=int, default=None,
+                            help="A number of entities retrieved in one page, no pagination if not given")
+    parser.add_argument("--pagination", type=str, default="offset", choices=["offset", "keyset"],
+                            help="A pagination of the entities, offset pages are fetched in parallel (default is offset)")
+    parser.add_argument("--cache_dir", "--cache-dir", type=str, default=".sparql-cache",
+                            help="A directory of the cache of query results (default is .sparql-cache)")
+    parser.add_argument("--cache_ttl", type=float, default=24,
+                            help="A number of hours a cached query result stays valid (default is 24)")
+    parser.add_argument("--no_cache", "--no-cache", action="store_true",
+                            help="Always query the endpoint instead of the cache")
+
+    return parser
+
+
+def main(argv=None, prog=None):
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+    configure_cache(None if args.no_cache else args.cache_dir, ttl=args.cache_ttl * 3600)
+
+    with open(args.query_file, 'r') as file:
+        query = file.read()
+
+    print("Constructing shapes graph ...")
+    shapes_graph = construct_graph(args.shapes_graph)
+
+    # the data graph is built from the properties and the class of the instances
+    entity_class = args.class_uri
+    if entity_class is None:
+        target_classes = set(shapes_graph.objects(None, SH.targetClass))
+        if len(target_classes) != 1:
+            parser.error("--class_uri is required unless the shapes have a single target class")
+        entity_class = str(target_classes.pop())
+    else:
+        entity_class = expand_class_uri(entity_class)
+
+    print("Collecting and validating the data ...")
+    conforms, num_of_rows = run_pipeline(query, args.sparql_endpoint, shapes_graph, entity_class,
+                                         prop_list=args.prop_list,
+                                         chunk_size=args.chunk_size,
+                                         queue_size=args.queue_size,
+                                         engine=args.engine,
+                                         keep=args.keep,
+                                         page_size=args.page_size,
+                                         pagination=args.pagination,
+                                         window_size=args.window_size,
+                                         workers=args.workers,
+                                         rate_limit=args.rate_limit,
+                                         merge_props=args.merge_props,
+                                         adaptive=args.adaptive_window)
+    print(f"Validated {num_of_rows} entities")
+
+    print("Successfully validated the data completeness")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,41 @@
+import os
+import re
+import json
+import time
+import hashlib
 import argparse
-import pandas as pd
 
-from tqdm import tqdm
-from rdflib import Graph, URIRef, Literal, Namespace
-from SPARQLWrapper import SPARQLWrapper, JSON
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
+from lazy_import import lazy_import
+from sparql_client import RateLimiter, configure_cache, get_client
+from metrics import add_metrics_arguments, stage, start_metrics, timer
+from graph_snapshot import IRI_ESCAPE, LITERAL_ESCAPE, snapshot_path, write_snapshot
+from generate_shapes import expand_class_uri
 
-def query_sparql(query, sparql_endpoint):
+# the heavy dependencies are imported when they are first used
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+rdflib = lazy_import('rdflib')
+
+
+# the PREFIX and BASE declarations and comments before a query
+QUERY_PROLOGUE = re.compile(r'(?:\s+|#[^\n]*|PREFIX\s+[^\s:]*:\s*<[^>]*>|BASE\s+<[^>]*>)*', re.IGNORECASE)
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+# the subject and the property of a value are always IRIs
+DATA_PROP_COLUMNS = ['s.type', 's.value', 'p.type', 'p.value', 'o.type', 'o.value', 'o.xml:lang', 'o.datatype']
+
+# the values are read back as written, i.e. the literals "NA" or "1.50",
+# only a missing language tag or datatype is read as NaN
+DATA_PROP_CSV_OPTIONS = {'dtype': str, 'keep_default_na': False, 'na_values': {'o.xml:lang': [''], 'o.datatype': ['']}}
+
+# a window of the checkpoints that was not completely written
+WINDOW_FILE = re.compile(r'[0-9a-f]{12}-\d+-\d+\.csv\.tmp')
+
+
+def query_sparql(query, sparql_endpoint, timeout=None, use_cache=True):
   """
   Query to certain SPARQL endpoint, such as Wikidata SPARQL.
 
@@ -16,6 +45,11 @@ def query_sparql(query, sparql_endpoint):
     A SPARQL query to be run
   sparql_endpoint : str
     A SPARQL API endpoint 
+  timeout : int, optional
+    A number of seconds to wait for the result, if given a timeout raises
+    QueryTimeout instead of retrying the query (default is None)
+  use_cache : bool, optional
+    A boolean value to use the result cache, if configured (default is True)
 
   Returns
   -------
@@ -23,27 +57,205 @@ def query_sparql(query, sparql_endpoint):
     A table consisting of instances to be validated
   """
 
-  # set up the query
-  sparqlwd = SPARQLWrapper(sparql_endpoint)
-  sparqlwd.setQuery(query)
-  sparqlwd.setReturnFormat(JSON)
-
-  # get the data and transform the result into pandas dataframe
-  while True:
-    try:
-      results = sparqlwd.query().convert()
-      results_df = pd.json_normalize(results['results']['bindings'])
-      break
-    except:
-      continue
-  
-  # return the result in dataframe
+  # get the data through the shared client of the endpoint
+  results = get_client(sparql_endpoint).query(query, timeout, use_cache)
+
+  # transform the result into pandas dataframe
+  with timer('json_normalize'):
+    results_df = pd.json_normalize(results['results']['bindings'])
   return results_df
 
 
-def get_data_prop(df, prop_list, sparql_endpoint):
+def query_sparql_batches(query, sparql_endpoint, batch_size=10000, timeout=None):
     """
-    Query the property value given all the instances to be validated.
+    Query to certain SPARQL endpoint and parse the result while it is being received.
+
+    Parameters
+    ----------
+    query : str
+        A SPARQL query to be run
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    batch_size : int, optional
+        A number of rows in one batch (default is 10000)
+    timeout : int, optional
+        A number of seconds to wait for the endpoint (default is None)
+
+    Yields
+    ------
+    DataFrame
+        A batch of the result, with the type, value, xml:lang and datatype
+        columns of every variable, at least one possibly empty batch is yielded.
+        When the endpoint sends the variables after the bindings, the
+        variables are taken from the first batch
+    """
+
+    head_vars, bindings = get_client(sparql_endpoint).stream(query, timeout)
+    columns = binding_columns(head_vars)
+
+    batch = []
+    num_of_batches = 0
+    for binding in bindings:
+        batch.append(binding)
+        if len(batch) == batch_size:
+            # the endpoint may send the variables after the bindings
+            if not columns:
+                columns = binding_columns(dict.fromkeys(var for row in batch for var in row))
+            with timer('json_normalize'):
+                frame = pd.json_normalize(batch).reindex(columns=columns)
+            yield frame
+            num_of_batches += 1
+            batch = []
+
+    if batch or not num_of_batches:
+        if not columns:
+            columns = binding_columns(dict.fromkeys(var for row in batch for var in row))
+        with timer('json_normalize'):
+            frame = pd.json_normalize(batch).reindex(columns=columns)
+        yield frame
+
+
+def binding_columns(head_vars):
+    return [f"{var}.{key}" for var in head_vars for key in ('type', 'value', 'xml:lang', 'datatype')]
+
+
+def write_batches(batches, filename):
+    """
+    Write batches of a table to one CSV file as they come.
+
+    Parameters
+    ----------
+    batches : iterable
+        An iterable of DataFrames with the same columns
+    filename : str
+        A file path of the CSV file
+
+    Returns
+    -------
+    int
+        A number of written rows
+    """
+
+    num_of_rows = 0
+    with open(filename, 'w', newline='') as file:
+        for idx, batch in enumerate(batches):
+            batch.index = range(num_of_rows, num_of_rows + batch.shape[0])
+            batch.to_csv(file, header=(idx == 0))
+            num_of_rows += batch.shape[0]
+
+    return num_of_rows
+
+
+class WindowCheckpoint:
+    """
+    Keep the collected windows on disk as they finish, with a manifest of the
+    (properties, window) pairs that are done or failed, so an interrupted
+    collection can be resumed.
+
+    The manifest is only appended to, after the window itself is written, so
+    it never lists a window that is not on disk.
+    Clearing the checkpoints removes only the manifest and the windows it
+    lists, so the directory may hold other files.
+
+    Parameters
+    ----------
+    directory : str
+        A directory of the checkpoints
+    entities : Series
+        The entities of the windows, a resumed collection must have the same ones
+    resume : bool, optional
+        A boolean value to keep the windows of a previous run (default is False)
+    """
+
+    def __init__(self, directory, entities, resume=False):
+        self.directory = directory
+        self.manifest = os.path.join(directory, "manifest.jsonl")
+        self.key = hashlib.sha256('\n'.join(entities.astype(str)).encode('utf-8')).hexdigest()
+        self.done = {}
+        self.failed = {}
+
+        if resume and os.path.exists(self.manifest):
+            with open(self.manifest, encoding='utf-8') as file:
+                records = [json.loads(line) for line in file if line.endswith('\n')]
+            if records and records[0].get('entities') == self.key:
+                for record in records[1:]:
+                    self.record(record)
+                print(f"Resuming with {sum(len(windows) for windows in self.done.values())} collected windows")
+                return
+            print("The entities changed since the checkpoints were written, collecting all the windows again")
+
+        self.clear()
+        os.makedirs(directory, exist_ok=True)
+        self.append({'entities': self.key})
+
+    def record(self, record):
+        window = (tuple(record['props']), record['start'], record['end'])
+        if record['status'] == 'done':
+            self.done.setdefault(window[0], {})[window[1:]] = record['file']
+        else:
+            self.failed[window] = record.get('error', '')
+
+    def append(self, record):
+        with open(self.manifest, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+        if 'status' in record:
+            self.record(record)
+
+    def done_windows(self, props):
+        # the finished windows of the properties as (start, end, file), in order
+        return sorted((start, end, file) for (start, end), file in self.done.get(tuple(props), {}).items())
+
+    def missing(self):
+        """The failed windows that are not collected yet, the windows may be split differently when retried."""
+
+        missing = []
+        for (props, start, end), error in self.failed.items():
+            idx = start
+            for done_start, done_end, _ in self.done_windows(props):
+                if done_start <= idx < done_end:
+                    idx = done_end
+            if idx < end:
+                missing.append((props, start, end, error))
+        return missing
+
+    def save(self, props, start, end, data_prop):
+        name = f"{hashlib.sha1(' '.join(props).encode('utf-8')).hexdigest()[:12]}-{start}-{end}.csv"
+        filename = os.path.join(self.directory, name)
+        data_prop.to_csv(filename + ".tmp", index=False)
+        os.replace(filename + ".tmp", filename)
+        self.append({'props': list(props), 'start': start, 'end': end, 'status': 'done', 'file': name, 'rows': data_prop.shape[0]})
+
+    def fail(self, props, start, end, error):
+        self.append({'props': list(props), 'start': start, 'end': end, 'status': 'failed', 'error': str(error)})
+
+    def load(self, name):
+        return pd.read_csv(os.path.join(self.directory, name), **DATA_PROP_CSV_OPTIONS).reindex(columns=DATA_PROP_COLUMNS)
+
+    def clear(self):
+        """Remove the manifest and the windows it lists, the other files of the directory are kept."""
+
+        if not os.path.exists(self.manifest):
+            return
+        with open(self.manifest, encoding='utf-8') as file:
+            names = {json.loads(line).get('file') for line in file if line.endswith('\n')}
+        # a window interrupted while it was written is left as a temporary file
+        names.update(name for name in os.listdir(self.directory) if WINDOW_FILE.fullmatch(name))
+        for name in names - {None}:
+            filename = os.path.join(self.directory, os.path.basename(name))
+            if os.path.isfile(filename):
+                os.remove(filename)
+        os.remove(self.manifest)
+        if not os.listdir(self.directory):
+            os.rmdir(self.directory)
+
+
+def iter_data_prop(df, prop_list, sparql_endpoint, window_size=50, workers=1, rate_limit=None,
+                   merge_props=False, adaptive=False, target_latency=2.0, max_rows=10000,
+                   max_window_size=500, checkpoint=None):
+    """
+    Query the property value given all the instances to be validated, window by window.
 
     Parameters
     ----------
@@ -51,100 +263,618 @@ def get_data_prop(df, prop_list, sparql_endpoint):
         A table containing all the instances to be validated
     prop_list : list
         A list of properties to be checked
-    window_size : int
-        A number of data instances used in one query
     sparql_endpoint : str
         A SPARQL API endpoint 
+    window_size : int, optional
+        A number of data instances used in one query (default is 50)
+    workers : int, optional
+        A number of queries sent to the endpoint at the same time (default is 1)
+    rate_limit : float, optional
+        A maximum number of queries per second sent to the endpoint (default is None)
+    merge_props : bool, optional
+        A boolean value to query all the properties of a window in one query (default is False)
+    adaptive : bool, optional
+        A boolean value to adapt the window size to the response time and the
+        number of returned rows (default is False)
+    target_latency : float, optional
+        A response time in seconds the adaptive window size aims for (default is 2.0)
+    max_rows : int, optional
+        A number of returned rows the adaptive window size stays below (default is 10000)
+    max_window_size : int, optional
+        A maximum number of data instances used in one adaptive query (default is 500)
+    checkpoint : WindowCheckpoint, optional
+        The checkpoints the windows are written to as they finish, and read from
+        instead of querying them again (default is None)
 
-    Returns
-    -------
+    Yields
+    ------
     DataFrame
-        A table consisting of all the properties of instances along with their values
+        A table consisting of the properties of the instances of a window
+        along with their values, in the order of the windows
     """
 
     # initiate the variables
     size = df.shape[0]
-    list_data = []
+    limiter = RateLimiter(rate_limit)
+    groups = [prop_list] if merge_props else [[prop] for prop in prop_list]
+    current = {'window_size': window_size}
+    list_data = {}
+    next_pos = 0
+
+    def iter_windows():
+        # the window size is read when a window is sent, so it follows the adaptation,
+        # and only the entities between the checkpointed windows are queried
+        for props in groups:
+            done = checkpoint.done_windows(props) if checkpoint is not None else []
+            idx = 0
+            for start, end, name in done + [(size, size, None)]:
+                while idx < start:
+                    num = min(current['window_size'], start - idx)
+                    yield props, idx, num, None
+                    idx += num
+                if name is not None:
+                    yield props, start, end - start, name
+                    idx = max(idx, end)
+
+    def fetch(props, idx, num):
+        if len(props) == 1:
+            prop_binding = f"BIND({props[0]} AS ?p)"
+        else:
+            prop_binding = f"VALUES ?p {{{' '.join(props)}}}"
 
-    for prop in prop_list:
-        for idx in tqdm(range(0, size, 50), desc=f"Collecting values of {prop}"):
-            try:
-                query = f"""
+        query = f"""
 SELECT ?s ?p ?o
 WHERE {{
-    VALUES ?s {{{' '.join(data['entity'][idx:idx+50]) }}}
-    BIND({prop} AS ?p)
+    VALUES ?s {{{' '.join(df['entity'][idx:idx+num]) }}}
+    {prop_binding}
     ?s ?p ?o .
 }}
 """
-                res = query_sparql(query, sparql_endpoint)
-                list_data.append(res)
-                
-            except:
-                print("Something wrong in collecting the data properties")
-                break
-    
-    return pd.concat(list_data, ignore_index=True, sort=False)
+        limiter.wait()
+        start = time.monotonic()
+        res = query_sparql(query, sparql_endpoint).reindex(columns=DATA_PROP_COLUMNS)
+        return res, time.monotonic() - start
+
+    def adapt(elapsed, num_of_result):
+        # shrink the window on slow or large responses, grow it on fast and small ones
+        num = current['window_size']
+        if elapsed > target_latency or num_of_result > max_rows:
+            current['window_size'] = max(1, num // 2)
+        elif elapsed < target_latency / 2 and num_of_result < max_rows / 2:
+            current['window_size'] = min(max_window_size, num * 2)
+
+    # send the windows concurrently, but keep the results in the order of the windows
+    windows = enumerate(iter_windows())
+    futures = {}
+    failed = []
+    num_of_rows = 0
+
+    def release():
+        # release the finished windows in their order
+        nonlocal next_pos
+        while next_pos in list_data:
+            res = list_data.pop(next_pos)
+            next_pos += 1
+            if isinstance(res, str):
+                res = checkpoint.load(res)
+            if res is not None:
+                yield res
+
+    from tqdm import tqdm
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            tqdm(total=size * len(groups), unit="entity", desc="Collecting values of properties") as pbar:
+
+        def submit():
+            # the checkpointed windows are skipped until a window has to be queried
+            for pos, (props, idx, num, name) in windows:
+                if name is None:
+                    futures[executor.submit(fetch, props, idx, num)] = pos, (props, idx, num)
+                    return
+                list_data[pos] = name
+                pbar.update(min(num, size - idx))
+
+        for _ in range(workers):
+            submit()
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                pos, (props, idx, num) = futures.pop(future)
+                try:
+                    res, elapsed = future.result()
+                    list_data[pos] = res
+                    num_of_rows += res.shape[0]
+                    if checkpoint is not None:
+                        checkpoint.save(props, idx, idx + num, res)
+                    if adaptive:
+                        adapt(elapsed, res.shape[0])
+                except Exception as error:
+                    list_data[pos] = None
+                    failed.append((props, idx, num))
+                    if checkpoint is not None:
+                        checkpoint.fail(props, idx, idx + num, error)
+                    print(f"Something wrong in collecting the values of {' '.join(props)} for the instances {idx} to {idx+num}: {error}")
+                pbar.set_postfix(rows=num_of_rows, window=current['window_size'], failed=len(failed))
+                pbar.update(min(num, size - idx))
+                submit()
+
+            yield from release()
+
+        yield from release()
+
+    if failed:
+        print(f"{len(failed)} windows failed and their values are missing, "
+              f"{'rerun with --resume to collect only them' if checkpoint is not None else 'rerun to collect them'}")
+
+
+def get_data_prop(df, prop_list, sparql_endpoint, **kwargs):
+    """
+    Query the property value given all the instances to be validated.
+
+    Parameters
+    ----------
+    df : DataFrame
+        A table containing all the instances to be validated
+    prop_list : list
+        A list of properties to be checked
+    sparql_endpoint : str
+        A SPARQL API endpoint 
+    **kwargs
+        Keyword arguments passed to iter_data_prop, such as window_size and workers
+
+    Returns
+    -------
+    DataFrame
+        A table consisting of all the properties of instances along with their values
+    """
+
+    list_data = [compact_data_prop(window) for window in iter_data_prop(df, prop_list, sparql_endpoint, **kwargs)]
+    return concat_data_prop(list_data)
+
+
+def compact_data_prop(data_prop):
+    """
+    Store the columns of the properties as categoricals, so every distinct term
+    is kept once and each row only holds integer codes.
+
+    Parameters
+    ----------
+    data_prop : DataFrame
+        A table of the properties of the instances along with their values
+
+    Returns
+    -------
+    DataFrame
+        The same table with categorical columns
+    """
+
+    # the categories are always objects, as an empty column would not get the same dtype
+    # and the windows could not be joined
+    compacted = data_prop.copy()
+    for column in data_prop.columns:
+        if column in DATA_PROP_COLUMNS:
+            values = data_prop[column]
+            compacted[column] = pd.Categorical(values, categories=pd.Index(values.dropna().unique(), dtype=object))
+    return compacted
+
+
+def concat_data_prop(list_data):
+    from pandas.api.types import union_categoricals
+
+    # pd.concat turns categoricals with different categories back into strings
+    if not list_data:
+        return pd.DataFrame(columns=DATA_PROP_COLUMNS)
+
+    columns = list(dict.fromkeys(column for data_prop in list_data for column in data_prop.columns))
+    concatenated = {}
+    for column in columns:
+        # a window without the column, i.e. without any datatype, gets an empty categorical of objects
+        parts = [data_prop[column] if column in data_prop.columns else
+                 pd.Series(pd.Categorical([None] * len(data_prop), categories=pd.Index([], dtype=object)), index=data_prop.index)
+                 for data_prop in list_data]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            concatenated[column] = union_categoricals(parts, ignore_order=True)
+        else:
+            concatenated[column] = pd.concat(parts, ignore_index=True)
+
+    return pd.DataFrame(concatenated)
 
 
-def retrieve_data(filename, sparql_endpoint):
+def paginate_query(query, page_size, offset=0, after=None):
+    """
+    Wrap a query of entities so it returns one page of its result ordered by ?entity.
+
+    Parameters
+    ----------
+    query : str
+        A SPARQL query binding ?entity
+    page_size : int
+        A number of rows of a page
+    offset : int, optional
+        A number of rows skipped before the page (default is 0)
+    after : str, optional
+        An entity IRI the page starts after, for keyset pagination (default is None)
+
+    Returns
+    -------
+    str
+        A query of the page
+    """
+
+    prologue = QUERY_PROLOGUE.match(query).group(0)
+    keyset = ""
+    if after is not None:
+        after = after.replace('\\', '\\\\').replace('"', '\\"')
+        keyset = f'FILTER(STR(?entity) > "{after}")'
+
+    return f"""{prologue}
+SELECT * WHERE {{
+    {{
+{query[len(prologue):].strip()}
+    }}
+    {keyset}
+}}
+ORDER BY STR(?entity)
+LIMIT {page_size}
+OFFSET {offset}
+"""
+
+
+def iter_pages(query, sparql_endpoint, page_size=10000, workers=1, pagination='offset'):
+    """
+    Query the entities page by page, so the result is not truncated by the
+    row limit of the endpoint.
+
+    With offset pagination, workers pages are fetched at the same time. If a
+    page is shorter than page_size while the rows after it are not empty, the
+    endpoint caps its results, and the pages continue with the size of the cap.
+    With keyset pagination, each page starts after the last entity of the
+    previous one.
+
+    Parameters
+    ----------
+    query : str
+        A SPARQL query binding ?entity
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    page_size : int, optional
+        A number of rows of a page (default is 10000)
+    workers : int, optional
+        A number of pages fetched at the same time with offset pagination (default is 1)
+    pagination : str, optional
+        'offset' or 'keyset' (default is 'offset')
+
+    Yields
+    ------
+    DataFrame
+        A page of the result without the entities of the previous pages
+    """
+
+    seen = set()
+    columns = None
+
+    def deduplicate(page):
+        nonlocal columns
+        if columns is None:
+            columns = binding_columns(dict.fromkeys(col.split('.')[0] for col in page.columns))
+        page = page.reindex(columns=columns)
+        page = page[~page['entity.value'].isin(seen)].drop_duplicates('entity.value')
+        seen.update(page['entity.value'])
+        return page
+
+    from tqdm import tqdm
+
+    with tqdm(unit="entity", desc="Retrieving the pages of entities") as pbar:
+        if pagination == 'keyset':
+            after = None
+            while True:
+                page = query_sparql(paginate_query(query, page_size, after=after), sparql_endpoint)
+                if page.empty:
+                    break
+                after = page['entity.value'].iloc[-1]
+                page = deduplicate(page)
+                pbar.update(page.shape[0])
+                yield page
+            return
+
+        next_offset = 0
+        finished = False
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while not finished:
+                offsets = [next_offset + idx * page_size for idx in range(workers)]
+                results = list(executor.map(
+                    lambda offset: query_sparql(paginate_query(query, page_size, offset), sparql_endpoint),
+                    offsets))
+
+                next_offset += workers * page_size
+                for idx, page in enumerate(results):
+                    num_of_rows = page.shape[0]
+                    if not page.empty:
+                        page = deduplicate(page)
+                        pbar.update(page.shape[0])
+                        yield page
+
+                    if num_of_rows < page_size:
+                        # a short page followed by more rows means a capped endpoint,
+                        # so the rows right after it are queried before the last page is assumed
+                        next_offset = offsets[idx] + num_of_rows
+                        if num_of_rows and not query_sparql(paginate_query(query, 1, next_offset), sparql_endpoint).empty:
+                            print(f"The endpoint returns at most {num_of_rows} rows, continue with pages of {num_of_rows} rows")
+                            page_size = num_of_rows
+                        else:
+                            finished = True
+                        break
+
+
+def retrieve_data(filename, sparql_endpoint, stream=False, batch_size=10000, page_size=None,
+                  workers=1, pagination='offset'):
     with open(filename, 'r') as file:
         query = file.read()
 
     print("Retrieving data ...")
-    data = query_sparql(query, sparql_endpoint)
-    data['entity'] = data['entity.value'].apply(lambda x: f"<{x}>")
-    data.to_csv("data.csv")
+    if page_size or stream:
+        # write the pages or batches while they are received and keep only the entities
+        if page_size:
+            batches = iter_pages(query, sparql_endpoint, page_size, workers, pagination)
+        else:
+            batches = query_sparql_batches(query, sparql_endpoint, batch_size)
+        if write_batches((add_entity_column(batch) for batch in batches), "data.csv"):
+            data = pd.read_csv("data.csv", usecols=['entity.value', 'entity'])
+        else:
+            # without any entity not even the header is written
+            data = add_entity_column(pd.DataFrame(columns=['entity.value']))
+            data.to_csv("data.csv")
+    else:
+        data = add_entity_column(query_sparql(query, sparql_endpoint))
+        data.to_csv("data.csv")
     print("Succesfully retrieve data")
     return data
 
 
-def retrieve_data_prop(data, prop_list, sparql_endpoint):
+def add_entity_column(data):
+    data['entity'] = data['entity.value'].apply(lambda x: f"<{x}>")
+    return data
+
+
+def retrieve_data_prop(data, prop_list, sparql_endpoint, stream=False, batch_size=10000, **kwargs):
     print("Retrieving properties of data ...")
-    data_prop = get_data_prop(data, prop_list, sparql_endpoint)
-    data_prop.to_csv('data_prop.csv')
+    if stream:
+        # write the windows while they are received and read them back in chunks
+        write_batches(iter_data_prop(data, prop_list, sparql_endpoint, **kwargs), 'data_prop.csv')
+        data_prop = pd.read_csv('data_prop.csv', index_col=0, chunksize=batch_size,
+                                **{**DATA_PROP_CSV_OPTIONS, 'dtype': {column: 'category' for column in DATA_PROP_COLUMNS}})
+    else:
+        data_prop = get_data_prop(data, prop_list, sparql_endpoint, **kwargs)
+        data_prop.to_csv('data_prop.csv')
     print("Succesfully retrieve data properties")
     return data_prop
 
-def construct_data_graph(data, data_prop, entity_class):
-    # convert data into data graph
-    data_graph = Graph()
+def format_iri(values):
+    """
+    Format a column of IRIs as N-Triples terms.
+
+    Parameters
+    ----------
+    values : Series
+        A column of IRIs
+
+    Returns
+    -------
+    Series
+        A column of N-Triples IRIs
+    """
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # format every distinct IRI once
+        categories = format_iri(pd.Series(values.cat.categories, dtype=object)).to_numpy()
+        codes = values.cat.codes.to_numpy()
+        return pd.Series(np.where(codes >= 0, categories[codes], '<nan>'), index=values.index, dtype=object)
+
+    values = values.astype(str)
+    if values.str.contains(IRI_ESCAPE.pattern, regex=True).any():
+        values = values.str.replace(IRI_ESCAPE.pattern, lambda match: f"\\u{ord(match.group(0)):04X}", regex=True)
+    return '<' + values + '>'
+
+
+def format_terms(values, types, langs, datatypes):
+    """
+    Format a column of SPARQL JSON values as N-Triples terms.
+
+    Parameters
+    ----------
+    values : Series
+        A column of values, i.e. o.value
+    types : Series
+        A column of value types, i.e. o.type
+    langs : Series
+        A column of language tags, i.e. o.xml:lang
+    datatypes : Series
+        A column of datatypes, i.e. o.datatype
+
+    Returns
+    -------
+    Series
+        A column of N-Triples terms
+    """
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # format every distinct combination of value, type, language tag and datatype once
+        codes, uniques = pd.factorize(pd.MultiIndex.from_arrays([values, types, langs, datatypes]))
+        terms = format_terms(*(pd.Series(uniques.get_level_values(level), dtype=object) for level in range(4)))
+        return pd.Series(terms.to_numpy()[codes], index=values.index, dtype=object)
+
+    values = values.fillna('').astype(str)
+    langs = langs.where(langs != 'not specified')
+    is_literal = types.isin(['literal', 'typed-literal'])
+    is_bnode = types == 'bnode'
+    is_iri = ~is_literal & ~is_bnode
+
+    terms = pd.Series('', index=values.index, dtype=object)
+    terms[is_iri] = format_iri(values[is_iri])
+    terms[is_bnode] = '_:' + values[is_bnode].str.replace(r'[^A-Za-z0-9_]', '_', regex=True)
+
+    # escape the literals and append their language tag or datatype
+    literals = values[is_literal]
+    for char, escaped in LITERAL_ESCAPE:
+        literals = literals.str.replace(char, escaped, regex=False)
+    literals = '"' + literals + '"'
+
+    has_lang = langs[is_literal].notna()
+    has_datatype = datatypes[is_literal].notna() & ~has_lang
+    literals[has_lang] = literals[has_lang] + '@' + langs[is_literal][has_lang].astype(str)
+    literals[has_datatype] = literals[has_datatype] + '^^' + format_iri(datatypes[is_literal][has_datatype])
+    terms[is_literal] = literals
+
+    return terms
+
+
+def to_term(value, value_type, lang, datatype):
+    """
+    Convert a SPARQL JSON value into an RDFLib term.
+
+    Parameters
+    ----------
+    value : str
+        A value, i.e. o.value
+    value_type : str
+        A type of the value, i.e. o.type
+    lang : str
+        A language tag, i.e. o.xml:lang
+    datatype : str
+        A datatype, i.e. o.datatype
+
+    Returns
+    -------
+    Identifier
+        A URIRef, Literal or BNode
+    """
+
+    if value_type in ('literal', 'typed-literal'):
+        value = '' if pd.isna(value) else str(value)
+        if not pd.isna(lang) and lang != 'not specified':
+            return rdflib.Literal(value, lang=lang)
+        if not pd.isna(datatype):
+            return rdflib.Literal(value, datatype=datatype)
+        return rdflib.Literal(value)
+    if value_type == 'bnode':
+        return rdflib.BNode(value)
+    return rdflib.URIRef(value)
+
+
+def iter_chunks(data_prop):
+    # the properties may come as one table or in chunks
+    return [data_prop] if isinstance(data_prop, pd.DataFrame) else data_prop
+
+
+def build_data_graph(data, data_prop, entity_class):
+    """
+    Build the data graph in memory from all the collected data.
+
+    Parameters
+    ----------
+    data : DataFrame
+        A table containing all the instances to be validated
+    data_prop : DataFrame or iterable
+        A table, or chunks of a table, of the properties of the instances along with their values
+    entity_class : str
+        An URI of the class of the instances
+
+    Returns
+    -------
+    Graph
+        The data graph
+    """
+
+    data_graph = rdflib.Graph()
 
     # add default namespaces
-    dbo_prefix = Namespace("http://dbpedia.org/ontology/")
-    wd_prefix = Namespace("http://www.wikidata.org/entity/")
+    dbo_prefix = rdflib.Namespace("http://dbpedia.org/ontology/")
+    wd_prefix = rdflib.Namespace("http://www.wikidata.org/entity/")
     data_graph.bind("dbo", dbo_prefix)
     data_graph.bind("wd", wd_prefix)
 
     # add instance relation for all entities
-    # only used for checking with target for a certain class
-    # if not, just skip it
-    for _, row in data.iterrows():
-        s = URIRef(row['entity.value'])
-        p = URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#type')
-        o = URIRef(entity_class)
-        data_graph.add((s, p, o))
+    p = rdflib.RDF.type
+    o = rdflib.URIRef(entity_class)
+    data_graph.addN((rdflib.URIRef(s), p, o, data_graph) for s in data['entity.value'])
 
     # add node-property relation for all entities
-    for _, row in data_prop.iterrows():
-        s = URIRef(row['s.value'])
-        p = URIRef(row['p.value'])
-        if row['o.type'] == 'literal':
-            if row['o.xml:lang'] == 'not specified':
-                o = o = Literal(row['o.value'])
-            else:
-                o = Literal(row['o.value'], lang=row['o.xml:lang'])
-        elif row['o.type'] == 'typed-literal':
-            o = Literal(row['o.value'], datatype=row['o.datatype'])
-        else:
-            o = URIRef(row['o.value'])
-        data_graph.add((s, p, o))
+    for chunk in iter_chunks(data_prop):
+        data_graph.addN(
+            (rdflib.URIRef(s), rdflib.URIRef(p), to_term(value, value_type, lang, datatype), data_graph)
+            for s, p, value, value_type, lang, datatype in zip(
+                chunk['s.value'], chunk['p.value'], chunk['o.value'], chunk['o.type'],
+                chunk.get('o.xml:lang', pd.Series(index=chunk.index, dtype=object)),
+                chunk.get('o.datatype', pd.Series(index=chunk.index, dtype=object))))
+
+    return data_graph
+
+
+def construct_data_graph(data, data_prop, entity_class, destination="data_graph.ttl", snapshot=None, append=False):
+    """
+    Write the data graph from all the collected data as N-Triples, which is
+    also valid Turtle, without building the graph in memory, and optionally
+    as a binary snapshot loaded by validate_completeness without parsing.
+
+    Parameters
+    ----------
+    data : DataFrame
+        A table containing all the instances to be validated
+    data_prop : DataFrame or iterable
+        A table, or chunks of a table, of the properties of the instances along with their values
+    entity_class : str
+        An URI of the class of the instances
+    destination : str, optional
+        A file path of the data graph (default is data_graph.ttl)
+    snapshot : str, optional
+        A directory of the snapshot of the data graph, no snapshot if None (default is None)
+    append : bool, optional
+        A boolean value to append the triples to the data graph, i.e. of another
+        chunk of entities (default is False)
 
-    data_graph.serialize(destination="data_graph.ttl", format='turtle')
+    Returns
+    -------
+    int
+        A number of written triples
+    """
+
+    num_of_triples = 0
+    columns = []
+    with open(destination, 'a' if append else 'w', encoding='utf-8') as file:
+        # add instance relation for all entities
+        # only used for checking with target for a certain class
+        subjects = format_iri(data['entity.value'])
+        predicate = f"<{RDF_TYPE}>"
+        entity_object = format_iri(pd.Series([entity_class])).iloc[0]
+        lines = (subjects + f" {predicate} {entity_object} .\n").drop_duplicates()
+        file.write(''.join(lines))
+        num_of_triples += lines.shape[0]
+        if snapshot is not None:
+            columns.append((subjects, pd.Series(predicate, index=subjects.index), pd.Series(entity_object, index=subjects.index)))
+
+        # add node-property relation for all entities
+        for chunk in iter_chunks(data_prop):
+            subjects = format_iri(chunk['s.value'])
+            predicates = format_iri(chunk['p.value'])
+            objects = format_terms(chunk['o.value'], chunk['o.type'],
+                                   chunk.get('o.xml:lang', pd.Series(index=chunk.index, dtype=object)),
+                                   chunk.get('o.datatype', pd.Series(index=chunk.index, dtype=object)))
+            lines = (subjects + ' ' + predicates + ' ' + objects + ' .\n').drop_duplicates()
+            file.write(''.join(lines))
+            num_of_triples += lines.shape[0]
+            if snapshot is not None:
+                columns.append((subjects, predicates, objects))
+
+    if snapshot is not None:
+        write_snapshot(*(pd.concat(column, ignore_index=True) for column in zip(*columns)), snapshot,
+                       {"dbo": "http://dbpedia.org/ontology/", "wd": "http://www.wikidata.org/entity/"})
+
+    return num_of_triples
 
 
-if __name__ == "__main__": 
-    parser = argparse.ArgumentParser(allow_abbrev=False,
+def build_parser(prog=None):
+    parser = argparse.ArgumentParser(prog=prog, allow_abbrev=False,
                                         description="Arguments for preparing data to be validated")
     required = parser.add_argument_group('required arguments')
 
@@ -153,18 +883,88 @@ if __name__ == "__main__":
     required.add_argument("--sparql_endpoint", type=str, required=True,
                             help="A string of SPARQL endpoint URL")
     required.add_argument("--class_uri", type=str, required=True,
-                            help="An URI of target class")
+                            help="An URI of target class, as an IRI or a prefixed name such as dbo:Country")
     required.add_argument("--prop_list", type=str, required=True, nargs="+",
                             help="A list of properties to be checked for each entity")
+    parser.add_argument("--window_size", type=int, default=50,
+                            help="A number of entities used in one query (default is 50)")
+    parser.add_argument("--workers", type=int, default=1,
+                            help="A number of queries sent to the endpoint at the same time (default is 1)")
+    parser.add_argument("--rate_limit", type=float, default=None,
+                            help="A maximum number of queries per second sent to the endpoint (default is no limit)")
+    parser.add_argument("--cache_dir", "--cache-dir", type=str, default=".sparql-cache",
+                            help="A directory of the cache of query results (default is .sparql-cache)")
+    parser.add_argument("--cache_ttl", type=float, default=24,
+                            help="A number of hours a cached query result stays valid (default is 24)")
+    parser.add_argument("--no_cache", "--no-cache", action="store_true",
+                            help="Always query the endpoint instead of the cache")
+    parser.add_argument("--merge_props", action="store_true",
+                            help="Query all the properties of a window of entities in one query")
+    parser.add_argument("--adaptive_window", action="store_true",
+                            help="Adapt the window size to the response time and size of the endpoint")
+    parser.add_argument("--page_size", type=int, default=None,
+                            help="A number of entities retrieved in one page, no pagination if not given")
+    parser.add_argument("--pagination", type=str, default="offset", choices=["offset", "keyset"],
+                            help="A pagination of the entities, offset pages are fetched in parallel (default is offset)")
+    parser.add_argument("--stream", action="store_true",
+                            help="Parse the query results while they are received and write them in batches")
+    parser.add_argument("--batch_size", type=int, default=10000,
+                            help="A number of rows in one batch of a streamed result (default is 10000)")
+    parser.add_argument("--checkpoint_dir", type=str, default=".checkpoints",
+                            help="A directory the collected windows are written to as they finish (default is .checkpoints)")
+    parser.add_argument("--resume", action="store_true",
+                            help="Reuse data.csv and the checkpointed windows of an interrupted run and collect only the missing windows")
+    parser.add_argument("--snapshot", action="store_true",
+                            help="Also write the data graph as a binary snapshot in data_graph.snap, loaded by the validation without parsing")
 
-    args = parser.parse_args()
+    add_metrics_arguments(parser)
+
+    return parser
+
+
+def main(argv=None, prog=None):
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+    start_metrics(args)
     filename = args.query_file
     sparql_endpoint = args.sparql_endpoint
-    class_uri = args.class_uri
+    class_uri = expand_class_uri(args.class_uri)
     prop_list = args.prop_list
 
-    data = retrieve_data(filename, sparql_endpoint)
-    data_prop = retrieve_data_prop(data, prop_list, sparql_endpoint)
+    configure_cache(None if args.no_cache else args.cache_dir, ttl=args.cache_ttl * 3600)
+    with stage('retrieve_data') as record:
+        if args.resume and os.path.exists("data.csv"):
+            # the windows of the checkpoints refer to the same entities
+            data = pd.read_csv("data.csv", usecols=['entity.value', 'entity'])
+        else:
+            data = retrieve_data(filename, sparql_endpoint, args.stream, args.batch_size,
+                                    page_size=args.page_size,
+                                    workers=args.workers,
+                                    pagination=args.pagination)
+        record['items'] = data.shape[0]
+    checkpoint = WindowCheckpoint(args.checkpoint_dir, data['entity.value'], resume=args.resume)
+    with stage('retrieve_data_prop') as record:
+        data_prop = retrieve_data_prop(data, prop_list, sparql_endpoint,
+                                        stream=args.stream,
+                                        batch_size=args.batch_size,
+                                        window_size=args.window_size,
+                                        workers=args.workers,
+                                        rate_limit=args.rate_limit,
+                                        merge_props=args.merge_props,
+                                        adaptive=args.adaptive_window,
+                                        checkpoint=checkpoint)
+        if isinstance(data_prop, pd.DataFrame):
+            record['items'] = data_prop.shape[0]
+
+    # the checkpoints are only kept to collect the failed windows
+    if not checkpoint.missing():
+        checkpoint.clear()
 
     # create data graph
-    construct_data_graph(data, data_prop, class_uri)
+    with stage('construct_data_graph') as record:
+        record['items'] = construct_data_graph(data, data_prop, class_uri,
+                                               snapshot=snapshot_path("data_graph.ttl") if args.snapshot else None)
+
+
+if __name__ == "__main__":
+    main()
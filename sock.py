@@ -0,0 +1,50 @@
+import sys
+import argparse
+import importlib
+
+
+# the commands and the scripts running them, a script is only imported when its command is run
+COMMANDS = {
+    'prepare': ('prepare_data', "Retrieve the entities and their property values, and construct the data graph"),
+    'generate': ('generate_shapes', "Generate a shapes graph from a spreadsheet, the ontology or the statistics of a class"),
+    'validate': ('validate_completeness', "Validate the completeness of the data graph against the shapes graph"),
+    'pipeline': ('pipeline', "Collect, build and validate the entities chunk by chunk without intermediate files"),
+    'serve': ('validation_service', "Serve the completeness validation of entities over HTTP"),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="sock", allow_abbrev=False,
+                                        description="SoCK, SHACL on Completeness Knowledge")
+    subparsers = parser.add_subparsers(dest='command', metavar='command', title='commands')
+    for command, (_, description) in COMMANDS.items():
+        subparsers.add_parser(command, help=description, add_help=False)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Run a command of SoCK with the arguments of its script, i.e.
+    sock generate spreadsheet --file shapes.csv ...
+
+    Parameters
+    ----------
+    argv : list, optional
+        The arguments of the command, the arguments of the process if None (default is None)
+    """
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in COMMANDS:
+        module = importlib.import_module(COMMANDS[argv[0]][0])
+        return module.main(argv[1:], prog=f"sock {argv[0]}")
+
+    # no command or an unknown one
+    parser = build_parser()
+    parser.parse_args(argv)
+    parser.print_help()
+    sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,612 @@
+import os
+import re
+import gzip
+import json
+import codecs
+import time
+import zlib
+import random
+import socket
+import struct
+import hashlib
+import bisect
+import threading
+import http.client
+
+from collections import deque, namedtuple
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, urljoin, urlencode
+
+
+QueryStats = namedtuple('QueryStats', ['attempts', 'latency', 'elapsed', 'bytes'])
+
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+TIMEOUT_STATUS = {408, 504}
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+
+# upper bounds in seconds of the buckets of the latency histogram, the last bucket is unbounded
+LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+BINDINGS_START = re.compile(r'"bindings"\s*:\s*\[')
+HEAD_VARS = re.compile(r'"vars"\s*:\s*(\[[^\]]*\])')
+SEPARATOR = re.compile(r'[\s,]*')
+
+# string literals and IRIs are kept as they are, whitespaces and comments are collapsed into a space
+QUERY_TOKEN = re.compile(r'"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^\'\\]|\\.|\'(?!\'\'))*\'\'\'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|<[^<>"{}|^`\\\s]*>|(?:\s|#[^\n]*)+')
+
+
+class QueryError(Exception):
+    """Raised when a SPARQL query fails and is not retried anymore."""
+
+
+class QueryBadFormed(QueryError):
+    """Raised when the endpoint rejects a query, e.g. because of a syntax error."""
+
+
+class QueryTimeout(QueryError):
+    """Raised when a SPARQL query exceeds the time limit of the client or the endpoint."""
+
+
+class RateLimiter:
+    """
+    Limit the number of requests sent to a SPARQL endpoint per second.
+
+    The limiter is shared by all the worker threads, so the rate holds for
+    the endpoint as a whole instead of for each worker.
+
+    Parameters
+    ----------
+    rate : float, optional
+        A maximum number of requests per second, no limit if None (default is None)
+    """
+
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        # reserve the next free slot and sleep until it comes
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0, slot - now))
+
+
+class SparqlClient:
+    """
+    A client of one SPARQL endpoint reusing its HTTP connections.
+
+    Every thread keeps its own keep-alive connection to the endpoint. Failed
+    queries are retried with an exponential backoff with full jitter, the
+    backoff follows the Retry-After header of the endpoint, and a query gives
+    up after max_attempts attempts or deadline seconds. Rejected queries, such
+    as syntax errors, are not retried.
+
+    Parameters
+    ----------
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    max_attempts : int, optional
+        A maximum number of attempts of a query (default is 8)
+    deadline : float, optional
+        A maximum number of seconds spent on a query including the retries,
+        no limit if None (default is 900)
+    base_delay : float, optional
+        A number of seconds of the first backoff (default is 1)
+    max_delay : float, optional
+        A maximum number of seconds of one backoff (default is 60)
+    timeout : float, optional
+        A number of seconds to wait for the endpoint to respond (default is 300)
+    """
+
+    def __init__(self, sparql_endpoint, max_attempts=8, deadline=900, base_delay=1, max_delay=60, timeout=300):
+        self.sparql_endpoint = sparql_endpoint
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.history = deque(maxlen=10000)
+        self.stats = {'queries': 0, 'retries': 0, 'failures': 0, 'cache_hits': 0, 'latency': 0.0, 'bytes': 0}
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.set_url(sparql_endpoint)
+
+    def set_url(self, url):
+        self.url = urlsplit(url)
+        self.generation = getattr(self, 'generation', 0) + 1
+
+    def connection(self, timeout):
+        # reuse the connection of the thread unless the endpoint moved
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.generation != self.generation:
+            if conn is not None:
+                conn.close()
+            if self.url.scheme == 'https':
+                conn = http.client.HTTPSConnection(self.url.netloc, timeout=timeout)
+            else:
+                conn = http.client.HTTPConnection(self.url.netloc, timeout=timeout)
+            self.local.conn = conn
+            self.local.generation = self.generation
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def reset(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        self.local.conn = None
+
+    def send(self, query, timeout, stream=False):
+        """
+        Send a query once.
+
+        Returns
+        -------
+        (int, dict, bytes, HTTPResponse)
+            status, headers, and body of the response, the body is None and the
+            response is left unread when a successful response is streamed
+        """
+
+        body = urlencode({'query': query}).encode()
+        headers = {
+            'Accept': 'application/sparql-results+json',
+            'Accept-Encoding': 'gzip',
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'User-Agent': 'sock-validator',
+        }
+        path = self.url.path or '/'
+        if self.url.query:
+            path += '?' + self.url.query
+
+        # a kept-alive connection may have been closed by the endpoint in the meantime
+        for is_retry in (False, True):
+            conn = self.connection(timeout)
+            reused = conn.sock is not None
+            try:
+                conn.request('POST', path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = None if stream and response.status == 200 else response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.reset()
+                if is_retry or not reused:
+                    raise
+
+        headers = {key.lower(): value for key, value in response.getheaders()}
+        if data is None:
+            # the stream owns the connection until it is read to the end
+            self.local.conn = None
+            return response.status, headers, None, response
+
+        if headers.get('content-encoding') == 'gzip':
+            data = gzip.decompress(data)
+        if response.will_close:
+            self.reset()
+
+        return response.status, headers, data, response
+
+    def backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def query(self, query, timeout=None, use_cache=True):
+        """
+        Run a query, answered from the result cache when it holds the query.
+
+        Parameters
+        ----------
+        query : str
+            A SPARQL query to be run
+        timeout : float, optional
+            A number of seconds to wait for the result, if given a timeout raises
+            QueryTimeout instead of retrying the query (default is None)
+        use_cache : bool, optional
+            A boolean value to read and write the result cache, if configured (default is True)
+
+        Returns
+        -------
+        dict
+            The SPARQL JSON results
+        """
+
+        cache = result_cache if use_cache else None
+        if cache is not None:
+            data = cache.get(self.sparql_endpoint, query)
+            if data is not None:
+                with self.lock:
+                    self.stats['cache_hits'] += 1
+                return json.loads(data)
+
+        data = self.fetch(query, timeout)
+        if cache is not None:
+            cache.put(self.sparql_endpoint, query, data)
+        return json.loads(data)
+
+    def stream(self, query, timeout=None):
+        """
+        Run a query and parse its bindings while the result is being received.
+
+        The query is retried as long as no result has been received, streamed
+        results are not cached.
+
+        Parameters
+        ----------
+        query : str
+            A SPARQL query to be run
+        timeout : float, optional
+            A number of seconds to wait for the endpoint, if given a timeout raises
+            QueryTimeout instead of retrying the query (default is None)
+
+        Returns
+        -------
+        (list, generator)
+            the variables of the result, and a generator of its bindings
+        """
+
+        response = self.fetch(query, timeout, stream=True)
+        return parse_bindings(self.read_chunks(response))
+
+    def read_chunks(self, response, chunk_size=2**16):
+        decompressor = None
+        if response.getheader('Content-Encoding') == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        num_of_bytes = 0
+        try:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                num_of_bytes += len(chunk)
+                yield decompressor.decompress(chunk) if decompressor else chunk
+            if decompressor:
+                yield decompressor.flush()
+        finally:
+            response.close()
+            with self.lock:
+                self.stats['bytes'] += num_of_bytes
+
+    def fetch(self, query, timeout=None, stream=False):
+        """
+        Run a query on the endpoint with retries.
+
+        Parameters
+        ----------
+        query : str
+            A SPARQL query to be run
+        timeout : float, optional
+            A number of seconds to wait for the result, if given a timeout raises
+            QueryTimeout instead of retrying the query (default is None)
+        stream : bool, optional
+            A boolean value to return the unread response instead of its body (default is False)
+
+        Returns
+        -------
+        bytes
+            The SPARQL JSON results as sent by the endpoint, or the HTTPResponse if streamed
+        """
+
+        start = time.monotonic()
+        attempt = 0
+        num_of_bytes = 0
+        redirects = 0
+
+        while True:
+            attempt += 1
+            sent = time.monotonic()
+            retry_after = None
+
+            try:
+                status, headers, data, response = self.send(query, timeout or self.timeout, stream)
+                num_of_bytes += len(data) if data is not None else 0
+            except (socket.timeout, TimeoutError) as error:
+                self.reset()
+                if timeout is not None:
+                    self.record(attempt, time.monotonic() - sent, start, num_of_bytes, failed=True)
+                    raise QueryTimeout(f"The query timed out after {timeout} seconds") from error
+                reason = error
+            except (OSError, http.client.HTTPException) as error:
+                self.reset()
+                reason = error
+            else:
+                if status == 200:
+                    self.record(attempt, time.monotonic() - sent, start, num_of_bytes)
+                    return data if not stream else response
+
+                # follow the endpoint when it moved
+                if status in REDIRECT_STATUS and 'location' in headers and redirects < 5:
+                    redirects += 1
+                    attempt -= 1
+                    self.set_url(urljoin(self.url.geturl(), headers['location']))
+                    continue
+
+                message = data.decode('utf-8', errors='replace')[:500]
+                is_timeout = status in TIMEOUT_STATUS or 'timed out' in message.lower() or 'timeout' in message.lower()
+
+                if status not in RETRY_STATUS:
+                    self.record(attempt, time.monotonic() - sent, start, num_of_bytes, failed=True)
+                    if status == 400:
+                        raise QueryBadFormed(f"The endpoint rejected the query: {message}")
+                    raise QueryError(f"The endpoint responded with HTTP {status}: {message}")
+                if is_timeout and timeout is not None:
+                    self.record(attempt, time.monotonic() - sent, start, num_of_bytes, failed=True)
+                    raise QueryTimeout(f"The endpoint timed out: {message}")
+
+                retry_after = parse_retry_after(headers.get('retry-after'))
+                reason = f"HTTP {status}"
+
+            # give up when out of attempts or time
+            delay = self.backoff(attempt - 1, retry_after)
+            elapsed = time.monotonic() - start
+            if attempt >= self.max_attempts or (self.deadline is not None and elapsed + delay > self.deadline):
+                self.record(attempt, time.monotonic() - sent, start, num_of_bytes, failed=True)
+                raise QueryError(f"The query failed after {attempt} attempts: {reason}")
+            time.sleep(delay)
+
+    def record(self, attempts, latency, start, num_of_bytes, failed=False):
+        stats = QueryStats(attempts, latency, time.monotonic() - start, num_of_bytes)
+        with self.lock:
+            self.history.append(stats)
+            self.stats['queries'] += 1
+            self.stats['retries'] += attempts - 1
+            self.stats['failures'] += failed
+            self.stats['latency'] += latency
+            self.stats['bytes'] += num_of_bytes
+            self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        return stats
+
+
+def parse_bindings(chunks):
+    """
+    Parse the bindings of SPARQL JSON results incrementally.
+
+    Parameters
+    ----------
+    chunks : iterable
+        An iterable of bytes of the results
+
+    Returns
+    -------
+    (list, generator)
+        the variables of the result, and a generator of its bindings
+    """
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    texts = (decoder.decode(chunk) for chunk in chunks)
+
+    # read until the list of bindings starts
+    buffer = ''
+    for text in texts:
+        buffer += text
+        start = BINDINGS_START.search(buffer)
+        if start:
+            break
+    else:
+        raise QueryError("The endpoint did not send any SPARQL JSON results")
+
+    head = HEAD_VARS.search(buffer, 0, start.start())
+    head_vars = json.loads(head.group(1)) if head else []
+
+    def bindings(buffer, pos):
+        json_decoder = json.JSONDecoder()
+        while True:
+            pos = SEPARATOR.match(buffer, pos).end()
+            if pos < len(buffer) and buffer[pos] == ']':
+                return
+
+            # decode the next binding, read more when it is not complete yet
+            try:
+                if pos == len(buffer):
+                    raise json.JSONDecodeError("Expecting value", buffer, pos)
+                binding, pos = json_decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                text = next(texts, None)
+                if text is None:
+                    raise QueryError("The SPARQL JSON results ended unexpectedly")
+                buffer = buffer[pos:] + text
+                pos = 0
+                continue
+
+            yield binding
+            if pos > 2**16:
+                buffer = buffer[pos:]
+                pos = 0
+
+    return head_vars, bindings(buffer, start.end())
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header given in seconds or as an HTTP date.
+
+    Parameters
+    ----------
+    value : str
+        A value of the header, or None
+
+    Returns
+    -------
+    float
+        A number of seconds to wait, or None
+    """
+
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ResultCache:
+    """
+    A persistent on-disk cache of SPARQL results.
+
+    A result is stored under the hash of its endpoint and normalized query
+    text, as the zlib-compressed response prefixed by its creation time.
+    Results older than ttl seconds are ignored, and the least recently used
+    results are evicted once the cache grows over max_size bytes.
+
+    Parameters
+    ----------
+    cache_dir : str
+        A directory of the cache
+    ttl : float, optional
+        A number of seconds a result stays valid, forever if None (default is 86400)
+    max_size : int, optional
+        A maximum number of bytes of the cache (default is 1 GiB)
+    """
+
+    header = struct.Struct('<d')
+
+    def __init__(self, cache_dir, ttl=86400, max_size=2**30):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.size = None
+
+    def path(self, sparql_endpoint, query):
+        key = hashlib.sha256(f"{sparql_endpoint}\n{normalize_query(query)}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, sparql_endpoint, query):
+        path = self.path(sparql_endpoint, query)
+        try:
+            with open(path, 'rb') as file:
+                created, = self.header.unpack(file.read(self.header.size))
+                if self.ttl is not None and time.time() - created > self.ttl:
+                    return None
+                data = zlib.decompress(file.read())
+        except (OSError, struct.error, zlib.error):
+            return None
+
+        # the modification time tracks the last use for the eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, sparql_endpoint, query, data):
+        path = self.path(sparql_endpoint, query)
+        blob = self.header.pack(time.time()) + zlib.compress(data)
+
+        # write to a temporary file first so readers never see a partial result
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(blob)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, _, size in self.entries())
+            else:
+                self.size += len(blob)
+            if self.size > self.max_size:
+                self.evict()
+
+    def entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def evict(self):
+        # remove the least recently used results until the cache is below 90% of its size
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        self.size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                continue
+
+
+def normalize_query(query):
+    """
+    Collapse the whitespaces and comments of a query outside its string literals
+    and IRIs, so formatting differences do not miss the cache.
+
+    Parameters
+    ----------
+    query : str
+        A SPARQL query
+
+    Returns
+    -------
+    str
+        The normalized query
+    """
+
+    return QUERY_TOKEN.sub(lambda match: match.group(0) if match.group(0)[0] in '"\'<' else ' ', query).strip()
+
+
+result_cache = None
+
+
+def configure_cache(cache_dir, ttl=86400, max_size=2**30):
+    """
+    Set up the result cache used by every client.
+
+    Parameters
+    ----------
+    cache_dir : str
+        A directory of the cache, the cache is disabled if None
+    ttl : float, optional
+        A number of seconds a result stays valid, forever if None (default is 86400)
+    max_size : int, optional
+        A maximum number of bytes of the cache (default is 1 GiB)
+    """
+
+    global result_cache
+    result_cache = ResultCache(cache_dir, ttl, max_size) if cache_dir else None
+
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+def get_client(sparql_endpoint):
+    """
+    Get the shared client of an endpoint.
+
+    Parameters
+    ----------
+    sparql_endpoint : str
+        A SPARQL API endpoint
+
+    Returns
+    -------
+    SparqlClient
+        The client shared by every query to the endpoint
+    """
+
+    with clients_lock:
+        if sparql_endpoint not in clients:
+            clients[sparql_endpoint] = SparqlClient(sparql_endpoint)
+        return clients[sparql_endpoint]
@@ -0,0 +1,28 @@
+import pandas as pd
+
+from rdflib import Graph
+
+from generate_shapes import combine_shapes_graphs, construct_shapes_graph, shape_names
+
+
+def test_shape_names_are_unique_and_safe_for_files():
+    class_uris = ['dbo:Person', '<http://schema.org/Person>', '<http://dbpedia.org/ontology/Place>', 'wd:Q5']
+    names = shape_names(class_uris)
+
+    assert names['<http://dbpedia.org/ontology/Place>'] == 'Place'
+    assert names['wd:Q5'] == 'Q5'
+    assert names['dbo:Person'] != names['<http://schema.org/Person>']
+    assert all(name.startswith('Person_') for name in (names['dbo:Person'], names['<http://schema.org/Person>']))
+    assert all(name.replace('_', '').isalnum() for name in names.values())
+
+
+def test_combined_shapes_of_classes_with_the_same_local_name():
+    props = pd.DataFrame({'prop.value': ["http://dbpedia.org/ontology/name"], 'cardinality': [1]})
+    class_uris = ['dbo:Person', '<http://schema.org/Person>']
+    names = shape_names(class_uris)
+    shapes_graph = Graph().parse(data=combine_shapes_graphs(
+        construct_shapes_graph(f"{names[class_uri]}SchemaShapes", props, 'prop.value', 'cardinality', class_uri)
+        for class_uri in class_uris), format='turtle')
+
+    targets = dict(shapes_graph.subject_objects(shapes_graph.namespace_manager.expand_curie('sh:targetClass')))
+    assert sorted(str(target) for target in targets.values()) == ["http://dbpedia.org/ontology/Person", "http://schema.org/Person"]
@@ -0,0 +1,247 @@
+import os
+import re
+import sys
+
+import pytest
+import pandas as pd
+
+from rdflib import RDF, BNode, Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import prepare_data
+
+from local_endpoint import serve
+from prepare_data import (DATA_PROP_COLUMNS, WindowCheckpoint, add_entity_column, build_data_graph, compact_data_prop,
+                          concat_data_prop, construct_data_graph, get_data_prop, retrieve_data, retrieve_data_prop)
+
+
+ENTITY_CLASS = "http://dbpedia.org/ontology/Country"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+
+def collected_data_prop():
+    # the values as collected from an endpoint, with the terms that need escaping
+    rows = [
+        ("http://dbpedia.org/resource/A", "http://www.w3.org/2000/01/rdf-schema#label", 'literal', 'Say "hi"', 'en', None),
+        ("http://dbpedia.org/resource/A", "http://www.w3.org/2000/01/rdf-schema#label", 'literal', 'A', 'de', None),
+        ("http://dbpedia.org/resource/A", "http://www.w3.org/2000/01/rdf-schema#comment", 'literal', 'back\\slash', 'not specified', None),
+        ("http://dbpedia.org/resource/A", "http://www.w3.org/2000/01/rdf-schema#comment", 'literal', 'two\nlines\tand\rtab', 'not specified', None),
+        ("http://dbpedia.org/resource/A", "http://dbpedia.org/ontology/populationTotal", 'typed-literal', '42', None, XSD + "integer"),
+        ("http://dbpedia.org/resource/A", "http://dbpedia.org/ontology/foundingDate", 'typed-literal', '1945-08-17', None, XSD + "date"),
+        ("http://dbpedia.org/resource/A", "http://dbpedia.org/ontology/capital", 'uri', "http://dbpedia.org/resource/Jakarta", None, None),
+        ("http://dbpedia.org/resource/B", "http://www.w3.org/2000/01/rdf-schema#label", 'literal', 'Ünïcödé ☃', 'id', None),
+        ("http://dbpedia.org/resource/B", "http://www.w3.org/2000/01/rdf-schema#label", 'literal', '', 'not specified', None),
+        ("http://dbpedia.org/resource/B", "http://dbpedia.org/ontology/capital", 'uri', "http://dbpedia.org/resource/B_(city)", None, None),
+        ("http://dbpedia.org/resource/B", "http://dbpedia.org/ontology/anthem", 'bnode', 'b0', None, None),
+    ]
+    return pd.DataFrame(rows, columns=['s.value', 'p.value', 'o.type', 'o.value', 'o.xml:lang', 'o.datatype'])
+
+
+def iterrows_data_graph(data, data_prop, entity_class):
+    # the data graph as built row by row before it was vectorized
+    data_graph = Graph()
+    for _, row in data.iterrows():
+        data_graph.add((URIRef(row['entity.value']), URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#type'), URIRef(entity_class)))
+
+    for _, row in data_prop.iterrows():
+        s = URIRef(row['s.value'])
+        p = URIRef(row['p.value'])
+        if row['o.type'] == 'literal':
+            if row['o.xml:lang'] == 'not specified':
+                o = Literal(row['o.value'])
+            else:
+                o = Literal(row['o.value'], lang=row['o.xml:lang'])
+        elif row['o.type'] == 'typed-literal':
+            o = Literal(row['o.value'], datatype=row['o.datatype'])
+        else:
+            o = URIRef(row['o.value'])
+        data_graph.add((s, p, o))
+    return data_graph
+
+
+@pytest.mark.parametrize('compact', [False, True], ids=['object', 'categorical'])
+def test_construct_data_graph_is_isomorphic(tmp_path, compact):
+    data = pd.DataFrame({'entity.value': ["http://dbpedia.org/resource/A", "http://dbpedia.org/resource/B",
+                                          "http://dbpedia.org/resource/C"]})
+    data_prop = collected_data_prop()
+    collected = compact_data_prop(data_prop) if compact else data_prop
+
+    destination = tmp_path / "data_graph.ttl"
+    num_of_triples = construct_data_graph(data, collected, ENTITY_CLASS, destination)
+    data_graph = Graph().parse(destination, format='nt')
+
+    assert num_of_triples == len(data_graph) == len(data) + len(data_prop)
+    assert isomorphic(data_graph, build_data_graph(data, collected, ENTITY_CLASS))
+    assert any(isinstance(o, BNode) for o in data_graph.objects())
+
+    # the blank nodes were written as IRIs row by row
+    no_bnodes = data_prop['o.type'] != 'bnode'
+    expected = iterrows_data_graph(data, data_prop[no_bnodes], ENTITY_CLASS)
+    assert set(data_graph) - {triple for triple in data_graph if isinstance(triple[2], BNode)} == set(expected)
+
+
+def test_compacted_windows_join_back_to_the_collected_values():
+    data_prop = collected_data_prop()
+    windows = [
+        data_prop.iloc[:4],
+        # a window without any language tag, as the one that could not be joined
+        data_prop.iloc[4:7].assign(**{'o.xml:lang': None}),
+        # a window without the column at all, and an empty window
+        data_prop.iloc[7:].drop(columns=['o.datatype']),
+        data_prop.iloc[0:0],
+    ]
+
+    concatenated = concat_data_prop([compact_data_prop(window) for window in windows])
+    expected = pd.concat(windows, ignore_index=True)
+
+    assert all(isinstance(concatenated[column].dtype, pd.CategoricalDtype)
+               for column in concatenated.columns if column in DATA_PROP_COLUMNS)
+    assert concatenated['o.xml:lang'].isna().sum() == expected['o.xml:lang'].isna().sum()
+    pd.testing.assert_frame_equal(concatenated.astype(object).where(concatenated.notna(), None),
+                                  expected[concatenated.columns].astype(object).where(expected.notna(), None))
+
+
+def test_concat_data_prop_of_no_windows():
+    assert list(concat_data_prop([]).columns) == DATA_PROP_COLUMNS
+
+
+def windowed_endpoint(queried, failing=()):
+    # answer the windows of iter_data_prop with a label for each entity, and fail the windows of failing entities
+    def query_sparql(query, sparql_endpoint):
+        entities = re.search(r'VALUES \?s \{([^}]*)\}', query).group(1).split()
+        queried.append(entities)
+        if set(entities) & set(failing):
+            raise ConnectionError("The endpoint is not available")
+        return pd.DataFrame([{'s.type': 'uri', 's.value': entity[1:-1], 'p.type': 'uri',
+                              'p.value': "http://www.w3.org/2000/01/rdf-schema#label",
+                              'o.type': 'literal', 'o.value': entity[1:-1].rsplit('/', 1)[-1], 'o.xml:lang': 'en'}
+                             for entity in entities])
+    return query_sparql
+
+
+def test_resume_collects_only_the_failed_windows(tmp_path, monkeypatch):
+    # the checkpoints share the directory with the other files, as with --checkpoint_dir .
+    (tmp_path / "data.csv").write_text("entity.value\n")
+    (tmp_path / "important.csv").write_text("kept\n")
+    data = add_entity_column(pd.DataFrame({'entity.value': [f"http://example.org/e{idx}" for idx in range(6)]}))
+
+    queried = []
+    monkeypatch.setattr(prepare_data, 'query_sparql', windowed_endpoint(queried, failing=["<http://example.org/e3>"]))
+    checkpoint = WindowCheckpoint(str(tmp_path), data['entity.value'])
+    collected = get_data_prop(data, ["rdfs:label"], "http://example.org/sparql", window_size=2, checkpoint=checkpoint)
+
+    assert collected['s.value'].tolist() == ["http://example.org/e0", "http://example.org/e1",
+                                             "http://example.org/e4", "http://example.org/e5"]
+    assert [(props, start, end) for props, start, end, _ in checkpoint.missing()] == [(("rdfs:label",), 2, 4)]
+
+    # the rerun queries only the failed window, and a run without --resume would query all of them again
+    queried.clear()
+    monkeypatch.setattr(prepare_data, 'query_sparql', windowed_endpoint(queried))
+    checkpoint = WindowCheckpoint(str(tmp_path), data['entity.value'], resume=True)
+    collected = get_data_prop(data, ["rdfs:label"], "http://example.org/sparql", window_size=2, checkpoint=checkpoint)
+
+    assert queried == [["<http://example.org/e2>", "<http://example.org/e3>"]]
+    assert collected['s.value'].tolist() == data['entity.value'].tolist()
+    assert not checkpoint.missing()
+
+    checkpoint.clear()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["data.csv", "important.csv"]
+
+
+def test_resume_with_other_entities_collects_all_the_windows(tmp_path, monkeypatch):
+    (tmp_path / "important.csv").write_text("kept\n")
+    data = add_entity_column(pd.DataFrame({'entity.value': [f"http://example.org/e{idx}" for idx in range(4)]}))
+
+    queried = []
+    monkeypatch.setattr(prepare_data, 'query_sparql', windowed_endpoint(queried))
+    checkpoint = WindowCheckpoint(str(tmp_path), data['entity.value'])
+    get_data_prop(data, ["rdfs:label"], "http://example.org/sparql", window_size=2, checkpoint=checkpoint)
+    window_files = {path.name for path in tmp_path.iterdir()} - {"important.csv", "manifest.jsonl"}
+    assert len(window_files) == 2
+
+    queried.clear()
+    checkpoint = WindowCheckpoint(str(tmp_path), data['entity.value'].iloc[:3], resume=True)
+    get_data_prop(data.iloc[:3], ["rdfs:label"], "http://example.org/sparql", window_size=2, checkpoint=checkpoint)
+
+    # the windows of the other entities are removed, and the new ones written
+    assert len(queried) == 2
+    windows = {name for _, _, name in checkpoint.done_windows(("rdfs:label",))}
+    assert len(windows - window_files) == 1
+    assert {path.name for path in tmp_path.iterdir()} == {"important.csv", "manifest.jsonl"} | windows
+
+
+def test_streamed_data_prop_writes_the_same_data_graph(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = add_entity_column(pd.DataFrame({'entity.value': ["http://dbpedia.org/resource/A", "http://dbpedia.org/resource/B"]}))
+    values = collected_data_prop()
+    # the literals pandas would read as missing values or numbers
+    values = pd.concat([values] + [values.iloc[[0]].assign(**{'o.value': value, 'o.xml:lang': 'not specified'})
+                                   for value in ["NA", "null", "n/a", "NaN", "1.50"]], ignore_index=True)
+
+    def query_sparql(query, sparql_endpoint):
+        entities = re.search(r'VALUES \?s \{([^}]*)\}', query).group(1).split()
+        prop = re.search(r'BIND\(<([^>]*)> AS \?p\)', query).group(1)
+        return values[values['s.value'].isin([entity[1:-1] for entity in entities]) & (values['p.value'] == prop)]
+
+    monkeypatch.setattr(prepare_data, 'query_sparql', query_sparql)
+    prop_list = [f"<{prop}>" for prop in values['p.value'].unique()]
+
+    construct_data_graph(data, retrieve_data_prop(data, prop_list, "http://example.org/sparql", window_size=1),
+                         ENTITY_CLASS, "data_graph.ttl")
+    construct_data_graph(data, retrieve_data_prop(data, prop_list, "http://example.org/sparql", stream=True,
+                                                  batch_size=3, window_size=1),
+                         ENTITY_CLASS, "streamed_data_graph.ttl")
+    data_graph = Graph().parse("data_graph.ttl", format='nt')
+
+    assert len(data_graph) == len(data) + len(values)
+    assert {Literal(value) for value in ["NA", "null", "n/a", "NaN", "1.50", ""]} <= set(data_graph.objects())
+    assert isomorphic(Graph().parse("streamed_data_graph.ttl", format='nt'), data_graph)
+
+
+def capped_endpoint(entities, cap):
+    # answer the pages of iter_pages with at most cap rows
+    def query_sparql(query, sparql_endpoint):
+        limit = int(re.search(r'LIMIT (\d+)', query).group(1))
+        offset = int(re.search(r'OFFSET (\d+)', query).group(1))
+        return pd.DataFrame({'entity.type': 'uri', 'entity.value': entities[offset:offset + min(limit, cap)]},
+                            columns=['entity.type', 'entity.value'])
+    return query_sparql
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+@pytest.mark.parametrize('num_of_entities, cap', [(250, 100), (250, 10000), (100, 100), (0, 100)])
+def test_pages_are_not_truncated_by_a_capped_endpoint(tmp_path, monkeypatch, workers, num_of_entities, cap):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "query.txt").write_text("SELECT ?entity WHERE { ?entity a <http://dbpedia.org/ontology/Country> . }")
+    entities = [f"http://example.org/e{idx:03d}" for idx in range(num_of_entities)]
+    monkeypatch.setattr(prepare_data, 'query_sparql', capped_endpoint(entities, cap))
+
+    data = retrieve_data("query.txt", "http://example.org/sparql", page_size=1000, workers=workers)
+
+    assert data['entity.value'].tolist() == entities
+    assert pd.read_csv("data.csv")['entity.value'].tolist() == entities
+
+
+def test_prepare_expands_a_prefixed_class(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server, url = serve(Graph().parse(data="""
+@prefix dbo: <http://dbpedia.org/ontology/> .
+@prefix dbr: <http://dbpedia.org/resource/> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+dbr:A a dbo:Country ; rdfs:label "A"@en .
+dbr:B a dbo:Country .
+""", format='turtle'))
+    (tmp_path / "query.txt").write_text("SELECT ?entity WHERE { ?entity a dbo:Country . }")
+    try:
+        prepare_data.main(["--query_file", "query.txt", "--sparql_endpoint", url, "--class_uri", "dbo:Country",
+                           "--prop_list", "rdfs:label", "--no_cache"])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    data_graph = Graph().parse("data_graph.ttl", format='nt')
+    assert set(data_graph.subjects(RDF.type, URIRef(ENTITY_CLASS))) == {URIRef("http://dbpedia.org/resource/A"),
+                                                                        URIRef("http://dbpedia.org/resource/B")}
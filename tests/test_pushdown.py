@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+import pandas as pd
+
+from rdflib import Graph
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from local_endpoint import serve
+from sparql_client import configure_cache
+from prepare_data import add_entity_column, build_data_graph, get_data_prop
+from validate_completeness import create_report_validation, validate_graph, validate_pushdown
+
+
+KNOWLEDGE_GRAPH = """
+@prefix dbo: <http://dbpedia.org/ontology/> .
+@prefix dbr: <http://dbpedia.org/resource/> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+dbr:A a dbo:Country ; rdfs:label "A"@en , "A"@de ; dbo:capital dbr:A_city ; dbo:populationTotal 10 .
+dbr:B a dbo:Country ; rdfs:label "B"@en ; dbo:capital dbr:B_city , dbr:B_town .
+dbr:C a dbo:Country ; rdfs:label "C"@en .
+dbr:D a dbo:Country .
+dbr:E a dbo:Country ; dbo:populationTotal 5 .
+"""
+
+SHAPES_GRAPH = """
+@prefix sh: <http://www.w3.org/ns/shacl#> .
+@prefix dbo: <http://dbpedia.org/ontology/> .
+@prefix dbr: <http://dbpedia.org/resource/> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix ex: <http://example.org/> .
+
+ex:CountryShape a sh:NodeShape ;
+    sh:targetClass dbo:Country ;
+    sh:property [ sh:path rdfs:label ; sh:minCount 2 ] , [ sh:path dbo:capital ; sh:minCount 1 ] .
+ex:PopulationShape a sh:NodeShape ;
+    sh:targetNode dbr:A , dbr:D ;
+    sh:property [ sh:path dbo:populationTotal ; sh:minCount 1 ] .
+"""
+
+
+@pytest.fixture
+def sparql_endpoint():
+    configure_cache(None)
+    server, url = serve(Graph().parse(data=KNOWLEDGE_GRAPH, format='turtle'))
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('window_size', [2, 200])
+def test_pushdown_matches_the_materialized_data_graph(sparql_endpoint, window_size):
+    entity_class = "http://dbpedia.org/ontology/Country"
+    data = add_entity_column(pd.DataFrame({'entity.value': [f"http://dbpedia.org/resource/{name}" for name in "ABCDE"]}))
+    prop_list = ["rdfs:label", "dbo:capital", "dbo:populationTotal"]
+    shapes_graph = Graph().parse(data=SHAPES_GRAPH, format='turtle')
+
+    # the data graph as prepare_data builds it from the collected values
+    data_prop = get_data_prop(data, prop_list, sparql_endpoint)
+    _, report_graph, _ = validate_graph(shapes_graph, build_data_graph(data, data_prop, entity_class))
+    expected = create_report_validation(data, "entity.value", report_graph, prop_list)
+
+    validation = validate_pushdown(data, shapes_graph, prop_list, sparql_endpoint, entity_class, window_size=window_size)
+
+    # D has no value of any property
+    assert expected.set_index('entity.value').loc["http://dbpedia.org/resource/D", 'complete_all'] == 0
+    pd.testing.assert_frame_equal(validation, expected)
+
+
+def test_pushdown_rejects_shapes_it_cannot_count(sparql_endpoint):
+    shapes_graph = Graph().parse(data=SHAPES_GRAPH + """
+ex:LabelShape a sh:NodeShape ;
+    sh:targetClass dbo:Country ;
+    sh:property [ sh:path rdfs:label ; sh:minCount 1 ; sh:languageIn ( "en" ) ] .
+""", format='turtle')
+    data = add_entity_column(pd.DataFrame({'entity.value': ["http://dbpedia.org/resource/A"]}))
+
+    with pytest.raises(ValueError):
+        validate_pushdown(data, shapes_graph, ["rdfs:label"], sparql_endpoint, "dbo:Country")
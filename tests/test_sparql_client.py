@@ -0,0 +1,14 @@
+from sparql_client import normalize_query
+
+
+def test_normalize_query_collapses_whitespaces_outside_literals_and_iris():
+    query = 'SELECT  ?s\n\n WHERE {\n  <http://example.org/a#b> ?p  "x  y" .\n}'
+    assert normalize_query(query) == 'SELECT ?s WHERE { <http://example.org/a#b> ?p "x  y" . }'
+
+
+def test_normalize_query_keeps_the_end_of_a_comment():
+    # the comment ends at the newline, without it WHERE is part of the comment
+    commented = normalize_query('SELECT ?s # the subjects\nWHERE { ?s ?p "a # b" . }')
+
+    assert commented == normalize_query('SELECT ?s WHERE { ?s ?p "a # b" . }')
+    assert commented != normalize_query('SELECT ?s # the subjects WHERE { ?s ?p "a # b" . }')
@@ -0,0 +1,240 @@
+import pytest
+import pandas as pd
+
+from rdflib import Graph
+
+from prepare_data import build_data_graph
+from validate_completeness import (SH, build_report_table, create_report_validation, extract_incomplete, validate_graph,
+                                  validate_incremental, validate_sharded, validate_streaming)
+
+
+PREFIXES = """
+@prefix sh: <http://www.w3.org/ns/shacl#> .
+@prefix ex: <http://example.org/> .
+"""
+
+ENTITY_CLASS = "http://example.org/Thing"
+
+
+def literal_rows(values):
+    # the rows of data_prop as collected from the endpoint
+    return pd.DataFrame([{'s.type': 'uri', 's.value': s, 'p.type': 'uri', 'p.value': p,
+                          'o.type': 'literal', 'o.value': o, 'o.xml:lang': None, 'o.datatype': None}
+                         for s, p, o in values])
+
+
+def test_streaming_data_prop_keeps_literal_values(tmp_path):
+    data = pd.DataFrame({'entity.value': [f"http://example.org/e{idx}" for idx in range(1, 5)]})
+    data['entity'] = data['entity.value'].map(lambda value: f"<{value}>")
+    data_prop = literal_rows([
+        ("http://example.org/e1", "http://example.org/a", "NA"),
+        ("http://example.org/e1", "http://example.org/b", "1.50"),
+        ("http://example.org/e1", "http://example.org/b", "1.5"),
+        ("http://example.org/e2", "http://example.org/a", "null"),
+        ("http://example.org/e2", "http://example.org/b", ""),
+        ("http://example.org/e2", "http://example.org/b", "n/a"),
+        ("http://example.org/e3", "http://example.org/a", "NaN"),
+    ])
+    shapes_graph = Graph().parse(data=PREFIXES + """
+ex:ThingShape a sh:NodeShape ;
+    sh:targetClass ex:Thing ;
+    sh:property [ sh:path ex:a ; sh:minCount 1 ] , [ sh:path ex:b ; sh:minCount 2 ] .
+""", format='turtle')
+    prop_list = ["<http://example.org/a>", "<http://example.org/b>"]
+
+    _, report_graph, _ = validate_graph(shapes_graph, build_data_graph(data, data_prop, ENTITY_CLASS))
+    expected = create_report_validation(data, "entity.value", report_graph, prop_list)
+
+    # written as prepare_data writes it, and read back two entities at a time
+    data_prop.to_csv(tmp_path / "data_prop.csv")
+    destination = tmp_path / "validation_report.csv"
+    validate_streaming(data, shapes_graph, prop_list, data_prop_file=tmp_path / "data_prop.csv",
+                       entity_class=ENTITY_CLASS, chunk_size=2, destination=destination)
+    streamed = pd.read_csv(destination, dtype={'entity.value': object})
+
+    assert expected['complete_all'].tolist() == [1.0, 1.0, 0.5, 0.0]
+    pd.testing.assert_frame_equal(streamed, expected.reset_index(drop=True), check_dtype=False)
+
+
+DATA_GRAPH = PREFIXES + """
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+
+ex:Capital rdfs:subClassOf ex:City .
+ex:Metropolis rdfs:subClassOf ex:Capital .
+
+ex:c1 a ex:City ; ex:name "One" , "Eins"@de ; ex:population 10 .
+ex:c2 a ex:Capital ; ex:name "Two" .
+ex:c3 a ex:Metropolis ; ex:population "many" .
+ex:c4 a ex:Thing ; ex:name "Four" .
+ex:p1 ex:name "Person" ; ex:birthPlace ex:c1 .
+ex:p2 ex:birthPlace ex:c2 , ex:c3 .
+"""
+
+CITY_SHAPES = """
+ex:CityShape a sh:NodeShape ;
+    sh:targetClass ex:City ;
+    sh:property [ sh:path ex:name ; sh:minCount 2 ] , [ sh:path ex:population ; sh:minCount 1 ] .
+"""
+
+SPREADSHEET_SHAPES = """
+ex:P1Shape a sh:NodeShape ;
+    sh:targetNode ex:p1 ;
+    sh:property [ sh:path ex:name ; sh:minCount 1 ] , [ sh:path ex:birthPlace ; sh:minCount 1 ] .
+ex:P2Shape a sh:NodeShape ;
+    sh:targetNode ex:p2 , ex:missing ;
+    sh:property [ sh:path ex:name ; sh:minCount 1 ] , [ sh:path ex:birthPlace ; sh:minCount 2 ] .
+"""
+
+FALLBACK_SHAPES = """
+ex:PopulationShape a sh:NodeShape ;
+    sh:targetClass ex:City ;
+    sh:property [ sh:path ex:population ; sh:minCount 1 ; sh:datatype xsd:integer ] .
+ex:DeactivatedShape a sh:NodeShape ;
+    sh:targetClass ex:Thing ;
+    sh:deactivated true ;
+    sh:property [ sh:path ex:population ; sh:minCount 1 ] .
+"""
+
+
+# the target node ex:missing has no triples
+SHAPES = pytest.mark.parametrize('shapes', [CITY_SHAPES, SPREADSHEET_SHAPES, CITY_SHAPES + SPREADSHEET_SHAPES,
+                                            FALLBACK_SHAPES, CITY_SHAPES + FALLBACK_SHAPES],
+                                 ids=['target_class', 'target_node', 'mixed', 'fallback', 'mixed_fallback'])
+
+
+def shapes_and_data_graph(shapes):
+    shapes_graph = Graph().parse(data=PREFIXES + "@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .\n" + shapes,
+                                 format='turtle')
+    return shapes_graph, Graph().parse(data=DATA_GRAPH, format='turtle')
+
+
+@SHAPES
+def test_native_engine_matches_pyshacl(shapes):
+    shapes_graph, data_graph = shapes_and_data_graph(shapes)
+
+    conforms, report_graph, _ = validate_graph(shapes_graph, data_graph, engine='auto')
+    expected_conforms, expected_report, _ = validate_graph(shapes_graph, data_graph, engine='pyshacl')
+
+    assert not expected_conforms
+    assert conforms == expected_conforms
+    assert sorted(extract_incomplete(report_graph)) == sorted(extract_incomplete(expected_report))
+    assert len(set(report_graph.objects(None, SH.result))) == len(set(expected_report.objects(None, SH.result)))
+
+
+@SHAPES
+def test_sharded_validation_matches_a_single_process(shapes):
+    shapes_graph, data_graph = shapes_and_data_graph(shapes)
+
+    conforms, report_graph, _ = validate_sharded(shapes_graph, data_graph, 3)
+    expected_conforms, expected_report, _ = validate_graph(shapes_graph, data_graph)
+
+    assert conforms == expected_conforms
+    assert sorted(extract_incomplete(report_graph)) == sorted(extract_incomplete(expected_report))
+    assert len(set(report_graph.objects(None, SH.result))) == len(set(expected_report.objects(None, SH.result)))
+
+
+@pytest.mark.parametrize('dtype', [object, 'category'])
+def test_report_table_codes_entities_and_properties(dtype):
+    # repeated and unordered entities, a focus node and a property outside the report
+    entities = ["http://example.org/e2", "http://example.org/e1", "http://example.org/e3", "http://example.org/e2"]
+    data = pd.DataFrame({'entity.value': pd.Series(entities, dtype=dtype)})
+    prop_list = ["<http://example.org/a>", "rdfs:label", "dbo:capital"]
+    incomplete = [("http://example.org/e2", "http://example.org/a"),
+                  ("http://example.org/e2", "http://dbpedia.org/ontology/capital"),
+                  ("http://example.org/e3", "http://www.w3.org/2000/01/rdf-schema#label"),
+                  ("http://example.org/other", "http://example.org/a"),
+                  ("http://example.org/e1", "http://example.org/unchecked")]
+
+    validation = build_report_table(data, "entity.value", incomplete, prop_list)
+
+    assert validation['entity.value'].tolist() == entities
+    assert validation[prop_list].values.tolist() == [[0, 1, 0], [1, 1, 1], [1, 0, 1], [0, 1, 0]]
+    assert validation['complete_all'].tolist() == pytest.approx([1/3, 1, 2/3, 1/3])
+
+
+INCREMENTAL_SHAPES = PREFIXES + """
+ex:ThingShape a sh:NodeShape ;
+    sh:targetClass ex:Thing ;
+    sh:property [ sh:path ex:a ; sh:minCount 1 ] .
+"""
+
+ENTITIES = ["e0", "e1", "e2", "e3"]
+
+
+class IncrementalRun:
+    # the runs of validate_incremental over the files of a directory
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.state_file = directory / "state.json"
+        self.destination = directory / "validation_report.csv"
+        self.diff_destination = directory / "validation_diff.csv"
+
+    def __call__(self, entities, values, shapes, prop_list):
+        data = pd.DataFrame({'entity.value': [f"http://example.org/{entity}" for entity in entities]})
+        data_prop = literal_rows(values)
+        data_prop.to_csv(self.directory / "data_prop.csv")
+        shapes_graph = Graph().parse(data=shapes, format='turtle')
+
+        counts = validate_incremental(data, self.directory / "data_prop.csv", shapes_graph, prop_list, ENTITY_CLASS,
+                                      self.state_file, destination=self.destination, diff_destination=self.diff_destination)
+
+        # the merged report is the report of a run over all the entities
+        _, report_graph, _ = validate_graph(shapes_graph, build_data_graph(data, data_prop, ENTITY_CLASS))
+        expected = create_report_validation(data, "entity.value", report_graph, prop_list)
+        report = pd.read_csv(self.destination)
+        pd.testing.assert_frame_equal(report, expected.reset_index(drop=True), check_dtype=False)
+        return counts, pd.read_csv(self.diff_destination)
+
+
+def test_incremental_validation_of_changes(tmp_path):
+    run = IncrementalRun(tmp_path)
+    values = [("http://example.org/e1", "http://example.org/a", "one"),
+              ("http://example.org/e2", "http://example.org/a", "two"),
+              ("http://example.org/e3", "http://example.org/b", "three")]
+    prop_list = ["<http://example.org/a>"]
+
+    (num_of_validated, num_of_removed), diff = run(ENTITIES, values, INCREMENTAL_SHAPES, prop_list)
+    assert (num_of_validated, num_of_removed) == (4, 0)
+    assert set(diff['change']) == {'added'}
+
+    # no change
+    (num_of_validated, num_of_removed), diff = run(ENTITIES, values, INCREMENTAL_SHAPES, prop_list)
+    assert (num_of_validated, num_of_removed) == (0, 0)
+    assert diff.empty
+
+    # an entity loses its value
+    (num_of_validated, num_of_removed), diff = run(ENTITIES, values[1:], INCREMENTAL_SHAPES, prop_list)
+    assert (num_of_validated, num_of_removed) == (1, 0)
+    assert diff[['entity.value', 'change', 'before', 'after']].values.tolist() == [
+        ["http://example.org/e1", 'changed', 1.0, 0.0], ["http://example.org/e1", 'changed', 1.0, 0.0]]
+
+    # an entity is removed
+    (num_of_validated, num_of_removed), diff = run(ENTITIES[1:], values[1:], INCREMENTAL_SHAPES, prop_list)
+    assert (num_of_validated, num_of_removed) == (0, 1)
+    assert set(diff['entity.value']) == {"http://example.org/e0"}
+    assert set(diff['change']) == {'removed'}
+
+
+def test_incremental_validation_of_changed_shapes(tmp_path):
+    run = IncrementalRun(tmp_path)
+    values = [("http://example.org/e1", "http://example.org/a", "one"),
+              ("http://example.org/e2", "http://example.org/b", "two")]
+    run(ENTITIES, values, INCREMENTAL_SHAPES, ["<http://example.org/a>"])
+
+    # a shape of a new property validates all the entities again
+    shapes = INCREMENTAL_SHAPES + """
+ex:OtherShape a sh:NodeShape ;
+    sh:targetClass ex:Thing ;
+    sh:property [ sh:path ex:b ; sh:minCount 1 ] .
+"""
+    prop_list = ["<http://example.org/a>", "<http://example.org/b>"]
+    (num_of_validated, num_of_removed), _ = run(ENTITIES, values, shapes, prop_list)
+    assert (num_of_validated, num_of_removed) == (4, 0)
+    assert pd.read_csv(run.destination).columns.tolist() == ['entity.value'] + prop_list + ['complete_all']
+
+    # the state of the new shapes is kept
+    (num_of_validated, _), diff = run(ENTITIES, values, shapes, prop_list)
+    assert num_of_validated == 0
+    assert diff.empty
@@ -0,0 +1,73 @@
+import threading
+
+import pandas as pd
+
+from rdflib import Graph
+
+from validation_service import ReadWriteLock, ValidationService
+from validate_completeness import create_report_validation, validate_graph
+
+
+SHAPES_GRAPH = """
+@prefix sh: <http://www.w3.org/ns/shacl#> .
+@prefix ex: <http://example.org/> .
+
+ex:CityShape a sh:NodeShape ;
+    sh:targetClass ex:City ;
+    sh:property [ sh:path ex:name ; sh:minCount 1 ] , [ sh:path ex:population ; sh:minCount 1 ] .
+"""
+
+DATA_GRAPH = """
+@prefix ex: <http://example.org/> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+
+ex:Capital rdfs:subClassOf ex:City .
+ex:c1 a ex:City ; ex:name "One" ; ex:population 1 .
+ex:c2 a ex:Capital ; ex:name "Two" .
+ex:c3 a ex:Town .
+"""
+
+
+def test_readers_share_the_lock_and_a_writer_waits():
+    lock = ReadWriteLock()
+    both_reading = threading.Barrier(2, timeout=5)
+    events = []
+
+    def read():
+        with lock.read():
+            # both readers must hold the lock at once to pass the barrier
+            both_reading.wait()
+            events.append('read')
+
+    def write():
+        with lock.write():
+            events.append('write')
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join(5)
+    writer = threading.Thread(target=write)
+    writer.start()
+    writer.join(5)
+
+    assert events == ['read', 'read', 'write']
+
+
+def test_service_matches_the_validation_of_the_whole_graph():
+    shapes_graph = Graph().parse(data=SHAPES_GRAPH, format='turtle')
+    data_graph = Graph().parse(data=DATA_GRAPH, format='turtle')
+    entities = ["http://example.org/c1", "http://example.org/c2", "http://example.org/c3"]
+    prop_list = ["<http://example.org/name>", "<http://example.org/population>"]
+
+    _, report_graph, _ = validate_graph(shapes_graph, data_graph)
+    expected = create_report_validation(pd.DataFrame({'entity.value': entities}), "entity.value", report_graph, prop_list)
+
+    service = ValidationService(shapes_graph, data_graph, prop_list)
+    pd.testing.assert_frame_equal(service.validate(entities), expected)
+
+    # a town becomes a city through a new subclass
+    service.update(add=[["<http://example.org/Town>", "<http://www.w3.org/2000/01/rdf-schema#subClassOf>",
+                         "<http://example.org/City>"]])
+    assert service.validate(["http://example.org/c3"])['complete_all'].tolist() == [0.0]
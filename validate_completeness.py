@@ -1,13 +1,230 @@
+import os
+import json
+import zlib
+import hashlib
 import argparse
-import pandas as pd
+import tempfile
 
-from pyshacl import validate
-from rdflib import Graph, URIRef
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+from rdflib import OWL, RDF, RDFS, BNode, Graph, Literal, Namespace, URIRef
 
-def validate_graph(shapes_graph, data_graph, is_advanced=False):
+from lazy_import import lazy_import
+from prepare_data import DATA_PROP_CSV_OPTIONS, build_data_graph, format_iri, query_sparql
+from graph_snapshot import GraphSnapshot, snapshot_path
+from metrics import add_metrics_arguments, stage, start_metrics, timer
+from generate_shapes import expand_class_uri
+
+# the heavy dependencies are imported when they are first used,
+# pySHACL only when a shape falls back to it
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+SH = Namespace("http://www.w3.org/ns/shacl#")
+
+# prefixes of the property names given in the report
+PROP_NAMESPACES = Graph().namespace_manager
+PROP_NAMESPACES.bind("dbo", Namespace("http://dbpedia.org/ontology/"))
+PROP_NAMESPACES.bind("wdt", Namespace("http://www.wikidata.org/prop/direct/"))
+
+# a node shape targeting classes or nodes with minCount property shapes
+CompletenessShape = namedtuple('CompletenessShape', ['shape', 'target_classes', 'target_nodes', 'constraints'])
+MinCount = namedtuple('MinCount', ['path', 'min_count', 'property_shape'])
+
+# predicates the native engine can handle, anything else falls back to pySHACL
+NODE_SHAPE_PREDICATES = {RDF.type, SH.targetClass, SH.targetNode, SH.property,
+                         RDFS.label, RDFS.comment, SH.name, SH.description}
+PROPERTY_SHAPE_PREDICATES = {RDF.type, SH.path, SH.minCount,
+                             RDFS.label, RDFS.comment, SH.name, SH.description}
+TARGET_PREDICATES = {SH.targetClass, SH.targetNode, SH.targetSubjectsOf, SH.targetObjectsOf, SH.target}
+
+
+def compile_shapes(shapes_graph):
     """
-    Validate the data graph over the shapes graph with the SHACL engine provided by PySHACL.
+    Compile the completeness shapes the native engine can handle.
+
+    A shape is compiled if it targets classes or nodes and only has property
+    shapes with an IRI path and a minCount.
+
+    Parameters
+    ----------
+    shapes_graph : Graph
+        The shapes graph containing all the constraints
+
+    Returns
+    -------
+    (list, Graph)
+        the compiled shapes, and the shapes graph without the targets of the
+        compiled shapes, or None if every shape is compiled
+    """
+
+    compiled = []
+    is_complete = True
+
+    # property shapes must not be focus shapes on their own, and classes
+    # that are shapes target their own instances
+    property_shapes = set(shapes_graph.subjects(RDF.type, SH.PropertyShape)) | set(shapes_graph.objects(None, SH.property))
+    node_shapes = set(shapes_graph.subjects(RDF.type, SH.NodeShape))
+    classes = set(shapes_graph.subjects(RDF.type, RDFS.Class)) | set(shapes_graph.subjects(RDF.type, OWL.Class))
+    if any(shapes_graph.value(shape, predicate) is not None for shape in property_shapes for predicate in TARGET_PREDICATES):
+        is_complete = False
+    if (node_shapes | property_shapes) & classes:
+        is_complete = False
+
+    shapes = set()
+    for predicate in TARGET_PREDICATES:
+        shapes.update(shapes_graph.subjects(predicate, None))
+
+    for shape in shapes - property_shapes:
+        constraints = compile_property_shapes(shapes_graph, shape)
+        if constraints is None:
+            is_complete = False
+            continue
+
+        compiled.append(CompletenessShape(
+            shape,
+            list(shapes_graph.objects(shape, SH.targetClass)),
+            list(shapes_graph.objects(shape, SH.targetNode)),
+            constraints))
+
+    if is_complete:
+        return compiled, None
+
+    # keep the remaining shapes for pySHACL by dropping the targets of the compiled ones
+    fallback_graph = Graph()
+    for prefix, namespace in shapes_graph.namespaces():
+        fallback_graph.bind(prefix, namespace)
+    fallback_graph += shapes_graph
+    for shape in compiled:
+        fallback_graph.remove((shape.shape, SH.targetClass, None))
+        fallback_graph.remove((shape.shape, SH.targetNode, None))
+
+    return compiled, fallback_graph
+
+
+def compile_property_shapes(shapes_graph, shape):
+    # the node shape itself may only target and point to property shapes
+    if any(p not in NODE_SHAPE_PREDICATES for p in shapes_graph.predicates(shape, None)):
+        return None
+    if any(shapes_graph.value(shape, predicate) is not None for predicate in TARGET_PREDICATES - {SH.targetClass, SH.targetNode}):
+        return None
+
+    constraints = []
+    for property_shape in shapes_graph.objects(shape, SH.property):
+        if any(p not in PROPERTY_SHAPE_PREDICATES for p in shapes_graph.predicates(property_shape, None)):
+            return None
+
+        paths = list(shapes_graph.objects(property_shape, SH.path))
+        min_counts = list(shapes_graph.objects(property_shape, SH.minCount))
+        if len(paths) != 1 or not isinstance(paths[0], URIRef) or len(min_counts) > 1:
+            return None
+        if min_counts and not (isinstance(min_counts[0], Literal) and isinstance(min_counts[0].toPython(), int)):
+            return None
+
+        if min_counts:
+            constraints.append(MinCount(paths[0], min_counts[0].toPython(), property_shape))
+
+    return constraints
+
+
+def validate_completeness(compiled, data_graph):
+    """
+    Check the minCount constraints of the compiled shapes by counting the
+    values of each path per focus node.
+
+    Parameters
+    ----------
+    compiled : list
+        A list of CompletenessShape
+    data_graph : Graph
+        The data graph containing all the instances to be validated along with their property values
+
+    Returns
+    -------
+    list
+        A list of (focus node, path, property shape, minCount) of the violations
+    """
+
+    value_counts = {}
+    violations = []
+
+    for shape in compiled:
+        # the instances of a class include the instances of its subclasses
+        focus_nodes = set(shape.target_nodes)
+        for target_class in shape.target_classes:
+            for subclass in data_graph.transitive_subjects(RDFS.subClassOf, target_class):
+                focus_nodes.update(data_graph.subjects(RDF.type, subclass))
+
+        for path, min_count, property_shape in shape.constraints:
+            if path not in value_counts:
+                value_counts[path] = Counter(s for s, _, _ in data_graph.triples((None, path, None)))
+            counts = value_counts[path]
+
+            for focus_node in focus_nodes:
+                if counts.get(focus_node, 0) < min_count:
+                    violations.append((focus_node, path, property_shape, min_count))
+
+    violations.sort()
+    return violations
+
+
+def build_report_graph(violations, fallback_report=None):
+    """
+    Build a SHACL validation report of minCount violations.
+
+    Parameters
+    ----------
+    violations : list
+        A list of (focus node, path, property shape, minCount)
+    fallback_report : Graph, optional
+        A validation report of PySHACL whose results are added (default is None)
+
+    Returns
+    -------
+    Graph
+        The validation report
+    """
+
+    report = Graph()
+    report.bind('sh', SH)
+    report_node = BNode()
+    report.add((report_node, RDF.type, SH.ValidationReport))
+
+    for focus_node, path, property_shape, min_count in violations:
+        result = BNode()
+        report.add((report_node, SH.result, result))
+        report.add((result, RDF.type, SH.ValidationResult))
+        report.add((result, SH.focusNode, focus_node))
+        report.add((result, SH.resultPath, path))
+        report.add((result, SH.resultSeverity, SH.Violation))
+        report.add((result, SH.sourceConstraintComponent, SH.MinCountConstraintComponent))
+        report.add((result, SH.sourceShape, property_shape))
+        report.add((result, SH.resultMessage, Literal(f"Less than {min_count} values on {focus_node.n3()}->{path.n3()}")))
+
+    conforms = not violations
+    if fallback_report is not None:
+        # move the results of PySHACL into the same report
+        fallback_nodes = set(fallback_report.subjects(RDF.type, SH.ValidationReport))
+        for s, p, o in fallback_report:
+            if s not in fallback_nodes:
+                report.add((s, p, o))
+            elif p == SH.result:
+                report.add((report_node, SH.result, o))
+                conforms = False
+
+    report.add((report_node, SH.conforms, Literal(conforms)))
+    return report
+
+
+def validate_graph(shapes_graph, data_graph, is_advanced=False, engine='auto'):
+    """
+    Validate the data graph over the shapes graph.
+
+    With the auto engine, the minCount completeness shapes are checked by a
+    native engine counting the values of each path, and the other shapes by
+    the SHACL engine provided by PySHACL.
     
     Parameters
     ----------
@@ -16,7 +233,9 @@ def validate_graph(shapes_graph, data_graph, is_advanced=False):
     data_graph : Graph
         The data graph containing all the instances to be validated along with their property values
     is_advanced : boolean, optional
-        ...
+        A boolean value to enable the SHACL advanced features in PySHACL (default is False)
+    engine : str, optional
+        'auto' for the native engine with a fallback to PySHACL, or 'pyshacl' (default is 'auto')
 
     Returns
     -------
@@ -24,58 +243,670 @@ def validate_graph(shapes_graph, data_graph, is_advanced=False):
         value of conformation, validation report in the shape of a graph, and
         validation report in the shape of a text
     """
-    result = validate(
-        data_graph = data_graph,
-        shacl_graph = shapes_graph,
-        advanced = is_advanced,
-        serialize_report_graph='ttl',
-        )
-    
-    return result
+
+    if engine == 'pyshacl':
+        from pyshacl import validate
+
+        with timer('pyshacl'):
+            return validate(
+                data_graph = as_graph(data_graph),
+                shacl_graph = shapes_graph,
+                advanced = is_advanced,
+                )
+
+    with timer('native_engine'):
+        compiled, fallback_graph = compile_shapes(shapes_graph)
+        violations = validate_completeness(compiled, data_graph)
+
+    fallback_report = None
+    if fallback_graph is not None:
+        from pyshacl import validate
+
+        with timer('pyshacl'):
+            _, fallback_report, _ = validate(
+                data_graph = as_graph(data_graph),
+                shacl_graph = fallback_graph,
+                advanced = is_advanced,
+                )
+
+    with timer('build_report_graph'):
+        report = build_report_graph(violations, fallback_report)
+    num_of_results = len(set(report.objects(None, SH.result)))
+    conforms = num_of_results == 0
+    report_text = f"Validation Report\nConforms: {conforms}\nResults ({num_of_results})\n"
+
+    return conforms, report, report_text
+
+
+def shard_of(node, num_of_shards):
+    # a stable hash, the shards are built and checked in different processes
+    return zlib.crc32(str(node).encode('utf-8')) % num_of_shards
+
+
+def shard_graph(data_graph, num_of_shards, predicates=None):
+    """
+    Split the triples of the data graph by subject into shards.
+
+    The rdfs:subClassOf triples are copied into every shard, so the instances
+    of a class are found in each of them.
+
+    Parameters
+    ----------
+    data_graph : Graph
+        The data graph containing all the instances to be validated along with their property values
+    num_of_shards : int
+        A number of shards
+    predicates : set, optional
+        A set of predicates to keep, all of them if None (default is None)
+
+    Returns
+    -------
+    list
+        A list of the triples of each shard
+    """
+
+    shards = [[] for _ in range(num_of_shards)]
+    subject_shards = {}
+
+    for s, p, o in data_graph:
+        if p == RDFS.subClassOf:
+            for shard in shards:
+                shard.append((s, p, o))
+            continue
+        if predicates is not None and p not in predicates:
+            continue
+
+        index = subject_shards.get(s)
+        if index is None:
+            index = subject_shards[s] = shard_of(s, num_of_shards)
+        shards[index].append((s, p, o))
+
+    return shards
+
+
+# the compiled shapes of a worker process, loaded once by init_worker
+worker_shapes = None
+
+
+def init_worker(compiled):
+    global worker_shapes
+    worker_shapes = compiled
+
+
+def validate_shard(index, num_of_shards, triples):
+    shard = Graph()
+    shard.addN((s, p, o, shard) for s, p, o in triples)
+
+    # a target node belongs to a single shard, even without any triple
+    return [violation for violation in validate_completeness(worker_shapes, shard)
+            if shard_of(violation[0], num_of_shards) == index]
+
+
+def validate_sharded(shapes_graph, data_graph, workers, is_advanced=False):
+    """
+    Validate the data graph over the shapes graph, with the data graph split
+    by subject into shards checked in a process pool.
+
+    The completeness shapes only look at the values of each focus node, so they
+    are checked per shard by the native engine, while the other shapes are
+    checked on the whole data graph by PySHACL.
+
+    Parameters
+    ----------
+    shapes_graph : Graph
+        The shapes graph containing all the constraints
+    data_graph : Graph
+        The data graph containing all the instances to be validated along with their property values
+    workers : int
+        A number of worker processes
+    is_advanced : boolean, optional
+        A boolean value to enable the SHACL advanced features in PySHACL (default is False)
+
+    Returns
+    -------
+    (bool, Graph, str)
+        value of conformation, validation report in the shape of a graph, and
+        validation report in the shape of a text
+    """
+
+    compiled, fallback_graph = compile_shapes(shapes_graph)
+
+    predicates = {RDF.type} | {constraint.path for shape in compiled for constraint in shape.constraints}
+    shards = shard_graph(data_graph, workers, predicates)
+
+    violations = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(compiled,)) as executor:
+        futures = [executor.submit(validate_shard, index, workers, triples) for index, triples in enumerate(shards)]
+        del shards
+
+        # the remaining shapes are checked while the shards are validated
+        fallback_report = None
+        if fallback_graph is not None:
+            from pyshacl import validate
+
+            _, fallback_report, _ = validate(
+                data_graph = as_graph(data_graph),
+                shacl_graph = fallback_graph,
+                advanced = is_advanced,
+                )
+
+        for future in futures:
+            violations.extend(future.result())
+
+    violations.sort()
+    report = build_report_graph(violations, fallback_report)
+    num_of_results = len(set(report.objects(None, SH.result)))
+    conforms = num_of_results == 0
+    report_text = f"Validation Report\nConforms: {conforms}\nResults ({num_of_results})\n"
+
+    return conforms, report, report_text
+
+
+def extract_incomplete(report_graph):
+    """
+    Collect the (focus node, path) pairs of all the results of a validation report in one pass.
+
+    Parameters
+    ----------
+    report_graph : Graph
+        The validation report, also accepted as serialized Turtle
+
+    Returns
+    -------
+    list
+        A list of (focus node, path IRI) as strings
+    """
+
+    report = report_graph
+    if not isinstance(report, Graph):
+        report = Graph()
+        report.parse(data=report_graph, format='turtle')
+
+    results = set(report.objects(None, SH.result))
+    paths = {result: path for result, path in report.subject_objects(SH.resultPath) if result in results}
+
+    return [(str(focus_node), str(paths[result]))
+            for result, focus_node in report.subject_objects(SH.focusNode) if result in paths]
+
+
+def resolve_prop(prop):
+    # a property is given as <IRI> or as a prefixed name
+    if prop.startswith('<') and prop.endswith('>'):
+        return prop[1:-1]
+    try:
+        return str(PROP_NAMESPACES.expand_curie(prop))
+    except ValueError:
+        return prop
+
+
+def build_report_table(df, use_col, incomplete, prop_list):
+    """
+    Build the completeness matrix of the entities, with the entities and the
+    properties coded as integers instead of joined as strings.
+
+    Parameters
+    ----------
+    df : DataFrame
+        A table containing all the validated instances
+    use_col : str
+        A column of the instances, i.e. entity.value
+    incomplete : iterable
+        An iterable of (focus node, path IRI) of the incomplete values
+    prop_list : list
+        A list of the checked properties, as <IRI> or prefixed names
+
+    Returns
+    -------
+    DataFrame
+        A table of the instances with 0 for each incomplete property, 1 otherwise,
+        and the ratio of complete properties in complete_all
+    """
+
+    entities = pd.Categorical(df[use_col])
+    prop_codes = {resolve_prop(prop): code for code, prop in enumerate(prop_list)}
+
+    pairs = pd.DataFrame(list(incomplete), columns=['focus', 'prop'])
+    rows = entities.categories.get_indexer(pairs['focus'])
+    columns = pairs['prop'].map(prop_codes)
+    is_checked = (rows >= 0) & columns.notna().to_numpy()
+
+    complete = np.ones((len(entities.categories), len(prop_list)))
+    complete[rows[is_checked], columns[is_checked].astype(int)] = 0.0
+
+    validation = pd.DataFrame(complete[entities.codes], columns=prop_list)
+    validation.insert(0, use_col, df[use_col].to_numpy())
+    validation['complete_all'] = validation[prop_list].sum(axis=1)/len(prop_list)
+    return validation
 
 
 def create_report_validation(df, use_col, report_graph, prop_list):
-    report = Graph()
-    report.parse(data=report_graph)
+    """
+    Convert the validation report into a table of completeness per instance.
+
+    Parameters
+    ----------
+    df : DataFrame
+        A table containing all the validated instances
+    use_col : str
+        A column of the instances, i.e. entity.value
+    report_graph : Graph
+        The validation report, also accepted as serialized Turtle
+    prop_list : list
+        A list of the checked properties, as <IRI> or prefixed names
+
+    Returns
+    -------
+    DataFrame
+        A table of the instances with 0 for each incomplete property, 1 otherwise,
+        and the ratio of complete properties in complete_all
+    """
+
+    return build_report_table(df, use_col, extract_incomplete(report_graph), prop_list)
+
+
+def split_data_graph(graph_file, chunk_of, num_of_chunks, part_dir):
+    """
+    Split an N-Triples data graph into one file per chunk of entities.
+
+    The triples whose subject is not one of the entities, i.e. rdfs:subClassOf,
+    go to a shared file that is loaded along with every chunk.
+
+    Parameters
+    ----------
+    graph_file : str
+        A file path of data graph in N-Triples format
+    chunk_of : dict
+        A chunk number of each entity
+    num_of_chunks : int
+        A number of chunks
+    part_dir : str
+        A directory of the split files
+
+    Returns
+    -------
+    (list, str)
+        the file paths of the chunks, and the file path of the shared triples
+    """
+
+    part_files = [os.path.join(part_dir, f"part-{index}.nt") for index in range(num_of_chunks)]
+    shared_file = os.path.join(part_dir, "shared.nt")
+
+    parts = [open(part_file, 'w', encoding='utf-8') for part_file in part_files]
+    try:
+        with open(graph_file, encoding='utf-8') as graph, open(shared_file, 'w', encoding='utf-8') as shared:
+            for line in graph:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                if line.startswith(('@prefix', '@base', 'PREFIX', 'BASE')):
+                    raise ValueError(f"{graph_file} is not in N-Triples format, stream the data properties instead")
+
+                # the subject of an N-Triples line is an <IRI> or a blank node
+                index = chunk_of.get(line[1:line.find('>')]) if line.startswith('<') else None
+                if index is None:
+                    shared.write(line)
+                else:
+                    parts[index].write(line)
+    finally:
+        for part in parts:
+            part.close()
+
+    return part_files, shared_file
+
+
+def split_data_prop(data_prop_file, chunk_of, num_of_chunks, part_dir, batch_size=100000):
+    # split the rows of the properties by the chunk of their entity
+    part_files = [os.path.join(part_dir, f"part-{index}.csv") for index in range(num_of_chunks)]
+    has_header = [False] * num_of_chunks
+
+    for batch in pd.read_csv(data_prop_file, chunksize=batch_size, **DATA_PROP_CSV_OPTIONS):
+        chunks = batch['s.value'].map(chunk_of)
+        for index, rows in batch.groupby(chunks):
+            index = int(index)
+            rows.to_csv(part_files[index], mode='a', header=not has_header[index], index=False)
+            has_header[index] = True
+
+    return [part_file if has_header[index] else None for index, part_file in enumerate(part_files)]
+
+
+def validate_streaming(data, shapes_graph, prop_list, data_graph_file=None, data_prop_file=None,
+                       entity_class=None, chunk_size=10000, engine='auto', destination="validation_report.csv"):
+    """
+    Validate the data in chunks of entities and append the rows of each chunk to the report,
+    so that only a chunk of the data graph is in memory at once.
+
+    The data is read from an N-Triples data graph, or from the properties along with
+    the class of the entities.
+
+    Parameters
+    ----------
+    data : DataFrame
+        A table containing all the instances to be validated
+    shapes_graph : Graph
+        The shapes graph containing all the constraints
+    prop_list : list
+        A list of the checked properties, as <IRI> or prefixed names
+    data_graph_file : str, optional
+        A file path of data graph in N-Triples format (default is None)
+    data_prop_file : str, optional
+        A file path of data along with the properties in csv format, used if there is no data graph (default is None)
+    entity_class : str, optional
+        An URI of the class of the instances, required with the properties (default is None)
+    chunk_size : int, optional
+        A number of entities per chunk (default is 10000)
+    engine : str, optional
+        'auto' for the native engine with a fallback to PySHACL, or 'pyshacl' (default is 'auto')
+    destination : str, optional
+        A file path of the validation report (default is "validation_report.csv")
+
+    Returns
+    -------
+    (bool, int)
+        value of conformation, and number of validated instances
+    """
+
+    entities = data['entity.value'].tolist()
+    chunk_of = {entity: index // chunk_size for index, entity in enumerate(entities)}
+    num_of_chunks = max(1, -(-len(entities) // chunk_size))
+
+    from tqdm import tqdm
+
+    conforms = True
+    num_of_rows = 0
+    with tempfile.TemporaryDirectory() as part_dir:
+        if data_graph_file is not None:
+            part_files, shared_file = split_data_graph(data_graph_file, chunk_of, num_of_chunks, part_dir)
+        else:
+            part_files = split_data_prop(data_prop_file, chunk_of, num_of_chunks, part_dir)
+
+        for index, part_file in enumerate(tqdm(part_files, desc="Validating chunks")):
+            chunk = data.iloc[index*chunk_size:(index+1)*chunk_size]
+
+            with timer('load_data_graph'):
+                if data_graph_file is not None:
+                    data_graph = Graph()
+                    data_graph.parse(shared_file, format='nt')
+                    data_graph.parse(part_file, format='nt')
+                else:
+                    chunk_prop = pd.read_csv(part_file, **DATA_PROP_CSV_OPTIONS) if part_file is not None else pd.DataFrame(columns=['s.value', 'p.value', 'o.value', 'o.type'])
+                    data_graph = build_data_graph(chunk, chunk_prop, entity_class)
+
+            chunk_conforms, report_graph, _ = validate_graph(shapes_graph, data_graph, engine=engine)
+            conforms = conforms and chunk_conforms
+
+            with timer('create_report_validation'):
+                validation = create_report_validation(chunk, "entity.value", report_graph, prop_list)
+            validation.to_csv(destination, mode='w' if index == 0 else 'a', header=index == 0, index=False)
+            num_of_rows += len(validation)
+
+    return conforms, num_of_rows
+
+
+def hash_shapes(shapes_graph):
+    from rdflib.compare import to_canonical_graph
+
+    # the blank nodes are relabelled so the same shapes always get the same hash
+    triples = sorted(line for line in to_canonical_graph(shapes_graph).serialize(format='nt').splitlines() if line)
+    return hashlib.sha256('\n'.join(triples).encode('utf-8')).hexdigest()
+
+
+def fingerprint_entities(data, data_prop):
+    """
+    Compute a fingerprint of the collected property values of each entity.
+
+    Parameters
+    ----------
+    data : DataFrame
+        A table containing all the instances to be validated
+    data_prop : DataFrame
+        A table of the properties of the instances along with their values
+
+    Returns
+    -------
+    Series
+        The fingerprints indexed by entity, 0 for an entity without any value
+    """
+
+    # the fingerprint is a sum of the row hashes, so the order of the rows does not matter
+    columns = [column for column in ['p.value', 'o.type', 'o.value', 'o.xml:lang', 'o.datatype'] if column in data_prop.columns]
+    row_hashes = pd.util.hash_pandas_object(data_prop[columns].astype(str), index=False)
+    fingerprints = row_hashes.groupby(data_prop['s.value'].to_numpy()).sum()
+
+    return fingerprints.reindex(data['entity.value'].drop_duplicates(), fill_value=0)
+
+
+def diff_reports(previous, current, use_col, prop_list):
+    """
+    Compare two validation reports.
+
+    Parameters
+    ----------
+    previous : DataFrame
+        The validation report of the previous run
+    current : DataFrame
+        The validation report of this run
+    use_col : str
+        A column of the instances, i.e. entity.value
+    prop_list : list
+        A list of the checked properties
+
+    Returns
+    -------
+    DataFrame
+        A table of the added, removed and changed entities with the value of each
+        property before and after
+    """
+
+    columns = prop_list + ['complete_all']
+    before = previous.set_index(use_col)[columns].stack().rename('before')
+    after = current.set_index(use_col)[columns].stack().rename('after')
+    diff = pd.concat([before, after], axis=1).reset_index()
+    diff.columns = [use_col, 'property', 'before', 'after']
+
+    diff['change'] = 'changed'
+    diff.loc[diff['before'].isna(), 'change'] = 'added'
+    diff.loc[diff['after'].isna(), 'change'] = 'removed'
+    diff = diff[diff['before'].ne(diff['after'])]
+
+    return diff[[use_col, 'change', 'property', 'before', 'after']].reset_index(drop=True)
+
+
+def validate_incremental(data, data_prop_file, shapes_graph, prop_list, entity_class, state_file,
+                         engine='auto', destination="validation_report.csv", diff_destination="validation_diff.csv"):
+    """
+    Validate only the entities added or changed since the previous run and merge
+    them into the previous validation report.
+
+    The fingerprints of the entities and the hash of the shapes are kept in the
+    state file, and every entity is validated again if the shapes changed.
+
+    Parameters
+    ----------
+    data : DataFrame
+        A table containing all the instances to be validated
+    data_prop_file : str
+        A file path of data along with the properties in csv format
+    shapes_graph : Graph
+        The shapes graph containing all the constraints
+    prop_list : list
+        A list of the checked properties, as <IRI> or prefixed names
+    entity_class : str
+        An URI of the class of the instances
+    state_file : str
+        A file path of the state of the previous run in json format
+    engine : str, optional
+        'auto' for the native engine with a fallback to PySHACL, or 'pyshacl' (default is 'auto')
+    destination : str, optional
+        A file path of the validation report (default is "validation_report.csv")
+    diff_destination : str, optional
+        A file path of the changes of completeness (default is "validation_diff.csv")
+
+    Returns
+    -------
+    (int, int)
+        number of validated instances, and number of removed instances
+    """
+
+    use_col = "entity.value"
+    data_prop = pd.read_csv(data_prop_file, **DATA_PROP_CSV_OPTIONS)
+    fingerprints = fingerprint_entities(data, data_prop)
+    shapes_hash = hash_shapes(shapes_graph)
+
+    state = {}
+    if os.path.exists(state_file):
+        with open(state_file, encoding='utf-8') as f:
+            state = json.load(f)
+
+    # a previous report without all the properties is validated again
+    columns = [use_col] + prop_list + ['complete_all']
+    previous = pd.DataFrame(columns=columns)
+    if state and os.path.exists(destination):
+        report = pd.read_csv(destination)
+        if set(columns) <= set(report.columns):
+            previous = report[columns]
+    if state.get('shapes') != shapes_hash or previous.empty:
+        previous_fingerprints = {}
+    else:
+        previous_fingerprints = state.get('fingerprints', {})
 
-    # get the required properties
-    # TODO
+    # entities are validated again if they are new, or their values changed
+    changed = [entity for entity, fingerprint in fingerprints.items()
+               if previous_fingerprints.get(entity) != int(fingerprint)]
 
-    # list all incompleteness
-    list_incomplete = []
+    changed_data = data[data[use_col].isin(changed)].drop_duplicates(use_col).reset_index(drop=True)
+    changed_prop = data_prop[data_prop['s.value'].isin(changed)]
+    data_graph = build_data_graph(changed_data, changed_prop, entity_class)
+    _, report_graph, _ = validate_graph(shapes_graph, data_graph, engine=engine)
+    validation = create_report_validation(changed_data, use_col, report_graph, prop_list)
 
-    for prop in prop_list:
-        report_query = f"""
-PREFIX dbo: <http://dbpedia.org/ontology/>
-SELECT ?focusNode
+    # the unchanged rows of the previous report keep their results
+    kept = previous[previous[use_col].isin(fingerprints.index) & ~previous[use_col].isin(changed)]
+    merged = pd.concat([kept, validation], ignore_index=True).set_index(use_col)
+    merged = merged.reindex(data[use_col]).reset_index()[columns]
+    merged.to_csv(destination, index=False)
+
+    diff = diff_reports(previous, merged, use_col, prop_list)
+    diff.to_csv(diff_destination, index=False)
+
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump({'shapes': shapes_hash, 'fingerprints': {entity: int(fingerprint) for entity, fingerprint in fingerprints.items()}}, f)
+
+    num_of_removed = (~previous[use_col].isin(fingerprints.index)).sum()
+    return len(changed_data), int(num_of_removed)
+
+
+def as_graph(data_graph):
+    # PySHACL needs the whole graph in memory
+    return data_graph.to_graph() if isinstance(data_graph, GraphSnapshot) else data_graph
+
+
+def count_values(entities, path, sparql_endpoint):
+    # count the values of a path of the entities on the endpoint, the entities without any are missing
+    query = f"""
+SELECT ?entity (COUNT(?o) AS ?count)
 WHERE {{
-[] <http://www.w3.org/ns/shacl#result> ?id .
-?id <http://www.w3.org/ns/shacl#focusNode> ?focusNode ;
-    <http://www.w3.org/ns/shacl#resultPath> {prop} .
+    VALUES ?entity {{{' '.join(format_iri(entities))}}}
+    ?entity {format_iri(pd.Series([path])).iloc[0]} ?o .
 }}
+GROUP BY ?entity
 """
-        res = report.query(report_query)
+    counts = query_sparql(query, sparql_endpoint).reindex(columns=['entity.value', 'count.value'])
+    return counts.rename(columns={'entity.value': 'entity', 'count.value': 'count'}).assign(path=path)
+
+
+def validate_pushdown(data, shapes_graph, prop_list, sparql_endpoint, entity_class, window_size=200, workers=1):
+    """
+    Validate the minCount completeness shapes on the endpoint, by counting the
+    values of each path of the entities with aggregate queries, without any
+    data graph.
 
-        list_entities = []
-        for row in res:
-            list_entities.append([str(row.focusNode), 0])
+    As in the data graph built by prepare_data, all the instances are of the
+    class of the instances.
 
-        list_incomplete.append(list_entities)
+    Parameters
+    ----------
+    data : DataFrame
+        A table containing all the instances to be validated
+    shapes_graph : Graph
+        The shapes graph containing only minCount completeness shapes
+    prop_list : list
+        A list of the checked properties, as <IRI> or prefixed names
+    sparql_endpoint : str
+        A SPARQL API endpoint
+    entity_class : str
+        An URI of the class of the instances
+    window_size : int, optional
+        A number of instances counted in one query (default is 200)
+    workers : int, optional
+        A number of queries sent to the endpoint at the same time (default is 1)
 
-    # convert to dict of incompleteness
-    validation = df[[use_col]]
-    incomplete_dict = dict()
-    for idx, prop in enumerate(prop_list):
-        incomplete_dict[f"df_incomplete_{prop}"] = pd.DataFrame(list_incomplete[idx], columns=[use_col, prop])
+    Returns
+    -------
+    DataFrame
+        A table of the instances with 0 for each incomplete property, 1 otherwise,
+        and the ratio of complete properties in complete_all
+    """
 
-    # merge the information
-    for key in incomplete_dict.keys():
-        validation = pd.merge(validation, incomplete_dict[key], on=use_col, how='left').fillna(1)
+    compiled, fallback_graph = compile_shapes(shapes_graph)
+    if fallback_graph is not None:
+        raise ValueError("Only shapes of minCount constraints on IRI paths can be validated on the endpoint")
 
-    validation['complete_all'] = validation.iloc[:,1:].sum(axis=1)/len(prop_list)
-    return validation
+    use_col = "entity.value"
+    entities = pd.Index(data[use_col].drop_duplicates())
+    paths = sorted({str(constraint.path) for shape in compiled for constraint in shape.constraints})
+
+    # the focus nodes of each shape among the instances
+    entity_class = URIRef(resolve_prop(entity_class))
+    focus = []
+    for shape in compiled:
+        is_focus = np.full(len(entities), entity_class in shape.target_classes)
+        positions = entities.get_indexer([str(node) for node in shape.target_nodes])
+        is_focus[positions[positions >= 0]] = True
+        focus.append(is_focus)
+
+    # one query per window of entities and path, so the path is a constant of the pattern,
+    # and only the focus nodes of the shapes checking a path are counted
+    windows = []
+    for column, path in enumerate(paths):
+        is_counted = np.zeros(len(entities), dtype=bool)
+        for shape, is_focus in zip(compiled, focus):
+            if any(str(constraint.path) == path for constraint in shape.constraints):
+                is_counted |= is_focus
+        counted = entities[is_counted]
+        windows.extend((counted[idx:idx+window_size].to_series(), path) for idx in range(0, len(counted), window_size))
+
+    from tqdm import tqdm
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = list(tqdm(executor.map(lambda window: count_values(*window, sparql_endpoint), windows),
+                           total=len(windows), desc="Counting values of properties"))
+
+    # a matrix of the number of values of each path per entity
+    matrix = np.zeros((len(entities), len(paths)), dtype=np.int64)
+    if counts:
+        counts = pd.concat(counts, ignore_index=True).dropna(subset=['entity'])
+        rows = entities.get_indexer(counts['entity'])
+        columns = pd.Index(paths).get_indexer(counts['path'])
+        is_known = (rows >= 0) & (columns >= 0)
+        matrix[rows[is_known], columns[is_known]] = counts['count'].astype(np.int64).to_numpy()[is_known]
+
+    incomplete = []
+    for shape, is_focus in zip(compiled, focus):
+        for path, min_count, _ in shape.constraints:
+            column = paths.index(str(path))
+            focus_nodes = entities[is_focus & (matrix[:, column] < min_count)]
+            incomplete.extend((focus_node, str(path)) for focus_node in focus_nodes)
+
+    return build_report_table(data, use_col, incomplete, prop_list)
+
+
+def construct_graph(graph_file, lazy=False):
+    # load the snapshot of the graph if it is not older than the graph itself
+    snapshot = graph_file if os.path.isdir(graph_file) else snapshot_path(graph_file)
+    meta_file = os.path.join(snapshot, "meta.json")
+    if os.path.exists(meta_file) and (snapshot == graph_file or os.path.getmtime(meta_file) >= os.path.getmtime(graph_file)):
+        graph = GraphSnapshot(snapshot)
+        return graph if lazy else graph.to_graph()
 
-def construct_graph(graph_file):
     # load graph
     graph = Graph()
     graph.parse(graph_file)
@@ -83,35 +914,69 @@ def construct_graph(graph_file):
     return graph
 
 
-if __name__ == "__main__": 
-    parser = argparse.ArgumentParser(allow_abbrev=False,
+def build_parser(prog=None):
+    parser = argparse.ArgumentParser(prog=prog, allow_abbrev=False,
                                         description="Arguments for completeness validation process")
     required = parser.add_argument_group('required arguments')
 
     required.add_argument("--data_file", type=str, required=True,
                             help="A file path of data file in csv format")
-    required.add_argument("--data_prop_file", type=str, required=True,
-                            help="A file path of data along with the properties in csv format")
-    required.add_argument("--data_graph", type=str, required=True,
-                            help="A file path of data graph in ttl format")
+    required.add_argument("--data_prop_file", type=str, default=None,
+                            help="A file path of data along with the properties in csv format, only needed with --stream data_prop or --incremental")
+    required.add_argument("--data_graph", type=str, default=None,
+                            help="A file path of data graph in ttl format, its snapshot in a .snap directory is used if there is one, not needed with --stream data_prop, --incremental or --pushdown")
     required.add_argument("--shapes_graph", type=str, required=True,
-                            help="A file path of shapes graph in ttl format")
+                            help="A file path of shapes graph in ttl format, its snapshot in a .snap directory is used if there is one")
+    parser.add_argument("--engine", type=str, default="auto", choices=["auto", "pyshacl"],
+                            help="A validation engine, auto checks minCount shapes natively and the rest with PySHACL (default is auto)")
+    parser.add_argument("--workers", type=int, default=1,
+                            help="A number of processes validating the data graph split by entity with the auto engine, or of queries sent at the same time with --pushdown (default is 1)")
+    parser.add_argument("--stream", type=str, default=None, choices=["data_graph", "data_prop"],
+                            help="Validate in chunks of entities read from the N-Triples data graph or from the data properties, to bound the memory")
+    parser.add_argument("--chunk_size", type=int, default=10000,
+                            help="A number of entities per chunk with --stream (default is 10000)")
+    parser.add_argument("--entity_class", type=str, default=None,
+                            help="An URI of the class of the instances, as an IRI or a prefixed name, with --stream data_prop, --incremental or --pushdown (default is the target class of the shapes)")
+    parser.add_argument("--incremental", action="store_true",
+                            help="Validate only the entities added or changed since the previous run and merge them into the previous report")
+    parser.add_argument("--state_file", type=str, default="validation_state.json",
+                            help="A file path of the fingerprints of the previous run with --incremental (default is validation_state.json)")
+
+    parser.add_argument("--pushdown", action="store_true",
+                            help="Count the values of the properties on the endpoint instead of validating a data graph, only for minCount shapes")
+    parser.add_argument("--sparql_endpoint", type=str, default=None,
+                            help="A string of SPARQL endpoint URL with --pushdown")
+    parser.add_argument("--window_size", type=int, default=200,
+                            help="A number of entities counted in one query with --pushdown (default is 200)")
 
-    args = parser.parse_args()
-    data = pd.read_csv(args.data_file)
-    data_prop = pd.read_csv(args.data_prop_file)
+    add_metrics_arguments(parser)
+
+    return parser
+
+
+def main(argv=None, prog=None):
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+    start_metrics(args)
+    if args.pushdown and args.sparql_endpoint is None:
+        parser.error("--sparql_endpoint is required with --pushdown")
+    # each mode reads either the data properties or the data graph
+    reads_data_prop = not args.pushdown and (args.incremental or args.stream == "data_prop")
+    if reads_data_prop and args.data_prop_file is None:
+        parser.error("--data_prop_file is required with --stream data_prop or --incremental")
+    if not args.pushdown and not reads_data_prop and args.data_graph is None:
+        parser.error("--data_graph is required unless --stream data_prop, --incremental or --pushdown")
+
+    with stage('load_data') as record:
+        data = pd.read_csv(args.data_file)
+        record['items'] = data.shape[0]
     data_graph_file = args.data_graph
     shapes_graph_file = args.shapes_graph
 
-    # handle NaN values in language attribute
-    if 'o.xml:lang' in data_prop.columns.tolist():
-        data_prop[['o.xml:lang']] = data_prop[['o.xml:lang']].fillna('not specified')
-
-    # create data graph and shapes graph
-    print("Constructing data graph ...")
-    data_graph = construct_graph(data_graph_file)
     print("Constructing shapes graph ...")
-    shapes_graph = construct_graph(shapes_graph_file)
+    with stage('load_shapes_graph') as record:
+        shapes_graph = construct_graph(shapes_graph_file)
+        record['items'] = len(shapes_graph)
 
     # get all the required properties
     prop = set()
@@ -120,13 +985,70 @@ if __name__ == "__main__":
             prop.add(o.n3())
     prop_list = list(prop)
 
-    # validate the data graph
-    print("Validating the completeness ...")
-    conforms, report_graph, report_text = validate_graph(shapes_graph, data_graph)
+    # the data graph is built from the properties and the class of the instances
+    entity_class = args.entity_class
+    if (args.stream == "data_prop" or args.incremental or args.pushdown) and entity_class is None:
+        target_classes = set(shapes_graph.objects(None, SH.targetClass))
+        if len(target_classes) != 1:
+            parser.error("--entity_class is required unless the shapes have a single target class")
+        entity_class = str(target_classes.pop())
+    elif entity_class is not None:
+        entity_class = expand_class_uri(entity_class)
 
-    # generate completeness validation report
-    print("Generating the completeness validation report ...")
-    validation = create_report_validation(data, "entity.value", report_graph, prop_list)
-    validation.to_csv("validation_report.csv", index=False)
+    if args.pushdown:
+        print("Validating the completeness on the endpoint ...")
+        with stage('validate_pushdown') as record:
+            try:
+                validation = validate_pushdown(data, shapes_graph, prop_list, args.sparql_endpoint, entity_class,
+                                               window_size=args.window_size, workers=args.workers)
+            except ValueError as error:
+                parser.error(str(error))
+            validation.to_csv("validation_report.csv", index=False)
+            record['items'] = validation.shape[0]
+    elif args.incremental:
+        print("Validating the completeness of the changed entities ...")
+        with stage('validate_incremental') as record:
+            num_of_validated, num_of_removed = validate_incremental(
+                data, args.data_prop_file, shapes_graph, prop_list, entity_class, args.state_file, engine=args.engine)
+            record['items'] = num_of_validated
+        print(f"Validated {num_of_validated} added or changed entities, removed {num_of_removed} entities")
+    elif args.stream is not None:
+        # validate the data and write the report chunk by chunk
+        print("Validating the completeness in chunks ...")
+        with stage('validate_streaming') as record:
+            conforms, num_of_rows = validate_streaming(
+                data, shapes_graph, prop_list,
+                data_graph_file=data_graph_file if args.stream == "data_graph" else None,
+                data_prop_file=args.data_prop_file,
+                entity_class=entity_class,
+                chunk_size=args.chunk_size,
+                engine=args.engine)
+            record['items'] = num_of_rows
+    else:
+        # create data graph
+        print("Constructing data graph ...")
+        with stage('load_data_graph') as record:
+            data_graph = construct_graph(data_graph_file, lazy=args.engine == "auto")
+            record['items'] = len(data_graph)
+
+        # validate the data graph
+        print("Validating the completeness ...")
+        with stage('validate_graph') as record:
+            if args.workers > 1 and args.engine == "auto":
+                conforms, report_graph, report_text = validate_sharded(shapes_graph, data_graph, args.workers)
+            else:
+                conforms, report_graph, report_text = validate_graph(shapes_graph, data_graph, engine=args.engine)
+            record['items'] = len(data_graph)
+
+        # generate completeness validation report
+        print("Generating the completeness validation report ...")
+        with stage('create_report_validation') as record:
+            validation = create_report_validation(data, "entity.value", report_graph, prop_list)
+            validation.to_csv("validation_report.csv", index=False)
+            record['items'] = validation.shape[0]
 
     print("Successfully validated the data completeness")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+import json
+import time
+import argparse
+import threading
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from rdflib import RDF, RDFS, BNode, Graph, URIRef
+from rdflib.util import from_n3
+
+from lazy_import import lazy_import
+from graph_snapshot import GraphSnapshot
+from validate_completeness import SH, build_report_table, compile_shapes, construct_graph, extract_incomplete
+
+# the heavy dependencies are imported when they are first used
+pd = lazy_import('pandas')
+
+
+class ReadWriteLock:
+    """
+    A lock held by many readers at once, or by a single writer.
+
+    A waiting writer keeps new readers out, so a change of the data graph is
+    not starved by a stream of validations.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.waiting_writers = 0
+        self.is_writing = False
+
+    @contextmanager
+    def read(self):
+        with self.condition:
+            while self.is_writing or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if not self.readers:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.is_writing or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.is_writing = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.is_writing = False
+                self.condition.notify_all()
+
+
+class ValidationService:
+    """
+    Validate entities against shapes compiled once, over a data graph kept in memory.
+
+    The minCount shapes are checked by counting the values of the entities
+    only, and the other shapes by PySHACL on the triples around the entities.
+    The data graph can be changed by adding and removing triples. RDFLib graphs
+    are not safe for concurrent changes, so the validations read the graph
+    together under a readers-writer lock and a change waits for them to finish.
+
+    Parameters
+    ----------
+    shapes_graph : Graph
+        The shapes graph containing all the constraints
+    data_graph : Graph
+        The data graph containing all the instances to be validated along with their property values
+    prop_list : list, optional
+        A list of the checked properties, as <IRI> or prefixed names, the paths of the shapes if None (default is None)
+    is_advanced : boolean, optional
+        A boolean value to enable the SHACL advanced features in PySHACL (default is False)
+    """
+
+    def __init__(self, shapes_graph, data_graph, prop_list=None, is_advanced=False):
+        # a snapshot cannot be changed, so it is loaded into a graph
+        if isinstance(data_graph, GraphSnapshot):
+            data_graph = data_graph.to_graph()
+
+        self.data_graph = data_graph
+        self.compiled, self.fallback_graph = compile_shapes(shapes_graph)
+        self.prop_list = prop_list or sorted({o.n3() for o in shapes_graph.objects(None, SH.path) if isinstance(o, URIRef)})
+        self.is_advanced = is_advanced
+        self.lock = ReadWriteLock()
+        self.subclasses = self.find_subclasses()
+
+    def find_subclasses(self):
+        # the target classes and their subclasses, found again by a change of the subclasses
+        return {target_class: set(self.data_graph.transitive_subjects(RDFS.subClassOf, target_class))
+                for shape in self.compiled for target_class in shape.target_classes}
+
+    def classes_of(self, target_class):
+        return self.subclasses[target_class]
+
+    def is_focus(self, entity, shape):
+        if entity in shape.target_nodes:
+            return True
+        return any((entity, RDF.type, cls) in self.data_graph
+                   for target_class in shape.target_classes for cls in self.classes_of(target_class))
+
+    def check_entities(self, entities):
+        """
+        Find the incomplete properties of the entities.
+
+        Parameters
+        ----------
+        entities : list
+            A list of URIRef of the entities
+
+        Returns
+        -------
+        list
+            A list of (focus node, path IRI) as strings
+        """
+
+        incomplete = []
+        for entity in entities:
+            for shape in self.compiled:
+                if not self.is_focus(entity, shape):
+                    continue
+                for path, min_count, _ in shape.constraints:
+                    if sum(1 for _ in self.data_graph.objects(entity, path)) < min_count:
+                        incomplete.append((str(entity), str(path)))
+
+        if self.fallback_graph is not None:
+            from pyshacl import validate
+
+            # the triples of the entities and of the nodes they point to, along with the class hierarchy
+            subgraph = Graph()
+            nodes = set(entities)
+            for entity in entities:
+                for _, p, o in self.data_graph.triples((entity, None, None)):
+                    subgraph.add((entity, p, o))
+                    if isinstance(o, (URIRef, BNode)):
+                        nodes.add(o)
+            for node in nodes - set(entities):
+                for triple in self.data_graph.triples((node, None, None)):
+                    subgraph.add(triple)
+            for triple in self.data_graph.triples((None, RDFS.subClassOf, None)):
+                subgraph.add(triple)
+
+            _, fallback_report, _ = validate(
+                data_graph = subgraph,
+                shacl_graph = self.fallback_graph,
+                advanced = self.is_advanced,
+                )
+            incomplete.extend(extract_incomplete(fallback_report))
+
+        return incomplete
+
+    def validate(self, entities):
+        """
+        Validate the completeness of the entities.
+
+        Parameters
+        ----------
+        entities : list
+            A list of the entity IRIs
+
+        Returns
+        -------
+        DataFrame
+            A table of the entities with 0 for each incomplete property, 1 otherwise,
+            and the ratio of complete properties in complete_all
+        """
+
+        entities = list(dict.fromkeys(entities))
+        with self.lock.read():
+            incomplete = self.check_entities([URIRef(entity) for entity in entities])
+        return build_report_table(pd.DataFrame({'entity.value': entities}), "entity.value", incomplete, self.prop_list)
+
+    def update(self, add=(), remove=()):
+        """
+        Change the data graph.
+
+        Parameters
+        ----------
+        add : iterable, optional
+            The triples to be added, as N-Triples terms (default is none)
+        remove : iterable, optional
+            The triples to be removed, as N-Triples terms (default is none)
+
+        Returns
+        -------
+        (int, int, list)
+            the numbers of added and removed triples, and the changed subjects as strings
+        """
+
+        add = [tuple(from_n3(term) for term in triple) for triple in add]
+        remove = [tuple(from_n3(term) for term in triple) for triple in remove]
+        if any(len(triple) != 3 or None in triple for triple in add + remove):
+            raise ValueError("A triple must have a subject, a predicate and an object as N-Triples terms")
+
+        with self.lock.write():
+            num_of_triples = len(self.data_graph)
+            for triple in remove:
+                self.data_graph.remove(triple)
+            num_of_removed = num_of_triples - len(self.data_graph)
+            self.data_graph.addN(triple + (self.data_graph,) for triple in add)
+            num_of_added = len(self.data_graph) - num_of_triples + num_of_removed
+
+            if any(p == RDFS.subClassOf for _, p, _ in add + remove):
+                self.subclasses = self.find_subclasses()
+
+        subjects = list(dict.fromkeys(str(s) for s, _, _ in add + remove if isinstance(s, URIRef)))
+        return num_of_added, num_of_removed, subjects
+
+
+class ValidationHandler(BaseHTTPRequestHandler):
+    """
+    Answer the requests to the validation service in JSON.
+
+    GET /health tells the size of the data graph. GET /validate?entity=...
+    and POST /validate {"entities": [...]} validate entities. POST /delta
+    {"add": [...], "remove": [...], "validate": true} changes the data graph,
+    the triples are lists of three N-Triples terms, and validates the
+    changed subjects if asked.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def validate_entities(self, entities, start):
+        validation = self.server.service.validate(entities)
+        return {
+            'conforms': bool((validation['complete_all'] == 1).all()),
+            'rows': validation.to_dict(orient='records'),
+            'elapsed_ms': (time.perf_counter() - start) * 1000,
+        }
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            with self.server.service.lock.read():
+                num_of_triples = len(self.server.service.data_graph)
+            return self.respond(200, {'status': 'ok', 'triples': num_of_triples,
+                                      'properties': self.server.service.prop_list})
+        if url.path == '/validate':
+            entities = parse_qs(url.query).get('entity', [])
+            if not entities:
+                return self.respond(400, {'error': "Give the entities as entity parameters"})
+            return self.respond(200, self.validate_entities(entities, start))
+        self.respond(404, {'error': f"No such path {url.path}"})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        try:
+            content = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            return self.respond(400, {'error': "The body is not valid JSON"})
+
+        try:
+            if url.path == '/validate':
+                entities = content.get('entities')
+                if not isinstance(entities, list) or not entities:
+                    return self.respond(400, {'error': "Give the entities as a list in entities"})
+                return self.respond(200, self.validate_entities(entities, start))
+
+            if url.path == '/delta':
+                num_of_added, num_of_removed, subjects = self.server.service.update(content.get('add', []),
+                                                                                    content.get('remove', []))
+                result = {'added': num_of_added, 'removed': num_of_removed}
+                if content.get('validate') and subjects:
+                    result.update(self.validate_entities(subjects, start))
+                result['elapsed_ms'] = (time.perf_counter() - start) * 1000
+                return self.respond(200, result)
+        except (ValueError, TypeError) as error:
+            return self.respond(400, {'error': str(error)})
+
+        self.respond(404, {'error': f"No such path {url.path}"})
+
+
+def serve(service, host="127.0.0.1", port=8000):
+    """
+    Serve the validation service over HTTP, each request in its own thread.
+
+    Parameters
+    ----------
+    service : ValidationService
+        The service answering the requests
+    host : str, optional
+        A host name of the service (default is 127.0.0.1)
+    port : int, optional
+        A port of the service, any free port if 0 (default is 8000)
+
+    Returns
+    -------
+    ThreadingHTTPServer
+        The server, run with serve_forever()
+    """
+
+    server = ThreadingHTTPServer((host, port), ValidationHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def build_parser(prog=None):
+    parser = argparse.ArgumentParser(prog=prog, allow_abbrev=False,
+                                        description="Arguments for the completeness validation service")
+    required = parser.add_argument_group('required arguments')
+
+    required.add_argument("--data_graph", type=str, required=True,
+                            help="A file path of data graph in ttl format, its snapshot in a .snap directory is used if there is one")
+    required.add_argument("--shapes_graph", type=str, required=True,
+                            help="A file path of shapes graph in ttl format, its snapshot in a .snap directory is used if there is one")
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+                            help="A host name the service listens on (default is 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000,
+                            help="A port the service listens on (default is 8000)")
+
+    return parser
+
+
+def main(argv=None, prog=None):
+    parser = build_parser(prog)
+    args = parser.parse_args(argv)
+
+    print("Constructing shapes graph ...")
+    shapes_graph = construct_graph(args.shapes_graph)
+
+    print("Constructing data graph ...")
+    data_graph = construct_graph(args.data_graph)
+
+    service = ValidationService(shapes_graph, data_graph)
+    server = serve(service, args.host, args.port)
+    print(f"Serving the validation on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()